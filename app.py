@@ -9,18 +9,28 @@ from app.programs import program_blueprint
 from app.services import service_blueprint
 from app.locations import location_blueprint
 from app.physical_address import address_blueprint
+from app.spec import load_spec
+from app import compression, encoding, validation
 
 # initialize db
 db = SQLAlchemy()
 
 config_name = os.getenv('APP_SETTINGS')
 app = connexion.App(__name__)
-app.add_api('.openapi/swagger.yaml')
-
+# parsed once per version of the yaml, then read from its on-disk cache
+spec = load_spec()
 flask_app = app.app
+# the blueprints check the bodies against the definitions of the spec
+validation.init_app(flask_app, spec)
+app.add_api(spec)
+
 flask_app.instance_relative_config = True
 flask_app.config.from_object(app_config[config_name])
 flask_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# the json backend of the responses, picked by the settings
+encoding.init_app(flask_app)
+# and their compression, for the clients accepting it
+compression.init_app(flask_app)
 
 db.init_app(flask_app)
 
@@ -1,16 +1,64 @@
 # app/__init__.py
 import json
+import sqlite3
+
 from flask_api import FlaskAPI
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.utils import import_string
 
 from instance.config import app_config
 
+
+class SQLAlchemy(BaseSQLAlchemy):
+    """
+    Flask-SQLAlchemy, also honoring the SQLALCHEMY_POOL_PRE_PING setting and
+    leaving the connections to sqlite files unpooled whatever the settings.
+    """
+
+    def apply_pool_defaults(self, app, options):
+        super().apply_pool_defaults(app, options)
+        if app.config.get('SQLALCHEMY_POOL_PRE_PING'):
+            options['pool_pre_ping'] = True
+
+    def apply_driver_hacks(self, app, info, options):
+        if info.drivername.startswith('sqlite'):
+            for key in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(key, None)
+        super().apply_driver_hacks(app, info, options)
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    """Have sqlite enforce the foreign keys and their ON DELETE CASCADE."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+
 # initialize db
 db = SQLAlchemy()
 
+# the blueprints of the API, imported by create_app
+BLUEPRINTS = (
+    'app.organization:org_blueprint',
+    'app.programs:program_blueprint',
+    'app.services:service_blueprint',
+    'app.locations:location_blueprint',
+    'app.physical_address:address_blueprint',
+    'app.export:export_blueprint',
+    'app.changes:changes_blueprint',
+    'app.geo:geo_blueprint',
+)
 
-def create_app(config_name):
 
+def create_app(config_name, blueprints=BLUEPRINTS):
+    """
+    Return the app set up with the given settings. Commands that serve no
+    request pass fewer `blueprints`, whose views they do not need to import.
+    """
     app = FlaskAPI(__name__, instance_relative_config=True)
 
     app.config.from_object(app_config[config_name])
@@ -18,17 +66,21 @@ def create_app(config_name):
 
     db.init_app(app)
 
-    # import the blueprints and register it on the app
-
-    from .organization import org_blueprint
-    from .programs import program_blueprint
-    from .services import service_blueprint
-    from .locations import location_blueprint
-    from .physical_address import address_blueprint
+    # the tombstones, version counters and cache invalidation are kept by
+    # session listeners, whatever the blueprints
+    from . import (cache, changes, compression, encoding, instrumentation,
+                   metrics, validation)
+    encoding.init_app(app)
+    cache.init_app(app)
+    instrumentation.init_app(app)
+    # the last hook registered runs first: responses are compressed before
+    # the request is timed
+    compression.init_app(app)
+    metrics.init_app(app)
+    # the bodies are checked against the swagger definitions
+    validation.init_app(app)
 
-    app.register_blueprint(org_blueprint)
-    app.register_blueprint(program_blueprint)
-    app.register_blueprint(service_blueprint)
-    app.register_blueprint(location_blueprint)
-    app.register_blueprint(address_blueprint)
+    # import the blueprints and register them on the app
+    for name in blueprints:
+        app.register_blueprint(import_string(name))
     return app
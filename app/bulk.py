@@ -0,0 +1,232 @@
+from datetime import datetime
+
+from flask import current_app, make_response, request
+from sqlalchemy import and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app import cache, db
+from app.encoding import jsonify
+from app.models import READ_ONLY, Organization
+from app.payload import PayloadError, read_payload
+from app.serializers import columns
+from app.validation import validator
+from app.versions import bump_all
+
+# the column identifying an existing row when upserting; organizations are
+# matched on their unique name, everything else on its primary key
+UPSERT_KEYS = {
+    Organization: 'name',
+}
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _required(model):
+    """Return the names of the columns an item has to provide."""
+    return [column.key for column in model.__table__.columns
+            if not any((column.nullable, column.primary_key,
+                        column.default is not None,
+                        column.server_default is not None))]
+
+
+def _error(index, message, *args):
+    return {"index": index, "message": message.format(*args)}
+
+
+def _parent_filter(model, parents):
+    """Return the conditions matching the rows under the given parents."""
+    return [getattr(model, name) == value for name, value in parents.items()]
+
+
+def validate(model, items, upsert=False, parents=None):
+    """
+    Split the items of a bulk request into the valid mappings and the
+    per-item errors, as a list of {"index": ..., "message": ...} dicts.
+    Upserted ids of rows under other `parents` than the url's are errors.
+    """
+    # versions and timestamps are maintained by the models, dropped below
+    known = set(columns(model)).difference(READ_ONLY)
+    required = _required(model)
+    # the types and lengths, as for the single items
+    check = validator(model)
+    key = UPSERT_KEYS.get(model, 'id')
+    unique = key if key != 'id' else None
+    seen = set()
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append(_error(index, "Expected an object"))
+            continue
+        for name in READ_ONLY:
+            item.pop(name, None)
+        unknown = set(item).difference(known)
+        if unknown:
+            errors.append(_error(index, "Unknown fields: {}",
+                                 ', '.join(sorted(unknown))))
+            continue
+        missing = [name for name in required if item.get(name) is None]
+        if missing:
+            errors.append(_error(index, "Missing fields: {}",
+                                 ', '.join(missing)))
+            continue
+        invalid = check(item, partial=True) if check is not None else []
+        if invalid:
+            errors.append(_error(index, '; '.join(invalid)))
+            continue
+        if unique is not None:
+            if item[unique] in seen:
+                errors.append(_error(index, "Duplicate {}: {}",
+                                     unique, item[unique]))
+                continue
+            seen.add(item[unique])
+        valid.append((index, item))
+
+    if unique is not None and not upsert and valid:
+        # plain inserts must not collide with the rows already stored
+        column = getattr(model, unique)
+        existing = set()
+        for chunk in _chunks([item[unique] for _, item in valid], 1000):
+            query = db.session.query(column).filter(column.in_(chunk))
+            existing.update(value for value, in query)
+        for index, item in valid:
+            if item[unique] in existing:
+                errors.append(_error(index, "{} already exists: {}",
+                                     unique, item[unique]))
+        valid = [(index, item) for index, item in valid
+                 if item[unique] not in existing]
+
+    if upsert and parents and key == 'id' and valid:
+        # a row is never moved from another parent to the url's one
+        expected = tuple(parents.values())
+        owned = {}
+        ids = [item['id'] for _, item in valid if item.get('id') is not None]
+        for chunk in _chunks(ids, 1000):
+            query = db.session.query(
+                model.id, *[getattr(model, name) for name in parents]
+            ).filter(model.id.in_(chunk))
+            owned.update((row[0], tuple(row[1:])) for row in query)
+        moved = set()
+        for index, item in valid:
+            row = owned.get(item.get('id'))
+            if row is not None and row != expected:
+                name = next(name for name, value, found in zip(
+                    parents, expected, row) if value != found)
+                errors.append(_error(index, "id {} belongs to another {}",
+                                     item['id'], name[:-len('_id')]))
+                moved.add(index)
+        valid = [(index, item) for index, item in valid
+                 if index not in moved]
+
+    errors.sort(key=lambda error: error["index"])
+    return [item for _, item in valid], errors
+
+
+def _upsert_postgres(model, chunk, key, parents):
+    """
+    Upsert a chunk with INSERT ... ON CONFLICT DO UPDATE, leaving the rows
+    of other parents alone.
+    """
+    # rows of a multi-values insert must share their keys
+    groups = {}
+    for item in chunk:
+        groups.setdefault(tuple(sorted(item)), []).append(item)
+    for keys, rows in groups.items():
+        statement = pg_insert(model.__table__).values(rows)
+        updates = {name: statement.excluded[name] for name in keys
+                   if name != key}
+        updates['version'] = model.__table__.c.version + 1
+        # ON CONFLICT DO UPDATE does not apply the column's onupdate
+        updates['updated_at'] = datetime.utcnow()
+        statement = statement.on_conflict_do_update(
+            index_elements=[key], set_=updates,
+            where=and_(*_parent_filter(model, parents)) if parents else None)
+        db.session.execute(statement)
+
+
+def _upsert_generic(model, chunk, key, parents):
+    """
+    Upsert a chunk by splitting it into bulk updates and bulk inserts, only
+    matching the rows under the parents.
+    """
+    column = getattr(model, key)
+    values = [item[key] for item in chunk if item.get(key) is not None]
+    existing = {}
+    if values:
+        query = db.session.query(column, model.id, model.version).filter(
+            column.in_(values), *_parent_filter(model, parents))
+        existing = {value: (pk, version) for value, pk, version in query}
+    inserts, updates = [], []
+    for item in chunk:
+        row = existing.get(item.get(key))
+        if row is None:
+            inserts.append(item)
+        else:
+            # the current version is matched and bumped by the update
+            updates.append(dict(item, id=row[0], version=row[1]))
+    if updates:
+        db.session.bulk_update_mappings(model, updates)
+    if inserts:
+        db.session.bulk_insert_mappings(model, inserts)
+
+
+def write(model, items, upsert=False, parents=None):
+    """
+    Insert (or upsert) validated mappings in chunks of BULK_CHUNK_SIZE,
+    all in a single transaction. Upserts only update the rows under the
+    `parents` columns.
+    """
+    parents = parents or {}
+    size = current_app.config.get('BULK_CHUNK_SIZE', 1000)
+    key = UPSERT_KEYS.get(model, 'id')
+    postgres = db.engine.dialect.name == 'postgresql'
+    try:
+        for chunk in _chunks(items, size):
+            if not upsert:
+                db.session.bulk_insert_mappings(model, chunk)
+            elif postgres and (key != 'id' or all('id' in i for i in chunk)):
+                _upsert_postgres(model, chunk, key, parents)
+            else:
+                _upsert_generic(model, chunk, key, parents)
+        bump_all()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    cache.clear()
+
+
+def bulk_create(model, **parents):
+    """
+    Handle a bulk POST: validate the array of items in the body, write
+    the valid ones and report the errors per item (by position).
+
+    `parents` are column values forced on every item, like the ids taken
+    from the url of a nested route. `?upsert=true` updates the existing rows
+    matched on their UPSERT_KEYS column (under the same parents) instead of
+    failing on them.
+    """
+    try:
+        items = read_payload()
+    except PayloadError as e:
+        return make_response(jsonify({"message": str(e)})), e.status
+    if not isinstance(items, list):
+        response = {"message": "Expected an array of items"}
+        return make_response(jsonify(response)), 400
+    upsert = request.args.get('upsert', '').lower() in ('1', 'true', 'yes')
+
+    items = [dict(item, **parents) if isinstance(item, dict) else item
+             for item in items]
+    valid, errors = validate(model, items, upsert, parents)
+    try:
+        write(model, valid, upsert, parents)
+    except Exception as e:
+        response = {"message": str(e), "count": 0, "errors": errors}
+        return make_response(jsonify(response)), 400
+
+    response = {"count": len(valid), "errors": errors}
+    if errors and not valid:
+        return make_response(jsonify(response)), 400
+    return make_response(jsonify(response)), 207 if errors else 201
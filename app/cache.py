@@ -0,0 +1,384 @@
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from itertools import chain
+from urllib.parse import urlencode
+
+from flask import (Blueprint, Response, current_app, has_app_context,
+                   make_response, request)
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.compression import compress_response, negotiate
+from app.encoding import jsonify
+from app.expand import relationship_of, requested_expansions
+from app.streaming import stream_requested
+
+# the url arguments naming a resource, from the outermost to the innermost
+# one, mapped to the table of the resource
+ARGS = OrderedDict([
+    ('organization_id', 'organization'),
+    ('program_id', 'program'),
+    ('location_id', 'location'),
+    ('service_id', 'service'),
+    ('address_id', 'physical_address'),
+])
+
+cache_blueprint = Blueprint('cache', __name__)
+
+
+class MemoryCache(object):
+    """
+    An in-process LRU cache holding at most `max_entries` entries for `ttl`
+    seconds each. Every entry carries tags, used to invalidate it.
+    """
+    name = 'memory'
+
+    def __init__(self, max_entries=1024, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = self.misses = self.invalidations = 0
+        # key -> (expiry time, value, tags), least recently used first
+        self._entries = OrderedDict()
+        # tag -> keys of the entries carrying it
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        expires, value, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, tags):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        """Drop the entries carrying any of the tags, return their count."""
+        count = 0
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        count += 1
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class RedisCache(object):
+    """
+    A cache stored in redis, or in anything speaking its protocol, shared by
+    every process of the app. Entries are stored as json, their bytes in
+    base64, expire after `ttl` seconds and each tag is a set of the keys of
+    the entries carrying it.
+    """
+    name = 'redis'
+
+    def __init__(self, client, ttl=60, prefix='registry:cache:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = self.misses = self.invalidations = 0
+
+    def __len__(self):
+        pattern = self.prefix + 'entry:*'
+        return sum(1 for _ in self.client.scan_iter(match=pattern))
+
+    def get(self, key):
+        value = self.client.get(self.prefix + 'entry:' + key)
+        return None if value is None else json.loads(
+            value, object_hook=_from_json)
+
+    def set(self, key, value, tags):
+        key = self.prefix + 'entry:' + key
+        pipeline = self.client.pipeline()
+        pipeline.setex(key, self.ttl, json.dumps(value, default=_to_json))
+        for tag in tags:
+            pipeline.sadd(self.prefix + 'tag:' + tag, key)
+            pipeline.expire(self.prefix + 'tag:' + tag, self.ttl)
+        pipeline.execute()
+
+    def invalidate(self, tags):
+        """Drop the entries carrying any of the tags, return their count."""
+        count = 0
+        for tag in tags:
+            tag = self.prefix + 'tag:' + tag
+            keys = self.client.smembers(tag)
+            if keys:
+                count += self.client.delete(*keys)
+            self.client.delete(tag)
+        return count
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def _to_json(o):
+    if isinstance(o, bytes):
+        return {'$bytes': base64.b64encode(o).decode('ascii')}
+    raise TypeError("Object of type {} is not JSON serializable".format(
+        type(o).__name__))
+
+
+def _from_json(o):
+    return base64.b64decode(o['$bytes']) if '$bytes' in o else o
+
+
+def init_app(app):
+    """Set up the response cache picked by the CACHE_BACKEND setting."""
+    backend = app.config.get('CACHE_BACKEND', 'memory')
+    ttl = app.config.get('CACHE_TTL', 60)
+    if backend == 'memory':
+        cache = MemoryCache(app.config.get('CACHE_MAX_ENTRIES', 1024), ttl)
+    elif backend == 'redis':
+        import redis
+        cache = RedisCache(
+            redis.StrictRedis.from_url(app.config['CACHE_REDIS_URL']), ttl)
+    elif backend == 'none':
+        cache = None
+    else:
+        raise ValueError("Unknown cache backend: {}".format(backend))
+    app.extensions['cache'] = cache
+    app.register_blueprint(cache_blueprint)
+
+
+def get_cache():
+    """Return the cache of the current app, None when disabled."""
+    return current_app.extensions.get('cache')
+
+
+def clear():
+    """
+    Empty the cache, for writes that bypass the ORM unit of work such as
+    bulk inserts, whose rows are not known to the invalidation.
+    """
+    cache = get_cache()
+    if cache is not None:
+        cache.clear()
+
+
+def _scoped(table, parent=None):
+    """Return the tag of the rows of a table, within a parent row if any."""
+    if parent is None:
+        return table
+    return '{}@{}:{}'.format(table, *parent)
+
+
+def read_scopes(model, view_args, expansions):
+    """
+    Return what a GET response shows: the rows named by the url, as
+    (table, id) pairs, and the tags of the collections it lists (within
+    their closest parent) or embeds through ?expand=.
+    """
+    table = model.__tablename__
+    rows = [(name, view_args[arg]) for arg, name in ARGS.items()
+            if view_args.get(arg) is not None]
+    collections = []
+    if rows and rows[-1][0] == table:
+        item = rows[-1]
+    else:
+        item = None
+        collections.append(_scoped(table, rows[-1] if rows else None))
+
+    def expanded(model, tree, parent):
+        for name, subtree in tree.items():
+            target = relationship_of(model, name)[1]
+            collections.append(_scoped(target.__tablename__, parent))
+            # deeper levels span several parents
+            expanded(target, subtree, None)
+
+    expanded(model, expansions, item)
+    return rows, collections
+
+
+def cascade_tag(table):
+    """
+    Return the tag of any row of a table, carried by every response showing
+    some, which the deletes cascading to the table drop all at once rather
+    than row by row.
+    """
+    return '{}:*'.format(table)
+
+
+def cascade_tags(rows, collections):
+    """Return the cascade tags of the tables a GET response shows."""
+    tables = {name for name, pk in rows}
+    tables.update(tag.partition('@')[0] for tag in collections)
+    return sorted(cascade_tag(table) for table in tables)
+
+
+def read_tags(model, view_args, expansions):
+    """Return the tags of a GET response (see read_scopes)."""
+    rows, collections = read_scopes(model, view_args, expansions)
+    return ['{}:{}'.format(*row) for row in rows] + collections + \
+        cascade_tags(rows, collections)
+
+
+def collection_tags(instance):
+    """
+    Return the tags of the collections a change to an instance affects: any
+    collection of its table and the ones of its parents, before and after
+    the change.
+    """
+    state = inspect(instance)
+    table = instance.__table__
+    tags = {table.name}
+    for column in table.columns:
+        for fk in column.foreign_keys:
+            history = state.attrs[column.key].history
+            for value in chain([getattr(instance, column.key)],
+                               history.deleted or ()):
+                if value is not None:
+                    tags.add(_scoped(table.name, (fk.column.table.name,
+                                                  value)))
+    return tags
+
+
+def write_tags(instance):
+    """Return the tags of the responses a change to an instance affects."""
+    tags = collection_tags(instance)
+    tags.add('{}:{}'.format(instance.__table__.name, instance.id))
+    return tags
+
+
+def invalidate_on_commit(session, tags):
+    """Drop the responses carrying the tags once the session commits."""
+    session.info.setdefault('cache_tags', set()).update(tags)
+
+
+def _collect(session, flush_context):
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if hasattr(instance, '__table__'):
+            invalidate_on_commit(session, write_tags(instance))
+
+
+def _invalidate(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags and has_app_context():
+        cache = get_cache()
+        if cache is not None:
+            cache.invalidations += cache.invalidate(tags)
+
+
+def _discard(session):
+    session.info.pop('cache_tags', None)
+
+
+# the rows written by a flush are only invalidated once committed
+event.listen(Session, 'after_flush', _collect)
+event.listen(Session, 'after_commit', _invalidate)
+event.listen(Session, 'after_rollback', _discard)
+
+
+def _key(codec=None):
+    """
+    Return the cache key of the current request, whose response is
+    compressed by the codec, if any.
+    """
+    args = urlencode(sorted(request.args.items(multi=True)))
+    return '{}?{} {} {}'.format(request.path, args,
+                                request.headers.get('Accept', ''),
+                                codec.name if codec is not None else '')
+
+
+def cached(model):
+    """
+    Return a decorator serving the GET requests of a view of the model from
+    the cache, to be listed in the view's `decorators`.
+
+    Only successful, non streamed responses are stored, compressed as the
+    client accepts them (see app.compression) so that hits are not
+    compressed again. They are tagged with the resources they show (see
+    read_tags) and dropped when a commit writes to one of them (see
+    write_tags).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None or request.method != 'GET' or \
+                    stream_requested():
+                return view(*args, **kwargs)
+            try:
+                expansions = requested_expansions(model)
+            except ValueError:
+                # the view answers with the error
+                return view(*args, **kwargs)
+
+            codec = negotiate()
+            key = _key(codec)
+            entry = cache.get(key)
+            if entry is not None:
+                cache.hits += 1
+                response = Response(entry['body'], status=entry['status'],
+                                    headers=entry['headers'])
+                response.headers['X-Cache'] = 'HIT'
+                # answers 304 when the client has the stored ETag
+                return response.make_conditional(request)
+
+            cache.misses += 1
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                response = compress_response(response, codec)
+                entry = {
+                    'status': response.status_code,
+                    'headers': list(response.headers.items()),
+                    'body': response.get_data(),
+                }
+                cache.set(key, entry, read_tags(model, kwargs, expansions))
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+@cache_blueprint.route('/api/cache', methods=['GET'])
+def stats():
+    """Return the hit, miss and invalidation counters of the cache."""
+    cache = get_cache()
+    if cache is None:
+        return make_response(jsonify({"backend": None})), 200
+    response = {
+        "backend": cache.name,
+        "entries": len(cache),
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "invalidations": cache.invalidations,
+    }
+    return make_response(jsonify(response)), 200
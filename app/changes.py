@@ -0,0 +1,205 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import Blueprint, abort, current_app, make_response, request
+from flask.views import MethodView
+from sqlalchemy import and_, event, literal, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import cascade_tag, invalidate_on_commit
+from app.encoding import jsonify
+from app.export import TABLES
+from app.models import BaseMixin, Tombstone
+from app.pagination import (decode_cursor, encode_cursor, get_limit,
+                            next_link, paginated_response)
+from app.serializers import parse_isoformat, row_serializer
+from app.versions import bump_on_commit
+
+changes_blueprint = Blueprint('changes', __name__)
+
+
+def cascades(roots):
+    """
+    Return the conditions matching the rows of every table deleted along
+    with the roots, a {table: condition} dict, through ON DELETE CASCADE
+    foreign keys, parents first. They are subqueries, no id is loaded.
+    """
+    doomed = OrderedDict()
+    for table in db.metadata.sorted_tables:
+        conditions = [roots[table]] if table in roots else []
+        for fk in table.foreign_keys:
+            parent = fk.column.table
+            if fk.ondelete == 'CASCADE' and parent in doomed:
+                conditions.append(fk.parent.in_(
+                    select([fk.column]).where(doomed[parent])))
+        if conditions:
+            doomed[table] = or_(*conditions)
+    return doomed
+
+
+def record_deletes(connection, roots):
+    """
+    Write the tombstones of the rows matching the roots conditions and of
+    their cascading descendants with one INSERT ... SELECT per table, return
+    the conditions of the tables that had rows (see cascades).
+    """
+    tombstones = Tombstone.__table__
+    now = literal(datetime.utcnow(), tombstones.c.deleted_at.type)
+    deleted = OrderedDict()
+    for table, condition in cascades(roots).items():
+        result = connection.execute(tombstones.insert().from_select(
+            ['table_name', 'row_id', 'deleted_at'],
+            select([literal(table.name), table.c.id, now]).where(
+                condition)))
+        if result.rowcount:
+            deleted[table] = condition
+    return deleted
+
+
+def cascaded_tags(deleted, roots):
+    """
+    Return the tags of the tables whose rows the database deleted along
+    with the roots (see record_deletes): any collection of theirs and any
+    response showing their rows, whose ids are never loaded.
+    """
+    tags = set()
+    for table in deleted:
+        if table not in roots:
+            tags.update((table.name, cascade_tag(table.name)))
+    return tags
+
+
+def _record_deletes(session, flush_context, instances):
+    deleted = {}
+    for instance in session.deleted:
+        if isinstance(instance, BaseMixin):
+            deleted.setdefault(instance.__table__, set()).add(instance.id)
+    if not deleted:
+        return
+    roots = {table: table.c.id.in_(sorted(ids))
+             for table, ids in deleted.items()}
+    # the database removes the descendants, the session never sees them
+    tags = cascaded_tags(record_deletes(session.connection(), roots), roots)
+    if tags:
+        bump_on_commit(session, tags)
+        invalidate_on_commit(session, tags)
+
+
+# tombstones are written in the transaction deleting the rows
+event.listen(Session, 'before_flush', _record_deletes)
+
+
+def _parse_change(value):
+    """Parse the `<changed at>|<id>|<deleted>` key of a change cursor."""
+    changed_at, pk, deleted = value.split('|')
+    return parse_isoformat(changed_at), int(pk), int(deleted)
+
+
+def _parse_since(value):
+    try:
+        return parse_isoformat(value)
+    except ValueError:
+        raise ValueError("Invalid updated_since: {}".format(value))
+
+
+def changes(model, since=None, after=None, limit=100, until=None):
+    """
+    Return up to `limit` changes to the rows of a model, oldest first, as
+    (changed at, id, deleted) rows with deleted set to 0 or 1: the rows
+    updated, or created, and the rows deleted at or after `since`, or
+    strictly after the `after` key, and before `until`.
+
+    The dates are taken when the rows are flushed, not when they commit: a
+    transaction committing after a poll can add changes older than the
+    cursor it returned. The view holds the last CHANGES_DELAY seconds back
+    for them to be in the next poll.
+
+    Both halves of the union seek into an index: the one on updated_at and
+    the one on the (table name, deleted at) of the tombstones.
+    """
+    live = select([model.updated_at.label('changed_at'),
+                   model.id.label('id'), literal(0).label('deleted')])
+    gone = select([Tombstone.deleted_at, Tombstone.row_id,
+                   literal(1)]).where(
+        Tombstone.table_name == model.__tablename__)
+    if since is not None:
+        live = live.where(model.updated_at >= since)
+        gone = gone.where(Tombstone.deleted_at >= since)
+    if after is not None:
+        changed_at = after[0]
+        live = live.where(model.updated_at >= changed_at)
+        gone = gone.where(Tombstone.deleted_at >= changed_at)
+    if until is not None:
+        live = live.where(model.updated_at < until)
+        gone = gone.where(Tombstone.deleted_at < until)
+    feed = union_all(live, gone).alias('changes')
+    statement = select([feed.c.changed_at, feed.c.id, feed.c.deleted])
+    if after is not None:
+        changed_at, pk, deleted = after
+        statement = statement.where(or_(
+            feed.c.changed_at > changed_at,
+            and_(feed.c.changed_at == changed_at, or_(
+                feed.c.id > pk,
+                and_(feed.c.id == pk, feed.c.deleted > deleted)))))
+    statement = statement.order_by(
+        feed.c.changed_at, feed.c.id, feed.c.deleted).limit(limit)
+    return db.session.execute(statement).fetchall()
+
+
+class ChangesView(MethodView):
+    """
+    This class handles the change feed of the registry tables.
+
+    /api/changes/<table>?updated_since=<iso date>&after=<cursor> - GET
+    """
+
+    def get(self, table):
+        """
+        Return the rows of a table changed since a date or a cursor, with
+        the current data of the live ones and null for the deleted ones.
+        """
+        if table not in TABLES:
+            abort(404)
+        model = TABLES[table]
+        try:
+            since = request.args.get('updated_since')
+            if since is not None:
+                since = _parse_since(since)
+            after = decode_cursor(request.args.get('after'),
+                                  parse=_parse_change)
+            # only what is older than the longest write transaction
+            until = datetime.utcnow() - timedelta(
+                seconds=current_app.config.get('CHANGES_DELAY', 30))
+            page = changes(model, since, after, get_limit(), until)
+        except ValueError as e:
+            response = {"message": str(e)}
+            return make_response(jsonify(response)), 400
+
+        live = [row['id'] for row in page if not row['deleted']]
+        data = {}
+        if live:
+            serialize = row_serializer(model)
+            rows = db.session.execute(
+                model.select().where(model.id.in_(live)))
+            data = {row['id']: serialize(row) for row in rows}
+        response = [{
+            "id": row['id'],
+            "changed_at": row['changed_at'],
+            "deleted": bool(row['deleted']),
+            "data": None if row['deleted'] else data.get(row['id']),
+        } for row in page]
+
+        # the last page links to where the next poll resumes from
+        next_url = None
+        if page:
+            last = page[-1]
+            next_url = next_link(encode_cursor('{}|{}|{}'.format(
+                last['changed_at'].isoformat(), last['id'],
+                last['deleted'])))
+        return paginated_response(response, next_url)
+
+
+changes_blueprint.add_url_rule(
+    '/api/changes/<table>',
+    view_func=ChangesView.as_view('changes_view'), methods=['GET'])
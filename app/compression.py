@@ -0,0 +1,155 @@
+import time
+import zlib
+
+from flask import current_app, request
+
+from app.instrumentation import current_stats
+
+try:
+    import brotli
+except ImportError:
+    # optional, the responses are only gzipped without it
+    brotli = None
+
+# the content types worth compressing, besides text/* and +json ones
+COMPRESSIBLE = ('application/json', 'application/x-ndjson',
+                'application/javascript', 'application/xml')
+
+
+class Gzip(object):
+    """gzip, from zlib, always available."""
+
+    name = 'gzip'
+    installed = True
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def _compressor(self):
+        # a gzip header and trailer, without the time gzip.compress writes
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        """Return a whole body compressed."""
+        compressor = self._compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, chunks):
+        """
+        Compress the chunks of a streamed body as they come, each one
+        flushed for the client to decode it without waiting for the rest.
+        """
+        compressor = self._compressor()
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk) + \
+                    compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+class Brotli(Gzip):
+    """brotli, smaller than gzip for the same CPU at the lower levels."""
+
+    name = 'br'
+    installed = brotli is not None
+
+    def __init__(self, level=4):
+        super().__init__(level)
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def stream(self, chunks):
+        compressor = brotli.Compressor(quality=self.level)
+        for chunk in chunks:
+            if chunk:
+                yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+
+
+def init_app(app):
+    """
+    Compress the responses for the clients accepting it, with brotli (when
+    installed) or gzip at the COMPRESSION_BROTLI_LEVEL and
+    COMPRESSION_GZIP_LEVEL settings. Bodies under COMPRESSION_MIN_SIZE
+    bytes are left as they are, streamed ones are compressed as they go.
+    """
+    codecs = []
+    if app.config.get('COMPRESSION', True):
+        if Brotli.installed:
+            codecs.append(Brotli(app.config.get('COMPRESSION_BROTLI_LEVEL',
+                                                4)))
+        codecs.append(Gzip(app.config.get('COMPRESSION_GZIP_LEVEL', 6)))
+    # preferred first, when the client accepts several
+    app.extensions['compression'] = codecs
+    app.after_request(compress_response)
+
+
+def negotiate():
+    """
+    Return the codec the client accepts best (brotli on a tie) for the
+    current request, None when it accepts none.
+    """
+    codecs = current_app.extensions.get('compression')
+    if not codecs:
+        return None
+    name = request.accept_encodings.best_match([codec.name
+                                                for codec in codecs])
+    return next((codec for codec in codecs if codec.name == name), None)
+
+
+def compressible(response):
+    """Tell whether a response is of a content type worth compressing."""
+    mimetype = response.mimetype or ''
+    return mimetype in COMPRESSIBLE or mimetype.startswith('text/') or \
+        mimetype.endswith('+json')
+
+
+def _closing(chunks, body):
+    # the body of a streamed response holds a database cursor
+    try:
+        for chunk in chunks:
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def compress_response(response, codec=None):
+    """
+    Return a successful response compressed by the codec negotiated with
+    the client (or the given one), unless it already is or is too small
+    for it to pay off. Compressed responses lose their strong ETags, which
+    stand for the uncompressed body.
+    """
+    if not current_app.extensions.get('compression') or \
+            not 200 <= response.status_code < 300 or \
+            response.status_code == 204 or \
+            'Content-Encoding' in response.headers or \
+            not compressible(response):
+        return response
+    # whether it is compressed or not depends on the client
+    response.vary.add('Accept-Encoding')
+    codec = codec or negotiate()
+    if codec is None:
+        return response
+
+    if response.is_streamed:
+        body = response.response
+        response.response = _closing(codec.stream(response.iter_encoded()),
+                                     body)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < current_app.config.get('COMPRESSION_MIN_SIZE', 1024):
+            return response
+        start = time.perf_counter()
+        response.set_data(codec.compress(data))
+        stats = current_stats()
+        if stats is not None:
+            stats.compression += time.perf_counter() - start
+    response.headers['Content-Encoding'] = codec.name
+    tag, weak = response.get_etag()
+    if tag is not None and not weak:
+        response.set_etag(tag, weak=True)
+    return response
@@ -0,0 +1,52 @@
+from sqlalchemy import select
+
+from app import db
+from app.cache import invalidate_on_commit
+from app.changes import cascaded_tags, record_deletes
+from app.versions import bump_on_commit
+
+
+def _parent_tags(connection, table, condition):
+    """Return the tags of the collections within the parents of the rows."""
+    tags = set()
+    for column in table.columns:
+        for fk in column.foreign_keys:
+            values = connection.execute(
+                select([column]).distinct().where(condition))
+            tags.update('{}@{}:{}'.format(table.name, fk.column.table.name,
+                                          value)
+                        for value, in values if value is not None)
+    return tags
+
+
+def delete(model, ids):
+    """
+    Delete rows of a model by id, along with their descendants, and commit.
+    Return the number of rows of the model deleted.
+
+    Nothing is loaded in the session: the tombstones of the whole hierarchy
+    are written with INSERT ... SELECT statements (see app.changes) and a
+    single DELETE leaves the descendants to the ON DELETE CASCADE foreign
+    keys, so the time and memory it takes do not depend on the number of
+    descendants held in python.
+    """
+    table = model.__table__
+    condition = table.c.id.in_(sorted(set(ids)))
+    session = db.session
+    try:
+        connection = session.connection()
+        tags = _parent_tags(connection, table, condition)
+        tags.add(table.name)
+        roots = {table: condition}
+        deleted = record_deletes(connection, roots)
+        count = connection.execute(table.delete().where(condition)).rowcount
+        # the descendants are invalidated by table, not row by row
+        tags.update(cascaded_tags(deleted, roots))
+        bump_on_commit(session, tags)
+        tags.update('{}:{}'.format(table.name, pk) for pk in ids)
+        invalidate_on_commit(session, tags)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return count
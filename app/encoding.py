@@ -0,0 +1,223 @@
+import datetime
+import decimal
+import json
+import time
+import uuid
+
+from flask import current_app, request
+
+from app.instrumentation import current_stats
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+NDJSON = 'application/x-ndjson'
+
+
+def rfc3339(o):
+    """
+    Return a date or datetime in ISO 8601, as the RFC 3339 `date-time` the
+    spec declares: naive datetimes are in UTC and end with a Z, as orjson
+    writes them with OPT_NAIVE_UTC and OPT_UTC_Z.
+    """
+    if not isinstance(o, datetime.datetime):
+        return o.isoformat()
+    offset = o.utcoffset()
+    if offset is None:
+        return o.isoformat() + 'Z'
+    if not offset:
+        return o.replace(tzinfo=None).isoformat() + 'Z'
+    return o.isoformat()
+
+
+def default(o):
+    """
+    Return a json value standing for what json does not know: dates in
+    ISO 8601 (RFC 3339, naive ones in UTC), decimals as numbers.
+    """
+    if isinstance(o, datetime.date):
+        return rfc3339(o)
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError("Object of type {} is not JSON serializable".format(
+        type(o).__name__))
+
+
+class JSONBackend(object):
+    """The json module of the standard library, always available."""
+
+    name = 'json'
+    installed = True
+
+    def __init__(self, sort_keys=True, pretty=False, ascii=True):
+        self.sort_keys = sort_keys
+        self.pretty = pretty
+        self.ascii = ascii
+        # as flask.jsonify, indented with spaces after the separators
+        self._encoder = json.JSONEncoder(
+            default=default, sort_keys=sort_keys, ensure_ascii=ascii,
+            indent=2 if pretty else None,
+            separators=(', ', ': ') if pretty else (',', ':'))
+
+    def encode(self, o):
+        """Return the json of a value, as utf-8 bytes."""
+        return self._encoder.encode(o).encode('utf-8')
+
+    def compact(self):
+        """Return the same backend, without indentation."""
+        return type(self)(self.sort_keys, False, self.ascii)
+
+
+class UJSONBackend(JSONBackend):
+    """
+    ujson, faster than the json module on plain values but slower once the
+    dates call back into python, as they do in every row of the registry.
+    """
+
+    name = 'ujson'
+    installed = ujson is not None
+
+    def __init__(self, sort_keys=True, pretty=False, ascii=True):
+        super().__init__(sort_keys, pretty, ascii)
+        self._options = dict(sort_keys=sort_keys, ensure_ascii=ascii,
+                             indent=2 if pretty else 0,
+                             escape_forward_slashes=False, default=default)
+
+    def encode(self, o):
+        return ujson.dumps(o, **self._options).encode('utf-8')
+
+
+class ORJSONBackend(JSONBackend):
+    """
+    orjson, the fastest, which writes utf-8 whatever JSON_AS_ASCII says.
+    """
+
+    name = 'orjson'
+    installed = orjson is not None
+
+    def __init__(self, sort_keys=True, pretty=False, ascii=True):
+        super().__init__(sort_keys, pretty, ascii)
+        # orjson writes the dates itself, as default() does
+        self._option = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+        if sort_keys:
+            self._option |= orjson.OPT_SORT_KEYS
+        if pretty:
+            self._option |= orjson.OPT_INDENT_2
+
+    def encode(self, o):
+        return orjson.dumps(o, default=default, option=self._option)
+
+
+BACKENDS = {cls.name: cls
+            for cls in (ORJSONBackend, UJSONBackend, JSONBackend)}
+# the backends 'auto' picks from, fastest first on the rows of the registry
+AUTO = (ORJSONBackend, JSONBackend)
+
+# what a backend has to encode the way the json module does to be used
+_SAMPLE = {
+    'at': datetime.datetime(2018, 5, 4, 3, 2, 1),
+    'day': datetime.date(2018, 5, 4),
+    'utc': datetime.datetime(2018, 5, 4, 3, 2, 1, 500,
+                             tzinfo=datetime.timezone.utc),
+    'amount': decimal.Decimal('12.50'),
+    'id': uuid.UUID(int=1),
+    'name': 'Café / Bar',
+    'rows': [1, 2.5, None, True],
+}
+
+
+def agrees(backend):
+    """Tell whether a backend encodes _SAMPLE as the json module does."""
+    expected = JSONBackend().encode(_SAMPLE)
+    try:
+        return json.loads(backend.encode(_SAMPLE)) == json.loads(expected)
+    except (TypeError, ValueError):
+        return False
+
+
+def init_app(app):
+    """
+    Set up the json backend picked by the JSON_BACKEND setting: orjson,
+    ujson, json or auto (the fastest of AUTO installed that encodes dates
+    and decimals as the json module does), with Flask's JSON_SORT_KEYS,
+    JSON_AS_ASCII and pretty printing settings.
+    """
+    name = app.config.get('JSON_BACKEND', 'auto')
+    options = dict(
+        sort_keys=app.config.get('JSON_SORT_KEYS', True),
+        pretty=app.config.get('JSONIFY_PRETTYPRINT_REGULAR') or app.debug,
+        ascii=app.config.get('JSON_AS_ASCII', True))
+    if name == 'auto':
+        # the json module always agrees with itself
+        backend = next(backend for backend in (
+            cls(**options) for cls in AUTO if cls.installed)
+            if agrees(backend))
+    elif name in BACKENDS:
+        if not BACKENDS[name].installed:
+            raise ValueError("{} is not installed".format(name))
+        backend = BACKENDS[name](**options)
+    else:
+        raise ValueError("Unknown json backend: {}".format(name))
+    app.extensions['json'] = backend
+
+
+def get_backend():
+    """Return the json backend of the current app."""
+    return current_app.extensions['json']
+
+
+def add_encoding_time(start):
+    """Add the time spent encoding since `start` to the request's stats."""
+    stats = current_stats()
+    if stats is not None:
+        stats.serialization += time.perf_counter() - start
+
+
+def encode(o, backend=None):
+    """
+    Return the json of a value as bytes, encoded by the backend of the app
+    (or the given one).
+    """
+    start = time.perf_counter()
+    try:
+        return (backend or get_backend()).encode(o)
+    finally:
+        add_encoding_time(start)
+
+
+def jsonify(*args, **kwargs):
+    """flask.jsonify, encoding with the json backend of the app."""
+    if args and kwargs:
+        raise TypeError("jsonify() takes either arguments or keywords")
+    data = args[0] if len(args) == 1 else (args or kwargs)
+    return current_app.response_class(
+        encode(data) + b'\n', mimetype=current_app.config['JSONIFY_MIMETYPE'])
+
+
+def ndjson_requested():
+    """
+    Tell whether the client asked for the rows of a list as json lines,
+    with an Accept header preferring application/x-ndjson to json.
+    """
+    return request.accept_mimetypes.best_match(
+        ['application/json', NDJSON]) == NDJSON
+
+
+def ndjson_lines(rows, backend=None):
+    """Return a list of rows as json lines, one compact row per line."""
+    start = time.perf_counter()
+    encode_row = (backend or get_backend()).compact().encode
+    try:
+        return b''.join(encode_row(row) + b'\n' for row in rows)
+    finally:
+        add_encoding_time(start)
@@ -0,0 +1,88 @@
+from flask import request
+from sqlalchemy.orm import selectinload
+
+from app import db
+from app.models import Location, Organization
+
+# the collections that can be embedded through ?expand=, by their public
+# name, mapped to the relationship attribute backing them
+EXPANSIONS = {
+    Organization: {
+        'programs': 'program',
+        'services': 'service',
+        'locations': 'location',
+    },
+    Location: {
+        'addresses': 'address',
+    },
+}
+
+
+def relationship_of(model, name):
+    """Return the relationship attribute and target model of an expansion."""
+    attribute = getattr(model, EXPANSIONS[model][name])
+    return attribute, attribute.property.mapper.class_
+
+
+def requested_expansions(model):
+    """
+    Return the collections asked for through the `expand` query param as a
+    tree, e.g. `programs,locations.addresses` gives
+    {'programs': {}, 'locations': {'addresses': {}}}. Raises a ValueError
+    for collections that cannot be expanded.
+    """
+    tree = {}
+    for path in request.args.get('expand', '').split(','):
+        path = path.strip()
+        if not path:
+            continue
+        current, node = model, tree
+        for name in path.split('.'):
+            if name not in EXPANSIONS.get(current, {}):
+                raise ValueError("Cannot expand: {}".format(path))
+            node = node.setdefault(name, {})
+            current = relationship_of(current, name)[1]
+    return tree
+
+
+def loader_options(model, tree, path=()):
+    """
+    Return the selectinload options loading every collection of the tree,
+    i.e. one extra query per expanded collection whatever the row count.
+    """
+    options = []
+    for name, subtree in tree.items():
+        attribute, target = relationship_of(model, name)
+        chain = path + (attribute,)
+        loader = selectinload(chain[0])
+        for attribute in chain[1:]:
+            loader = loader.selectinload(attribute)
+        options.append(loader)
+        options.extend(loader_options(target, subtree, chain))
+    return options
+
+
+def serialize_expanded(instance, tree, fields=None):
+    """Return the dict of an instance with its expanded collections."""
+    result = instance.serialize(fields)
+    for name, subtree in tree.items():
+        attribute = EXPANSIONS[instance.__class__][name]
+        result[name] = [serialize_expanded(child, subtree)
+                        for child in getattr(instance, attribute)]
+    return result
+
+
+def expand_rows(model, rows, tree, fields=None):
+    """
+    Return the dicts of a page of Core rows with their expanded collections.
+
+    The rows' instances and their collections are loaded with one query per
+    level, keeping the order of the page.
+    """
+    ids = [row[model.id.key] for row in rows]
+    if not ids:
+        return []
+    instances = db.session.query(model).options(
+        *loader_options(model, tree)).filter(model.id.in_(ids))
+    by_id = {instance.id: instance for instance in instances}
+    return [serialize_expanded(by_id[pk], tree, fields) for pk in ids]
@@ -0,0 +1,166 @@
+import csv
+import io
+import os
+from collections import OrderedDict
+
+from flask import (Blueprint, Response, abort, current_app, make_response,
+                   request, stream_with_context)
+from flask.views import MethodView
+
+from app import db
+from app.encoding import jsonify, ndjson_lines
+from app.models import (Location, Organization, PhysicalAddress, Program,
+                        Service, ServiceLocation)
+from app.serializers import columns, row_serializer
+
+# the exported tables by their public name, parents before their children
+TABLES = OrderedDict([
+    ('organizations', Organization),
+    ('programs', Program),
+    ('services', Service),
+    ('locations', Location),
+    ('service_locations', ServiceLocation),
+    ('physical_addresses', PhysicalAddress),
+])
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+export_blueprint = Blueprint('export', __name__)
+
+
+def _batches(model):
+    """
+    Yield every row of a table, ordered by id, in lists of at most
+    STREAM_BATCH_SIZE rows read through a server side cursor on postgres.
+    """
+    batch_size = current_app.config.get('STREAM_BATCH_SIZE', 1000)
+    statement = model.select().order_by(model.id).execution_options(
+        stream_results=True)
+    result = db.session.execute(statement)
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        result.close()
+
+
+def ndjson_chunks(model):
+    """Yield a table as json lines, one chunk of text per batch of rows."""
+    serialize = row_serializer(model)
+    for rows in _batches(model):
+        # text, as the csv chunks, for the files of `export`
+        yield ndjson_lines([serialize(row) for row in rows]).decode('utf-8')
+
+
+def csv_chunks(model):
+    """Yield a table as csv with a header, one chunk per batch of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns(model))
+    for rows in _batches(model):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+CHUNKS = {
+    'ndjson': ndjson_chunks,
+    'csv': csv_chunks,
+}
+
+
+def _copy_csv(model, out):
+    """Write a table as csv with a header to `out` using COPY TO."""
+    query = model.select().order_by(model.id).compile(
+        dialect=db.engine.dialect)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)'.format(query), out)
+    finally:
+        cursor.close()
+
+
+def dump(model, fmt, out):
+    """
+    Write a whole table in the given format to the text file `out`.
+
+    On postgres csv dumps are produced by the server with COPY TO, anything
+    else is streamed batch by batch, so memory use does not depend on the
+    size of the table either way.
+    """
+    if fmt == 'csv' and db.engine.dialect.name == 'postgresql':
+        _copy_csv(model, out)
+    else:
+        for chunk in CHUNKS[fmt](model):
+            out.write(chunk)
+
+
+def export(directory, fmt='ndjson', tables=None):
+    """
+    Dump the given tables (all of them by default) to
+    `<directory>/<table>.<fmt>` and return the paths of the files written.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown format: {}".format(fmt))
+    tables = list(TABLES) if tables is None else tables
+    unknown = set(tables).difference(TABLES)
+    if unknown:
+        raise ValueError("Unknown tables: {}".format(
+            ', '.join(sorted(unknown))))
+
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for table in tables:
+        path = os.path.join(directory, '{}.{}'.format(table, fmt))
+        with open(path, 'w', newline='') as out:
+            dump(TABLES[table], fmt, out)
+        paths.append(path)
+    return paths
+
+
+class ExportView(MethodView):
+    """
+    This class handles the export of whole registry tables.
+
+    /api/export/ - GET
+    /api/export/<table>?format=ndjson|csv - GET
+    """
+
+    def get(self, table):
+        """
+        Stream every row of a table as json lines (the default) or csv, or
+        list the exported tables.
+        """
+        if table is None:
+            return make_response(jsonify(list(TABLES))), 200
+        if table not in TABLES:
+            abort(404)
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in FORMATS:
+            response = {"message": "Unknown format: {}".format(fmt)}
+            return make_response(jsonify(response)), 400
+
+        chunks = CHUNKS[fmt](TABLES[table])
+        response = Response(stream_with_context(chunks),
+                            mimetype=FORMATS[fmt])
+        response.headers['Content-Disposition'] = \
+            'attachment; filename={}.{}'.format(table, fmt)
+        return response
+
+
+export_view = ExportView.as_view('export_view')
+export_blueprint.add_url_rule(
+    '/api/export/', defaults={'table': None},
+    view_func=export_view, methods=['GET'])
+export_blueprint.add_url_rule(
+    '/api/export/<table>',
+    view_func=export_view, methods=['GET'])
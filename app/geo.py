@@ -0,0 +1,296 @@
+import heapq
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from math import asin, cos, degrees, floor, pi, radians, sin, sqrt
+
+from flask import Blueprint, current_app, make_response, request
+from flask.views import MethodView
+from sqlalchemy import or_, select
+
+from app import db
+from app.encoding import jsonify
+from app.models import Location, Service, ServiceLocation, Tombstone
+from app.pagination import get_limit
+from app.serializers import row_serializer
+from app.versions import EPOCH, counters
+
+# mean radius of the earth, in km
+EARTH_RADIUS = 6371.0088
+# the largest distance between two points of the earth
+MAX_DISTANCE = pi * EARTH_RADIUS
+
+geo_blueprint = Blueprint('geo', __name__)
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Return the great-circle distance between two points, in km."""
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + \
+        cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * asin(min(1, sqrt(a)))
+
+
+def bounding_boxes(lat, lon, radius):
+    """
+    Return the (south, west, north, east) boxes, in degrees, holding every
+    point within `radius` km of a point: two of them when the circle
+    crosses the antimeridian, a band of every longitude around the poles.
+    """
+    angle = radius / EARTH_RADIUS
+    south, north = lat - degrees(angle), lat + degrees(angle)
+    if south <= -90 or north >= 90 or angle >= pi / 2:
+        return [(max(south, -90), -180, min(north, 90), 180)]
+    spread = sin(angle) / cos(radians(lat))
+    if spread >= 1:
+        return [(south, -180, north, 180)]
+    spread = degrees(asin(spread))
+    west, east = lon - spread, lon + spread
+    if west < -180:
+        return [(south, west + 360, north, 180), (south, -180, north, east)]
+    if east > 180:
+        return [(south, west, north, 180), (south, -180, north, east - 360)]
+    return [(south, west, north, east)]
+
+
+class GridIndex(object):
+    """
+    An in-process index of the location points, bucketed in square cells
+    of `cell` degrees. Each cell holds arrays of ids and coordinates rather
+    than objects, to keep hundreds of thousands of points small.
+
+    Writes to the locations are applied on top of the cells, from the rows
+    updated and deleted in the last `window` seconds (see app.changes), so
+    that a write does not rebuild the whole index. It is rebuilt once a
+    thousand of them pile up, after the writes bypassing the session and
+    every `max_age` seconds.
+    """
+
+    def __init__(self, cell=0.1, window=60, max_age=600):
+        self.cell = cell
+        self.window = timedelta(seconds=window)
+        self.max_age = max_age
+        # the cells and the points written since their build, by id, None
+        # for the deleted ones, swapped together for the running searches
+        self.points = {}, {}
+        # the version counters the index is up to date with
+        self.state = None
+        self._since = self._built = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        cells, changed = self.points
+        return sum(1 for ids, lats, lons in cells.values() for pk in ids
+                   if pk not in changed) + \
+            sum(1 for point in changed.values() if point is not None)
+
+    def _key(self, lat, lon):
+        return floor(lat / self.cell), floor(lon / self.cell)
+
+    def build(self, rows):
+        """Index (id, latitude, longitude) rows, replacing the points."""
+        cells = {}
+        for pk, lat, lon in rows:
+            key = self._key(lat, lon)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = (array('q'), array('d'), array('d'))
+            cell[0].append(pk)
+            cell[1].append(lat)
+            cell[2].append(lon)
+        self.points = cells, {}
+
+    def _rebuild(self):
+        statement = select([Location.id, Location.latitude,
+                            Location.longitude]).where(
+            Location.latitude.isnot(None)).where(
+            Location.longitude.isnot(None))
+        self.build(db.session.execute(statement))
+        self._built = time.monotonic()
+
+    def _update(self, since):
+        cells, changed = self.points
+        changed = dict(changed)
+        statement = select([Location.id, Location.latitude,
+                            Location.longitude]).where(
+            Location.updated_at >= since)
+        for pk, lat, lon in db.session.execute(statement):
+            if lat is None or lon is None:
+                changed[pk] = None
+            else:
+                changed[pk] = (lat, lon)
+        statement = select([Tombstone.row_id]).where(
+            Tombstone.table_name == Location.__tablename__).where(
+            Tombstone.deleted_at >= since)
+        for pk, in db.session.execute(statement):
+            changed[pk] = None
+        self.points = cells, changed
+
+    def refresh(self):
+        """Catch up with the locations written since the last refresh."""
+        # a primary key lookup, the epoch being bumped by bulk writes and
+        # imports
+        state = counters(['location', EPOCH])
+        if state == self.state:
+            return
+        with self._lock:
+            if state == self.state:
+                return
+            now = datetime.utcnow()
+            rebuild = self.state is None or \
+                state.get(EPOCH) != self.state.get(EPOCH) or \
+                time.monotonic() - self._built >= self.max_age
+            if not rebuild:
+                # rows stamped before the last refresh may have been
+                # committed after it
+                self._update(self._since - self.window)
+                rebuild = len(self.points[1]) > 1000
+            if rebuild:
+                self._rebuild()
+            self._since = now
+            self.state = state
+
+    def search(self, boxes):
+        """Yield the (id, latitude, longitude) of the points of the boxes."""
+        cells, changed = self.points
+        for south, west, north, east in boxes:
+            bottom, left = self._key(south, west)
+            top, right = self._key(north, east)
+            if (top - bottom + 1) * (right - left + 1) > len(cells):
+                # fewer cells with points than in the box
+                keys = [key for key in cells
+                        if bottom <= key[0] <= top and left <= key[1] <= right]
+            else:
+                keys = [(i, j) for i in range(bottom, top + 1)
+                        for j in range(left, right + 1) if (i, j) in cells]
+            for key in keys:
+                if changed:
+                    for point in zip(*cells[key]):
+                        if point[0] not in changed:
+                            yield point
+                else:
+                    yield from zip(*cells[key])
+            for pk, point in changed.items():
+                if point is not None and south <= point[0] <= north and \
+                        west <= point[1] <= east:
+                    yield (pk,) + point
+
+
+def get_index():
+    """Return the up to date grid index of the current app."""
+    index = current_app.extensions.get('geo_index')
+    if index is None:
+        config = current_app.config
+        index = current_app.extensions.setdefault('geo_index', GridIndex(
+            config.get('GEO_GRID_CELL', 0.1),
+            config.get('GEO_REFRESH_WINDOW', 60),
+            config.get('GEO_REBUILD_AGE', 600)))
+    index.refresh()
+    return index
+
+
+def _search_postgres(boxes):
+    """Select the points of the boxes through the GiST index of app.models."""
+    point = db.func.point(Location.longitude, Location.latitude)
+    statement = select([Location.id, Location.latitude, Location.longitude])
+    return db.session.execute(statement.where(or_(*[
+        point.op('<@')(db.func.box(db.func.point(west, south),
+                                   db.func.point(east, north)))
+        for south, west, north, east in boxes])))
+
+
+def nearest(lat, lon, radius=None, limit=100):
+    """
+    Return up to `limit` (distance, id) pairs of the locations within
+    `radius` km of a point, or at any distance without one, nearest first.
+
+    Only the points of the bounding boxes of the circle are read, from the
+    GiST index on postgres and from the in-process grid elsewhere. Without
+    a radius the circle grows from GEO_SEARCH_RADIUS km until it holds
+    `limit` locations.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        search = _search_postgres
+    else:
+        search = get_index().search
+    within = radius
+    if within is None:
+        within = current_app.config.get('GEO_SEARCH_RADIUS', 10)
+    while True:
+        found = []
+        for pk, point_lat, point_lon in search(
+                bounding_boxes(lat, lon, within)):
+            length = distance(lat, lon, point_lat, point_lon)
+            if length <= within:
+                found.append((length, pk))
+        if radius is not None or len(found) >= limit or \
+                within >= MAX_DISTANCE:
+            return heapq.nsmallest(limit, found)
+        within = min(within * 2, MAX_DISTANCE)
+
+
+def _coordinate(name, limit, required=True):
+    value = request.args.get(name)
+    if value is None:
+        if required:
+            raise ValueError("Missing {}".format(name))
+        return None
+    try:
+        value = float(value)
+    except ValueError:
+        raise ValueError("Invalid {}: {}".format(name, value))
+    if not -limit <= value <= limit:
+        raise ValueError("Invalid {}: {}".format(name, value))
+    return value
+
+
+class NearbyView(MethodView):
+    """
+    This class handles the distance searches over the locations.
+
+    /api/locations/near?lat=<degrees>&lon=<degrees>&radius=<km> - GET
+    """
+
+    def get(self):
+        """
+        Return the locations nearest to a point, within a radius if any,
+        with their distance in km and the services offered at each.
+        """
+        try:
+            lat = _coordinate('lat', 90)
+            lon = _coordinate('lon', 180)
+            radius = _coordinate('radius', MAX_DISTANCE, required=False)
+            if radius is not None and radius <= 0:
+                raise ValueError("Invalid radius: {}".format(radius))
+            found = nearest(lat, lon, radius, get_limit())
+        except ValueError as e:
+            response = {"message": str(e)}
+            return make_response(jsonify(response)), 400
+
+        ids = [pk for length, pk in found]
+        locations, services = {}, {}
+        if ids:
+            serialize = row_serializer(Location)
+            locations = {row['id']: serialize(row)
+                         for row in db.session.execute(
+                             Location.select().where(Location.id.in_(ids)))}
+            serialize = row_serializer(Service)
+            statement = Service.select().column(
+                ServiceLocation.location_id).where(
+                Service.id == ServiceLocation.service_id).where(
+                ServiceLocation.location_id.in_(ids)).order_by(Service.id)
+            for row in db.session.execute(statement):
+                services.setdefault(row['location_id'], []).append(
+                    serialize(row))
+        response = [{
+            "distance": length,
+            "location": locations[pk],
+            "services": services.get(pk, []),
+        } for length, pk in found if pk in locations]
+        return make_response(jsonify(response)), 200
+
+
+geo_blueprint.add_url_rule(
+    '/api/locations/near',
+    view_func=NearbyView.as_view('nearby_view'), methods=['GET'])
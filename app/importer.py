@@ -0,0 +1,325 @@
+import csv
+import io
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+from flask import current_app
+from sqlalchemy import (Column, MetaData, Table, exists, func, literal,
+                        literal_column, select, text)
+
+from app import cache, db
+from app.export import FORMATS, TABLES
+from app.serializers import parse_isoformat
+from app.versions import bump_all
+
+
+def _parse_datetime(value):
+    """
+    Parse the iso form of a date the exports write, or the http form older
+    json exports wrote.
+    """
+    try:
+        return parse_isoformat(value)
+    except ValueError:
+        return parsedate_to_datetime(value).replace(tzinfo=None)
+
+
+def _converter(column, dialect):
+    """
+    Return a function turning file values into the database values of the
+    column, i.e. its python type passed through the type's bind processor.
+    """
+    python_type = column.type.python_type
+    if python_type is datetime:
+        convert = _parse_datetime
+    elif python_type is int:
+        convert = int
+    elif python_type is float:
+        convert = float
+    else:
+        convert = str
+    process = column.type.bind_processor(dialect)
+
+    def converter(value):
+        if value is None:
+            return None
+        value = convert(value)
+        return value if process is None else process(value)
+
+    return converter
+
+
+def _staging_table(model, metadata):
+    """
+    Return a temporary table with the columns of the model's table but none
+    of its constraints, which are checked in SQL once everything is loaded.
+    """
+    columns = [Column(column.key, column.type)
+               for column in model.__table__.columns]
+    return Table('import_{}'.format(model.__tablename__), metadata, *columns,
+                 prefixes=['TEMPORARY'])
+
+
+def _read(path, fmt):
+    """Yield the rows of an export file as dicts, with None for nulls."""
+    with open(path, newline='') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {key: value if value != '' else None
+                       for key, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _copy_from(connection, staging, keys, f):
+    """Load csv data with a header from a file object using COPY FROM."""
+    quote = connection.dialect.identifier_preparer.quote
+    statement = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER)'.format(
+        quote(staging.name), ', '.join(quote(key) for key in keys))
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(statement, f)
+    finally:
+        cursor.close()
+
+
+def _stage(connection, table, staging, path, fmt, batch_size):
+    """
+    Load an export file into its staging table and return the errors of the
+    rows that could not be read.
+
+    On postgres the rows go through COPY FROM (csv files are handed to it
+    as they are), elsewhere through batched multi-row inserts.
+    """
+    postgres = connection.dialect.name == 'postgresql'
+    keys = [column.key for column in staging.columns]
+
+    if postgres and fmt == 'csv':
+        with open(path, newline='') as f:
+            header = next(csv.reader(f), [])
+            unknown = set(header).difference(keys)
+            if unknown:
+                return ["{}: unknown columns {}".format(
+                    table, ', '.join(sorted(unknown)))]
+            f.seek(0)
+            _copy_from(connection, staging, header, f)
+        return []
+
+    converters = [(column.key, _converter(column, connection.dialect))
+                  for column in staging.columns]
+    errors = []
+
+    def flush(batch):
+        if postgres:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(keys)
+            writer.writerows(batch)
+            buffer.seek(0)
+            _copy_from(connection, staging, keys, buffer)
+        else:
+            # rows are already converted, so the DBAPI cursor is used
+            # directly rather than having every parameter processed again
+            cursor = connection.connection.cursor()
+            try:
+                cursor.executemany(insert, batch)
+            finally:
+                cursor.close()
+
+    insert = str(staging.insert().compile(dialect=connection.dialect))
+    batch = []
+    known = frozenset(keys)
+    for line, item in enumerate(_read(path, fmt), 1):
+        if not known.issuperset(item):
+            errors.append("{} line {}: unknown columns {}".format(
+                table, line, ', '.join(sorted(set(item) - known))))
+            continue
+        try:
+            batch.append(tuple(convert(item.get(key))
+                               for key, convert in converters))
+        except (TypeError, ValueError) as e:
+            errors.append("{} line {}: {}".format(table, line, e))
+            continue
+        if len(batch) == batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return errors
+
+
+def _check(connection, table, message, ids, sample=True):
+    """
+    Return an error naming a few of the offending rows when the select of
+    staged values `ids` is not empty, or None.
+    """
+    count = connection.execute(
+        select([func.count()]).select_from(ids.alias())).scalar()
+    if not count:
+        return None
+    error = "{}: {} {}".format(table, count, message)
+    if sample:
+        values = [str(value) for value, in connection.execute(ids.limit(5))]
+        error += " ({}{})".format(', '.join(values),
+                                  ', ...' if count > 5 else '')
+    return error
+
+
+def validate(connection, staged):
+    """
+    Check the staged tables with set-based queries: ids, required columns,
+    unique columns (within the files and against the database) and foreign
+    keys, which have to reference a staged row when the parent table is
+    imported too or an existing row otherwise. Returns the errors.
+    """
+    staged_tables = {model.__table__: staging
+                     for model, staging in staged.values()}
+    checks = []
+    for table, (model, staging) in staged.items():
+        rows = staging.c
+        checks.append((table, "rows without an id",
+                       select([rows.id]).where(rows.id.is_(None)), False))
+        checks.append((table, "duplicate ids", select([rows.id]).where(
+            rows.id.isnot(None)).group_by(rows.id).having(func.count() > 1)))
+
+        for column in model.__table__.columns:
+            if column.primary_key:
+                continue
+            value = rows[column.key]
+            if not column.nullable and column.server_default is None:
+                checks.append((
+                    table, "rows without a {}".format(column.key),
+                    select([rows.id]).where(value.is_(None))))
+            if column.unique:
+                checks.append((
+                    table, "duplicate {} values".format(column.key),
+                    select([value]).where(value.isnot(None)).group_by(
+                        value).having(func.count() > 1)))
+                checks.append((
+                    table, "rows whose {} already exists".format(column.key),
+                    select([rows.id]).where(exists().where(column == value))))
+            for fk in column.foreign_keys:
+                parent = fk.column
+                if fk.column.table in staged_tables:
+                    parent = staged_tables[fk.column.table].c[fk.column.key]
+                checks.append((
+                    table, "rows referencing a missing {}".format(
+                        fk.column.table.name),
+                    select([rows.id]).where(value.isnot(None)).where(
+                        ~exists().where(parent == value))))
+
+    errors = [_check(connection, *check) for check in checks]
+    return [error for error in errors if error is not None]
+
+
+def _insert(connection, model, staging, offsets):
+    """
+    Copy a staged table into its model's table in a single INSERT ... SELECT,
+    shifting the ids, and the references to the other imported tables, past
+    the rows already stored. The rows are stamped as updated by the import
+    so that the change feed reports them.
+    """
+    target = model.__table__
+    now = datetime.utcnow()
+    values = []
+    for column in target.columns:
+        value = staging.c[column.key]
+        if column.primary_key:
+            value = value + offsets[target]
+        if column.onupdate is not None:
+            value = literal(now, column.type)
+        elif column.server_default is not None:
+            default = column.server_default.arg
+            if isinstance(default, str):
+                default = literal_column(default)
+            value = func.coalesce(value, default)
+        for fk in column.foreign_keys:
+            if fk.column.table in offsets:
+                value = value + offsets[fk.column.table]
+        values.append(value)
+    statement = target.insert().from_select(
+        [column.key for column in target.columns], select(values))
+    return connection.execute(statement).rowcount
+
+
+def import_tables(directory, fmt='ndjson', tables=None, dry_run=False):
+    """
+    Load `<directory>/<table>.<fmt>` files, as written by app.export, into
+    the database and return the number of rows of every table along with
+    the errors found.
+
+    Every file is staged in a temporary table first and checked in SQL
+    before anything is written; the import is all or nothing, in a single
+    transaction. Imported ids are kept when the tables are empty and
+    shifted past the existing rows otherwise. With `dry_run` the files are
+    only validated. `tables` defaults to the tables that have a file.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown format: {}".format(fmt))
+    if tables is None:
+        tables = [table for table in TABLES if os.path.exists(
+            os.path.join(directory, '{}.{}'.format(table, fmt)))]
+    unknown = set(tables).difference(TABLES)
+    if unknown:
+        raise ValueError("Unknown tables: {}".format(
+            ', '.join(sorted(unknown))))
+    if not tables:
+        raise ValueError("No {} files in {}".format(fmt, directory))
+    # parents are loaded before their children
+    tables = [table for table in TABLES if table in tables]
+
+    batch_size = current_app.config.get('BULK_CHUNK_SIZE', 1000)
+    connection = db.session.connection()
+    metadata = MetaData()
+    staged = OrderedDict()
+    errors = []
+    try:
+        for table in tables:
+            model = TABLES[table]
+            staging = _staging_table(model, metadata)
+            staging.drop(connection, checkfirst=True)
+            staging.create(connection)
+            staged[table] = (model, staging)
+            path = os.path.join(directory, '{}.{}'.format(table, fmt))
+            errors.extend(_stage(connection, table, staging, path, fmt,
+                                 batch_size))
+        errors.extend(validate(connection, staged))
+
+        counts = OrderedDict()
+        for table, (model, staging) in staged.items():
+            counts[table] = connection.execute(
+                select([func.count()]).select_from(staging)).scalar()
+
+        if not errors and not dry_run:
+            offsets = {}
+            for model, staging in staged.values():
+                offsets[model.__table__] = connection.execute(
+                    select([func.coalesce(func.max(model.id), 0)])).scalar()
+            for model, staging in staged.values():
+                if _insert(connection, model, staging, offsets) and \
+                        connection.dialect.name == 'postgresql':
+                    # keep the id sequence ahead of the ids written
+                    connection.execute(text(
+                        "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                        "(SELECT max(id) FROM {}))".format(
+                            model.__tablename__)),
+                        table=model.__tablename__)
+
+        for model, staging in staged.values():
+            staging.drop(connection)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if errors or dry_run:
+        db.session.rollback()
+    else:
+        bump_all()
+        db.session.commit()
+        cache.clear()
+    return counts, errors
@@ -0,0 +1,50 @@
+from sqlalchemy import inspect
+
+from app import db
+from app.models import BaseMixin
+
+
+def filter_columns():
+    """
+    Return the (table, column) pairs the queries filter on: the foreign
+    keys, looked up by the nested routes and the cascading deletes, and the
+    update times the change feed is read from.
+    """
+    columns = []
+    for table in db.metadata.sorted_tables:
+        for column in table.columns:
+            if column.foreign_keys:
+                columns.append((table.name, column.name))
+    for mapper in BaseMixin.__subclasses__():
+        columns.append((mapper.__tablename__, 'updated_at'))
+    return sorted(set(columns))
+
+
+def _leading_columns(inspector, table):
+    """Return the first column of every index of a table in the database."""
+    primary_key = inspector.get_pk_constraint(table)['constrained_columns']
+    leading = set(primary_key[:1])
+    for index in inspector.get_indexes(table):
+        leading.update(index['column_names'][:1])
+    for constraint in inspector.get_unique_constraints(table):
+        leading.update(constraint['column_names'][:1])
+    return leading
+
+
+def unindexed_columns(engine=None):
+    """
+    Return the filter columns of the database no index starts with, i.e.
+    those the migrations adding the indexes of the models are missing for.
+    """
+    inspector = inspect(engine or db.engine)
+    tables = set(inspector.get_table_names())
+    leading = {}
+    missing = []
+    for table, column in filter_columns():
+        if table not in tables:
+            continue
+        if table not in leading:
+            leading[table] = _leading_columns(inspector, table)
+        if column not in leading[table]:
+            missing.append((table, column))
+    return missing
@@ -0,0 +1,117 @@
+import time
+from collections import Counter as Tally
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.metrics import Counter, Histogram, on_sent
+
+REQUEST_SECONDS = Histogram(
+    'registry_endpoint_seconds',
+    'Time from receiving a request to sending the last byte of its response',
+    ['blueprint', 'method', 'endpoint'])
+DB_SECONDS = Histogram(
+    'registry_endpoint_db_seconds',
+    'Time spent running SQL statements per request', ['endpoint'])
+SERIALIZATION_SECONDS = Histogram(
+    'registry_endpoint_serialization_seconds',
+    'Time spent encoding json per request', ['endpoint'])
+STATEMENTS = Histogram(
+    'registry_endpoint_statements',
+    'SQL statements run per request', ['endpoint'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+N_PLUS_ONE = Counter(
+    'registry_endpoint_n_plus_one_total',
+    'Requests that ran the same statement N_PLUS_ONE_THRESHOLD times or '
+    'more', ['endpoint'])
+
+
+class RequestStats(object):
+    """What a request spent its time on."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db = 0.0
+        self.serialization = 0.0
+        self.compression = 0.0
+        # SQL text -> number of executions
+        self.statements = Tally()
+
+
+def current_stats():
+    """Return the stats of the current request, None outside of one."""
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters,
+                           context, executemany):
+    if current_stats() is not None:
+        connection.info.setdefault('query_start', []).append(
+            time.perf_counter())
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters,
+                          context, executemany):
+    stats = current_stats()
+    if stats is None or not connection.info.get('query_start'):
+        return
+    stats.db += time.perf_counter() - connection.info['query_start'].pop()
+    stats.statements[statement] += 1
+
+
+# on every engine, the statements run outside of a request are ignored
+event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _start():
+    g.request_stats = RequestStats()
+
+
+def _finish(response):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return response
+    total = time.perf_counter() - stats.start
+    endpoint = (request.endpoint or 'none',)
+    count = sum(stats.statements.values())
+    # streamed bodies are still being built once the response is returned
+    labels = (request.blueprint or 'none', request.method) + endpoint
+    on_sent(lambda: REQUEST_SECONDS.observe(
+        labels, time.perf_counter() - stats.start))
+    DB_SECONDS.observe(endpoint, stats.db)
+    SERIALIZATION_SECONDS.observe(endpoint, stats.serialization)
+    STATEMENTS.observe(endpoint, count)
+
+    threshold = current_app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+    if stats.statements:
+        statement, repeats = stats.statements.most_common(1)[0]
+        if repeats >= threshold:
+            N_PLUS_ONE.inc(endpoint)
+            current_app.logger.warning(
+                "N+1 query on %s %s: ran %d times: %s", request.method,
+                request.path, repeats, ' '.join(statement.split()))
+
+    if current_app.config.get('SERVER_TIMING', True):
+        response.headers.add('Server-Timing', ', '.join([
+            'db;dur={:.2f};desc="{} statements"'.format(stats.db * 1000,
+                                                        count),
+            'serialize;dur={:.2f}'.format(stats.serialization * 1000),
+            'compress;dur={:.2f}'.format(stats.compression * 1000),
+            'app;dur={:.2f}'.format(total * 1000),
+        ]))
+    return response
+
+
+def init_app(app):
+    """
+    Time the requests, the SQL statements and the json encoding they run
+    (see app.encoding), report them in a Server-Timing header and the
+    /metrics histograms, and log the requests repeating a statement (N+1
+    queries).
+    """
+    app.before_request(_start)
+    app.after_request(_finish)
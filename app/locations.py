@@ -1,7 +1,20 @@
-from flask import Blueprint, make_response, request, jsonify, abort
+from flask import Blueprint, make_response, request, abort
 from flask.views import MethodView
 
-from app.models import Location
+from app.bulk import bulk_create
+from app.cache import cached
+from app.encoding import jsonify
+from app.expand import (expand_rows, loader_options, requested_expansions,
+                        serialize_expanded)
+from app.models import Location, Organization
+from app.nested import exists_or_404, get_or_404
+from app.pagination import paginate, paginated_response
+from app.payload import read_payload
+from app.serializers import requested_fields, row_serializer
+from app.search import matching, rank
+from app.streaming import stream_requested, stream_response
+from app.validation import validated
+from app.versions import conditional
 
 
 location_blueprint = Blueprint('location', __name__)
@@ -17,17 +30,16 @@ class LocationView(MethodView):
     /api/organizations/<org_id>/locations/<id> - DELETE
     """
 
+    decorators = [validated(Location), conditional(Location),
+                  cached(Location)]
+
     def post(self, organization_id):
         """
         Create a location and return it as json.
         """
+        exists_or_404((Organization, organization_id))
         try:
-            if request.headers['Content-Type'] == "application/json":
-                payload = request.data
-            elif request.form:
-                payload = request.data.to_dict()
-            else:
-                payload = request.get_json(force=True)
+            payload = read_payload()
 
             if organization_id is not None:
                 payload['organization_id'] = organization_id
@@ -48,49 +60,62 @@ class LocationView(MethodView):
         """
         if location_id is not None:
             # handle get by id
-            location = Location.query.filter_by(id=location_id).first()
-            if not location:
-                abort(404)
-            else:
-                try:
-                    response = location.serialize()
-                    return make_response(jsonify(response)), 200
+            try:
+                fields = requested_fields(Location)
+                expansions = requested_expansions(Location)
+            except ValueError as e:
+                response = {"message": str(e)}
+                return make_response(jsonify(response)), 400
 
-                except Exception as e:
-                    response = {"message": str(e)}
-                    return make_response(jsonify(response)), 400
+            location = get_or_404(
+                (Organization, organization_id), (Location, location_id),
+                options=loader_options(Location, expansions))
+            response = serialize_expanded(location, expansions, fields)
+            return make_response(jsonify(response)), 200
         else:
             # handle get all
-            locations = Location.get_all(organization_id)
-            response = []
-
-            if request.args.get('name'):
-                # search by name
-                location_name = request.args.get('name')
-                results = db.session.query(Location).filter(
-                    Location.name.ilike('%{0}%'.format(location_name)))
-                locations = results
-
-            for location in locations:
-                response.append(location.serialize())
-            return make_response(jsonify(response)), 200
+            exists_or_404((Organization, organization_id))
+            try:
+                fields = requested_fields(Location)
+                expansions = requested_expansions(Location)
+                locations = Location.select(fields).where(
+                    Location.organization_id == organization_id)
+
+                name_rank = None
+                if request.args.get('name'):
+                    # search by name
+                    location_name = request.args.get('name')
+                    locations = locations.where(
+                        matching(Location.name, location_name))
+                    name_rank = rank(Location.name, location_name)
+
+                serialize = row_serializer(Location, fields)
+                if stream_requested():
+                    if expansions:
+                        raise ValueError("expand cannot be used with stream")
+                    return stream_response(locations, Location.id, serialize)
+                page, next_url = paginate(locations, Location.id, name_rank)
+            except ValueError as e:
+                response = {"message": str(e)}
+                return make_response(jsonify(response)), 400
+
+            if expansions:
+                response = expand_rows(Location, page, expansions, fields)
+            else:
+                response = [serialize(row) for row in page]
+            return paginated_response(response, next_url)
 
     def put(self, organization_id, location_id):
         """
         Update an existing location and return a json response of it."""
-        if request.headers['Content-Type'] == "application/json":
-            payload = request.data
-        elif request.form:
-            payload = request.data.to_dict()
-        else:
-            payload = request.get_json(force=True)
-
         if location_id is not None:
+            location = get_or_404((Organization, organization_id),
+                                  (Location, location_id))
             try:
-                location = Location.query.filter_by(id=location_id).first()
+                payload = read_payload()
 
                 for key in payload.keys():
-                    setattr(location, key, request.data.get(key))
+                    setattr(location, key, payload.get(key))
                 location.save()
                 response = location.serialize()
                 return make_response(jsonify(response)), 200
@@ -105,21 +130,35 @@ class LocationView(MethodView):
         """Delete a location given its id."""
 
         if location_id is not None:
-            location = Location.query.filter_by(id=location_id).first()
-            if not location:
-                abort(404)
-            else:
-                try:
-                    location.delete()
-                    return make_response(jsonify({})), 202
+            location = get_or_404((Organization, organization_id),
+                                  (Location, location_id))
+            try:
+                location.delete()
+                return make_response(jsonify({})), 202
 
-                except Exception as e:
-                    res = {"message": str(e)}
-                    return make_response(jsonify(res)), 400
+            except Exception as e:
+                res = {"message": str(e)}
+                return make_response(jsonify(res)), 400
         else:
             abort(404)
 
 
+class LocationBulkView(MethodView):
+    """
+    This class handles bulk requests for the location resource.
+
+    /api/organizations/<org_id>/locations/:bulk - POST
+    """
+
+    def post(self, organization_id):
+        """
+        Create a json array of locations and return the count written and the
+        per-item errors.
+        """
+        exists_or_404((Organization, organization_id))
+        return bulk_create(Location, organization_id=organization_id)
+
+
 location_view = LocationView.as_view('location_view')
 location_blueprint.add_url_rule(
     '/api/organizations/<int:organization_id>/locations/',
@@ -133,3 +172,7 @@ location_blueprint.add_url_rule(
     '/api/organizations/<int:organization_id>/locations/<int:location_id>',
     view_func=location_view,
     methods=['GET', 'PUT', 'DELETE'])
+location_blueprint.add_url_rule(
+    '/api/organizations/<int:organization_id>/locations/:bulk',
+    view_func=LocationBulkView.as_view('location_bulk_view'),
+    methods=['POST'])
@@ -0,0 +1,391 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Blueprint, Response, current_app, request
+
+# seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace(
+        '\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs) + '}'
+
+
+class Metric(object):
+    """
+    The values of a metric by label values, rendered in the Prometheus text
+    format. They are kept per process, and added up with the ones of the
+    other workers when the registry shares a directory with them.
+    """
+    kind = None
+    # whether the values of the workers gone are still counted
+    cumulative = True
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def snapshot(self):
+        """Return the values by label values, as json serializable pairs."""
+        with self._lock:
+            return [[list(labels), value]
+                    for labels, value in self._values.items()]
+
+    def add(self, value, other):
+        """Return the sum of the values of two processes."""
+        return value + other
+
+    def samples(self, values):
+        """Yield the (suffix, label values, extra labels, value) samples."""
+        raise NotImplementedError
+
+    def render(self, snapshots):
+        """Render the sum of the snapshots of the processes."""
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        values = OrderedDict()
+        for snapshot in snapshots:
+            for labels, value in snapshot:
+                labels = tuple(labels)
+                values[labels] = value if labels not in values else \
+                    self.add(values[labels], value)
+        for suffix, labels, extra, value in self.samples(values):
+            lines.append('{}{}{} {}'.format(
+                self.name, suffix, _labels(self.labels, labels, extra),
+                _format(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self, values):
+        for labels, value in values.items():
+            yield '', labels, (), value
+
+
+class Histogram(Metric):
+    """Observations counted in cumulative buckets, with their sum."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(),
+                 buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, labels, value):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0]
+            counts = entry[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            entry[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(labels), [list(counts), total]]
+                    for labels, (counts, total) in self._values.items()]
+
+    def add(self, value, other):
+        return [[count + more for count, more in zip(value[0], other[0])],
+                value[1] + other[1]]
+
+    def samples(self, values):
+        for labels, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield '_bucket', labels, [('le', _format(bound))], cumulative
+            yield '_sum', labels, (), total
+            yield '_count', labels, (), cumulative
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, or that is read when the metrics are
+    rendered from `collect`, a function returning the values by labels.
+    """
+    kind = 'gauge'
+    cumulative = False
+
+    def __init__(self, name, documentation, labels=(), collect=None,
+                 registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.collect = collect
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def snapshot(self):
+        if self.collect is None:
+            return super().snapshot()
+        return [[list(labels), value]
+                for labels, value in self.collect().items()]
+
+    def samples(self, values):
+        for labels, value in values.items():
+            yield '', labels, (), value
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry(object):
+    """
+    The metrics exposed by the /metrics endpoint. With a `directory`, every
+    process writes the snapshot of its metrics there, within `interval`
+    seconds of a change (see changed), and the one answering /metrics adds
+    them all up: the counts of the gunicorn workers, those which exited
+    included, and the gauges of the live ones.
+    """
+
+    def __init__(self, directory=None, interval=1):
+        self.metrics = []
+        self.directory = directory
+        self.interval = interval
+        self._dirty = False
+        # the process the writer thread runs in, none in a forked worker
+        self._writer = None
+        # the app the gauges collected from the database pool need
+        self.app = None
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def write(self):
+        """Write the snapshot of this process to the directory."""
+        path = os.path.join(self.directory, '{}.json'.format(os.getpid()))
+        with self.app.app_context():
+            snapshot = self.snapshot()
+        with open(path + '.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        # the readers never see half a file
+        os.replace(path + '.tmp', path)
+
+    def _write_changes(self):
+        while True:
+            time.sleep(self.interval)
+            if self._dirty:
+                self._dirty = False
+                self.write()
+
+    def changed(self):
+        """Have the snapshot of this process written in the background."""
+        if self.directory is None:
+            return
+        self._dirty = True
+        if self._writer != os.getpid():
+            self._writer = os.getpid()
+            threading.Thread(target=self._write_changes, daemon=True).start()
+            atexit.register(self.write)
+
+    def _others(self):
+        """Yield (alive, snapshot) for the other processes written."""
+        if self.directory is None:
+            return
+        for name in os.listdir(self.directory):
+            pid, ext = os.path.splitext(name)
+            if ext != '.json' or not pid.isdigit() or \
+                    int(pid) == os.getpid():
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                # replaced or removed meanwhile
+                continue
+            yield _alive(int(pid)), snapshot
+
+    def render(self):
+        snapshots = [(True, self.snapshot())] + list(self._others())
+        return '\n'.join(metric.render([
+            snapshot.get(metric.name, ()) for alive, snapshot in snapshots
+            if alive or metric.cumulative]) for metric in self.metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _pool_connections():
+    """Return the connections of the database pool by state."""
+    from app import db
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout'):
+        # sqlite files are not pooled
+        return {}
+    return OrderedDict([
+        (('checked_out',), pool.checkedout()),
+        (('idle',), pool.checkedin()),
+        (('overflow',), max(pool.overflow(), 0)),
+    ])
+
+
+REQUESTS = Counter(
+    'registry_http_requests_total',
+    'Requests answered, by blueprint, method and status',
+    ['blueprint', 'method', 'status'])
+RESPONSE_BYTES = Histogram(
+    'registry_http_response_size_bytes', 'Size of the response bodies',
+    ['blueprint', 'method'],
+    buckets=(100, 1000, 10000, 100000, 1000000, 10000000))
+IN_FLIGHT = Gauge(
+    'registry_http_requests_in_flight', 'Requests being answered')
+POOL_CONNECTIONS = Gauge(
+    'registry_db_pool_connections',
+    'Connections of the database pools, by state',
+    ['state'], collect=_pool_connections)
+
+
+class _Body(object):
+    """
+    The body of a response, observed once it has been sent or closed,
+    whichever comes first.
+    """
+
+    def __init__(self, chunks, done):
+        self.chunks = chunks
+        self.done = done
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.size += len(chunk)
+            yield chunk
+        self._observe()
+
+    def _observe(self):
+        if self.done is not None:
+            done, self.done = self.done, None
+            done(self.size)
+
+    def close(self):
+        try:
+            if hasattr(self.chunks, 'close'):
+                self.chunks.close()
+        finally:
+            self._observe()
+
+
+def on_sent(callback):
+    """
+    Call `callback()` once the response to the current request has been
+    sent, or closed, streamed responses included.
+    """
+    request.environ.setdefault('registry.on_sent', []).append(callback)
+
+
+class MetricsMiddleware(object):
+    """
+    WSGI middleware counting the requests, their status, response size and
+    the requests in flight, and running the on_sent callbacks at the end of
+    the body (app.instrumentation times the requests with them). It only
+    does a few dict updates per request, so it is meant to be left on.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        status = []
+
+        def recording_start_response(code, headers, *args):
+            status.append(code.split(' ', 1)[0])
+            return start_response(code, headers, *args)
+
+        def done(size):
+            labels = (environ.get('registry.blueprint') or 'none',
+                      environ.get('REQUEST_METHOD', ''))
+            REQUESTS.inc(labels + (status[0] if status else '500',))
+            RESPONSE_BYTES.observe(labels, size)
+            IN_FLIGHT.dec()
+            for callback in environ.get('registry.on_sent', ()):
+                callback()
+            REGISTRY.changed()
+
+        IN_FLIGHT.inc()
+        try:
+            chunks = self.wsgi_app(environ, recording_start_response)
+        except Exception:
+            done(0)
+            raise
+        return _Body(chunks, done)
+
+
+def _record(response):
+    # the blueprint is only known to flask
+    request.environ['registry.blueprint'] = request.blueprint
+    if response.status_code >= 500:
+        # the views turn their exceptions into json errors
+        body = response.get_json(silent=True) if not response.is_streamed \
+            else None
+        message = body.get('message') if isinstance(body, dict) else None
+        current_app.logger.error("%s %s failed with %d: %s", request.method,
+                                 request.path, response.status_code, message)
+    return response
+
+
+def init_app(app):
+    """
+    Record the metrics of every request and serve them on /metrics, added
+    up with the ones of the other workers sharing METRICS_DIR, if set.
+    """
+    REGISTRY.app = app
+    REGISTRY.directory = app.config.get('METRICS_DIR')
+    REGISTRY.interval = app.config.get('METRICS_WRITE_INTERVAL', 1)
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app)
+    app.after_request(_record)
+    app.register_blueprint(metrics_blueprint)
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def metrics():
+    """Return the metrics of this process in the Prometheus text format."""
+    return Response(REGISTRY.render(),
+                    mimetype='text/plain; version=0.0.4; charset=utf-8')
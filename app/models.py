@@ -1,28 +1,120 @@
 from app import db
-from flask import current_app
-from sqlalchemy.orm import relationship, class_mapper, ColumnProperty
-import jwt
-from datetime import datetime, timedelta
+from sqlalchemy import DDL, event, func, select, text
+from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm import relationship, validates
+from app.serializers import select_columns, serializer
+from datetime import datetime
+
+
+# the trigram operator classes used by the name search indexes live in the
+# pg_trgm extension, which has to exist before the indexes are created
+CREATE_EXTENSIONS = DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+event.listen(db.metadata, 'before_create',
+             CREATE_EXTENSIONS.execute_if(dialect='postgresql'))
+
+
+def trigram_index(table, column='name'):
+    """
+    Return a GIN trigram index on the given column so that unanchored
+    `ILIKE '%term%'` searches do not scan the table on postgres. Other
+    databases get a plain index.
+    """
+    return db.Index('ix_{}_{}_trgm'.format(table, column), column,
+                    postgresql_using='gin',
+                    postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def parent_index(table, parent='organization_id'):
+    """
+    Return an index on the foreign key to the parent and the name, which
+    the nested collections are filtered on (its leading column also spares
+    the cascading deletes from scanning the table for the children).
+    """
+    return db.Index('ix_{}_{}_name'.format(table, parent), parent, 'name')
+
+
+def point_index(table):
+    """
+    Return a GiST index of the points of the given table, which the
+    distance searches of app.geo seek into on postgres. Other databases
+    have no point function: it is left out of the tables they create and
+    they search the in-process grid of app.geo instead.
+    """
+    return db.Index('ix_{}_point'.format(table),
+                    func.point(text('longitude'), text('latitude')),
+                    postgresql_using='gist', info={'postgresql_only': True})
+
+
+def _hide_postgresql_indexes(table, connection, **kw):
+    if connection.dialect.name != 'postgresql':
+        hidden = {index for index in table.indexes
+                  if index.info.get('postgresql_only')}
+        table.indexes -= hidden
+        table.info['hidden_indexes'] = hidden
+
+
+def _restore_indexes(table, connection, **kw):
+    table.indexes |= table.info.pop('hidden_indexes', set())
+
+
+# the columns maintained by the models themselves
+READ_ONLY = ('version', 'created_at', 'updated_at')
 
 
 class BaseMixin(object):
     """
     This mixin defines a serializer to map a queryset object into a dict.
 
-    Returns: an iterable list of column names with their corresponding values.
+    Returns: an iterable list of column names with their corresponding values,
+    optionally narrowed down to the given field names.
+
+    It also gives every row a version, bumped by each update, which the
+    ETags of the responses are derived from (see app.versions), and the
+    creation and last update times the change feed is read from (see
+    app.changes).
     """
-    def serialize(self):
-        result = {}
-        for prop in class_mapper(self.__class__).iterate_properties:
-            if isinstance(prop, ColumnProperty):
-                result[prop.key] = getattr(self, prop.key)
-        return result
+    # declared lazily so the columns come after the ones of the model
+    @declared_attr
+    def version(cls):
+        return db.Column(db.Integer, nullable=False, server_default='1')
+
+    @declared_attr
+    def created_at(cls):
+        return db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                         server_default=func.now())
+
+    @declared_attr
+    def updated_at(cls):
+        return db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                         onupdate=datetime.utcnow, server_default=func.now(),
+                         index=True)
+
+    @declared_attr
+    def __mapper_args__(cls):
+        return {'version_id_col': cls.version}
+
+    @validates(*READ_ONLY)
+    def validate_read_only(self, key, value):
+        raise ValueError("{} is read only".format(key))
+
+    def serialize(self, fields=None):
+        return serializer(self.__class__, fields)(self)
+
+    @classmethod
+    def select(cls, fields=None):
+        """
+        Return a Core select of the columns backing the given fields, for
+        read paths that turn rows straight into dicts without loading ORM
+        instances (see app.serializers.row_serializer).
+        """
+        return select(select_columns(cls, fields))
 
 
 class Organization(db.Model, BaseMixin):
     """This class defines an organization table."""
 
     __tablename__ = 'organization'
+    __table_args__ = (trigram_index('organization'),)
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
@@ -32,11 +124,11 @@ class Organization(db.Model, BaseMixin):
     year_incorporated = db.Column(db.DateTime, nullable=True)
 
     program = relationship("Program", backref="organization",
-                           passive_deletes=True)
+                           passive_deletes=True, order_by="Program.id")
     location = relationship("Location", backref="organization",
-                            passive_deletes=True)
+                            passive_deletes=True, order_by="Location.id")
     service = relationship("Service", backref="organization",
-                           passive_deletes=True)
+                           passive_deletes=True, order_by="Service.id")
 
     def __init__(self, name, description, email=None, url=None,
                  year_incorporated=None):
@@ -56,9 +148,10 @@ class Organization(db.Model, BaseMixin):
         return Organization.query.all()
 
     def delete(self):
-        """Delete an org."""
-        db.session.delete(self)
-        db.session.commit()
+        """Delete an org along with everything under it."""
+        # app.deletes depends on the models
+        from app.deletes import delete
+        delete(Organization, [self.id])
 
     def __repr__(self):
         """Return a representation of the model instance."""
@@ -69,6 +162,7 @@ class Program(db.Model, BaseMixin):
     """This class defines the program table."""
 
     __tablename__ = 'program'
+    __table_args__ = (trigram_index('program'), parent_index('program'))
 
     id = db.Column(db.Integer, primary_key=True)
     organization_id = db.Column(db.Integer, db.ForeignKey(Organization.id,
@@ -93,9 +187,10 @@ class Program(db.Model, BaseMixin):
         db.session.commit()
 
     def delete(self):
-        """Delete a given program."""
-        db.session.delete(self)
-        db.session.commit()
+        """Delete a given program along with its services."""
+        # app.deletes depends on the models
+        from app.deletes import delete
+        delete(Program, [self.id])
 
     def __repr__(self):
         """Return a representation of the program model instance."""
@@ -106,6 +201,8 @@ class Service(db.Model, BaseMixin):
     """This class represents a service table."""
 
     __tablename__ = 'service'
+    __table_args__ = (trigram_index('service'), parent_index('service'),
+                      parent_index('service', 'program_id'))
 
     id = db.Column(db.Integer, primary_key=True)
     organization_id = db.Column(db.Integer, db.ForeignKey(Organization.id,
@@ -142,9 +239,10 @@ class Service(db.Model, BaseMixin):
         db.session.commit()
 
     def delete(self):
-        """Delete a given program."""
-        db.session.delete(self)
-        db.session.commit()
+        """Delete a given service along with its locations."""
+        # app.deletes depends on the models
+        from app.deletes import delete
+        delete(Service, [self.id])
 
     def __repr__(self):
         """Return a representation of the service model instance."""
@@ -155,6 +253,8 @@ class Location(db.Model, BaseMixin):
     """This class defines a location model."""
 
     __tablename__ = "location"
+    __table_args__ = (trigram_index('location'), parent_index('location'),
+                      point_index('location'))
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -163,11 +263,13 @@ class Location(db.Model, BaseMixin):
     alternate_name = db.Column(db.String(100), nullable=True)
     description = db.Column(db.String(100), nullable=True)
     transportation = db.Column(db.String(256), nullable=True)
-    latitude = db.Column(db.Integer, nullable=True)
-    longitude = db.Column(db.Integer, nullable=True)
+    # degrees, searched by distance through app.geo
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
 
     address = relationship("PhysicalAddress", backref="location",
-                           passive_deletes=True)
+                           passive_deletes=True,
+                           order_by="PhysicalAddress.id")
 
     def __init__(self, name, organization_id, alternate_name=None,
                  description=None, transportation=None, latitude=None,
@@ -181,6 +283,20 @@ class Location(db.Model, BaseMixin):
         self.latitude = latitude
         self.longitude = longitude
 
+    @validates('latitude', 'longitude')
+    def validate_coordinate(self, key, value):
+        """Store coordinates as floats within the range of their axis."""
+        if value is None or value == '':
+            return None
+        limit = 90 if key == 'latitude' else 180
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid {}: {}".format(key, value))
+        if not -limit <= value <= limit:
+            raise ValueError("Invalid {}: {}".format(key, value))
+        return value
+
     def save(self):
         """Save a location when creating a new one."""
         db.session.add(self)
@@ -192,23 +308,36 @@ class Location(db.Model, BaseMixin):
         return Location.query.filter_by(organization_id=organization_id)
 
     def delete(self):
-        """Delete a location."""
-        db.session.delete(self)
-        db.session.commit()
+        """Delete a location along with its addresses."""
+        # app.deletes depends on the models
+        from app.deletes import delete
+        delete(Location, [self.id])
 
     def __repr__(self):
         """Return a representation of the model instance."""
         return "{}: {}".format(self.id, self.name)
 
 
+# create_all leaves the point index out off postgres
+event.listen(Location.__table__, 'before_create', _hide_postgresql_indexes)
+event.listen(Location.__table__, 'after_create', _restore_indexes)
+
+
 class ServiceLocation(db.Model, BaseMixin):
     """This class defines a representation of the service at location table."""
 
     __tablename__ = "service_location"
+    # a service is offered once at a location, the index on the pair serves
+    # the lookups by service and the other one those by location
+    __table_args__ = (db.Index('ix_service_location_service_id_location_id',
+                               'service_id', 'location_id', unique=True),)
 
     id = db.Column(db.Integer, primary_key=True)
-    service_id = db.Column(db.Integer, db.ForeignKey(Service.id))
-    location_id = db.Column(db.Integer, db.ForeignKey(Location.id))
+    service_id = db.Column(db.Integer, db.ForeignKey(Service.id,
+                                                     ondelete='CASCADE'))
+    location_id = db.Column(db.Integer, db.ForeignKey(Location.id,
+                                                      ondelete='CASCADE'),
+                            index=True)
     description = db.Column(db.String(100), nullable=False)
 
     def __init__(self, service_id, location_id, description=None):
@@ -233,7 +362,8 @@ class PhysicalAddress(db.Model, BaseMixin):
 
     id = db.Column(db.Integer, primary_key=True)
     location_id = db.Column(db.Integer, db.ForeignKey(Location.id,
-                                                      ondelete='CASCADE'))
+                                                      ondelete='CASCADE'),
+                            index=True)
     address = db.Column(db.String(100), nullable=False)
     city = db.Column(db.String(100), nullable=False)
     state = db.Column(db.String(20), nullable=False)
@@ -259,3 +389,41 @@ class PhysicalAddress(db.Model, BaseMixin):
         """Return a representation of the model instance."""
         return "{}: {}, {} {}".format(self.id, self.address, self.city,
                                       self.postal_code)
+
+
+class CollectionVersion(db.Model):
+    """
+    This class defines the version counters of the collections, bumped
+    once the writes to their rows commit (see app.versions).
+    """
+
+    __tablename__ = "collection_version"
+
+    key = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        """Return a representation of the model instance."""
+        return "{}: {}".format(self.key, self.version)
+
+
+class Tombstone(db.Model):
+    """
+    This class defines the record of a deleted row, kept for the change
+    feed (see app.changes).
+    """
+
+    __tablename__ = "tombstone"
+    __table_args__ = (db.Index('ix_tombstone_table_name_deleted_at',
+                               'table_name', 'deleted_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False,
+                           default=datetime.utcnow)
+
+    def __repr__(self):
+        """Return a representation of the model instance."""
+        return "{} {}: {}".format(self.table_name, self.row_id,
+                                  self.deleted_at)
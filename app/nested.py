@@ -0,0 +1,50 @@
+from flask import abort
+
+from app import db
+
+
+def _criteria(chain):
+    """
+    Return the (model, id) pairs of a parent chain that carry an id, and the
+    criteria selecting every one of them while requiring each model to
+    reference the ancestors it has a foreign key to.
+    """
+    chain = [(model, pk) for model, pk in chain if pk is not None]
+    criteria = []
+    for position, (model, pk) in enumerate(chain):
+        criteria.append(model.id == pk)
+        for parent, parent_pk in chain[:position]:
+            for fk in model.__table__.foreign_keys:
+                if fk.column.table is parent.__table__:
+                    criteria.append(fk.parent == parent_pk)
+    return chain, criteria
+
+
+def get_or_404(*chain, options=()):
+    """
+    Return the instance named by the last (model, id) pair of a nested route,
+    e.g. ((Organization, 1), (Location, 2), (PhysicalAddress, 3)).
+
+    The whole chain is validated in a single query: every parent has to exist
+    and each child has to belong to its parents, otherwise the request is
+    aborted with a 404. Pairs whose id is None are skipped, which covers
+    routes with an optional level such as services outside of a program.
+    Loader `options` are applied to the query.
+    """
+    chain, criteria = _criteria(chain)
+    instance = db.session.query(chain[-1][0]).options(*options).filter(
+        *criteria).first()
+    if instance is None:
+        abort(404)
+    return instance
+
+
+def exists_or_404(*chain):
+    """
+    Abort with a 404 unless every (model, id) pair of a parent chain exists
+    and belongs to its parents, checked in a single query.
+    """
+    chain, criteria = _criteria(chain)
+    found = db.session.query(chain[-1][0].id).filter(*criteria).first()
+    if found is None:
+        abort(404)
@@ -1,7 +1,20 @@
-from flask import Blueprint, make_response, request, jsonify, abort
+from flask import Blueprint, make_response, request, abort
 from flask.views import MethodView
 
-from app.models import Organization, db
+from app.bulk import bulk_create
+from app.cache import cached
+from app.deletes import delete
+from app.encoding import jsonify
+from app.expand import (expand_rows, loader_options, requested_expansions,
+                        serialize_expanded)
+from app.models import Organization
+from app.pagination import paginate, paginated_response
+from app.payload import read_payload
+from app.serializers import requested_fields, row_serializer
+from app.search import matching, rank
+from app.streaming import stream_requested, stream_response
+from app.validation import validated
+from app.versions import conditional
 
 
 org_blueprint = Blueprint('organization', __name__)
@@ -10,18 +23,16 @@ org_blueprint = Blueprint('organization', __name__)
 class OrganizationView(MethodView):
     """This class-based handles api requests for the organization resource."""
 
+    decorators = [validated(Organization), conditional(Organization),
+                  cached(Organization)]
+
     def post(self):
         """
         Create an organization and return the json response containing it
         """
         try:
             # Create the organization
-            if request.headers['Content-Type'] == "application/json":
-                payload = request.get_json(silent=True)
-            elif request.form:
-                payload = request.data.to_dict()
-            else:
-                payload = request.get_json(force=True)
+            payload = read_payload()
             organization = Organization(**payload)
             organization.save()
             response = organization.serialize()
@@ -39,41 +50,55 @@ class OrganizationView(MethodView):
         query params
         """
         if organization_id is None:
-            # Expose a list of organizations
-            organizations = Organization.get_all()
-            if organizations is None:
-                abort(404)
-            if request.args.get('name'):
-                # search by name
-                org_name = request.args.get('name')
-                results = db.session.query(Organization).filter(
-                    Organization.name.ilike('%{0}%'.format(org_name)))
-                organizations = results
-
-            response = []
-            for org in organizations:
-                response.append(org.serialize())
+            # Expose a list of organizations, one page at a time
+            try:
+                fields = requested_fields(Organization)
+                expansions = requested_expansions(Organization)
+                organizations = Organization.select(fields)
+                name_rank = None
+                if request.args.get('name'):
+                    # search by name
+                    org_name = request.args.get('name')
+                    organizations = organizations.where(
+                        matching(Organization.name, org_name))
+                    name_rank = rank(Organization.name, org_name)
+
+                serialize = row_serializer(Organization, fields)
+                if stream_requested():
+                    if expansions:
+                        raise ValueError("expand cannot be used with stream")
+                    return stream_response(organizations, Organization.id,
+                                           serialize)
+                page, next_url = paginate(organizations, Organization.id,
+                                          name_rank)
+            except ValueError as e:
+                response = {"message": str(e)}
+                return make_response(jsonify(response)), 400
 
-            return make_response(jsonify(response)), 200
+            if expansions:
+                response = expand_rows(Organization, page, expansions, fields)
+            else:
+                response = [serialize(row) for row in page]
+            return paginated_response(response, next_url)
 
         else:
-            # Expose a single organization
+            # Expose a single organization, with the collections to expand
             try:
-                organization = Organization.query.filter_by(
-                    id=organization_id).first()
-                if not organization:
-                    abort(404)
-                else:
-                    try:
-                        response = organization.serialize()
-                        return make_response(jsonify(response)), 200
-                    except Exception as e:
-                        response = {
-                            "message": str(e)
-                        }
-                        return make_response(jsonify(response)), 400
-            except Exception as e:
+                fields = requested_fields(Organization)
+                expansions = requested_expansions(Organization)
+            except ValueError as e:
+                response = {
+                    "message": str(e)
+                }
+                return make_response(jsonify(response)), 400
+
+            organization = Organization.query.options(
+                *loader_options(Organization, expansions)).filter_by(
+                id=organization_id).first()
+            if not organization:
                 abort(404)
+            response = serialize_expanded(organization, expansions, fields)
+            return make_response(jsonify(response)), 200
 
     def put(self, organization_id):
         """Update an organization given its id."""
@@ -83,12 +108,7 @@ class OrganizationView(MethodView):
                 # return a 404 if org does not exist
                 abort(404) if org is None else org
 
-                if request.headers['Content-Type'] == "application/json":
-                    payload = request.data
-                elif request.form:
-                    payload = request.data.to_dict()
-                else:
-                    payload = request.get_json(force=True)
+                payload = read_payload()
 
                 for key in payload.keys():
                     setattr(org, key, payload.get(key))
@@ -107,13 +127,11 @@ class OrganizationView(MethodView):
     def delete(self, organization_id):
         """Delete an organization given its id."""
         if organization_id is not None:
-            # fetch org to delete
             try:
-                org = Organization.query.filter_by(id=organization_id).first()
-                # return 404 if org does not exist
-                abort(404) if org is None else org
+                # nothing under the org is loaded
+                if not delete(Organization, [organization_id]):
+                    abort(404)
 
-                org.delete()
                 response = {
                     "message": "Organization successfully deleted."""
                 }
@@ -127,6 +145,21 @@ class OrganizationView(MethodView):
                 return make_response(jsonify(response)), 400
 
 
+class OrganizationBulkView(MethodView):
+    """
+    This class handles bulk requests for the organization resource.
+
+    /api/organizations/:bulk - POST
+    """
+
+    def post(self):
+        """
+        Create (or with ?upsert=true, update by name) a json array of
+        organizations and return the count written and the per-item errors.
+        """
+        return bulk_create(Organization)
+
+
 organization_view = OrganizationView.as_view('organization_view')
 org_blueprint.add_url_rule(
     '/api/organizations/', defaults={'organization_id': None},
@@ -140,3 +173,8 @@ org_blueprint.add_url_rule(
 org_blueprint.add_url_rule(
     '/api/organizations/', view_func=organization_view,
     methods=['POST', ])
+
+org_blueprint.add_url_rule(
+    '/api/organizations/:bulk',
+    view_func=OrganizationBulkView.as_view('organization_bulk_view'),
+    methods=['POST'])
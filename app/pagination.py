@@ -0,0 +1,125 @@
+import base64
+from urllib.parse import urlencode
+
+from flask import Response, current_app, make_response, request
+from sqlalchemy import and_, or_
+
+from app import db
+from app.encoding import NDJSON, jsonify, ndjson_lines, ndjson_requested
+
+
+def encode_cursor(value):
+    """Return an opaque cursor for the given primary key value."""
+    raw = str(value).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, parse=int):
+    """
+    Return the value wrapped by a cursor (the primary key by default) or
+    None when no cursor was given. Raises a ValueError for cursors not
+    issued by this API.
+    """
+    if not cursor:
+        return None
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        raw = base64.urlsafe_b64decode((cursor + padding).encode('ascii'))
+        return parse(raw.decode('utf-8'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("Invalid cursor: {}".format(cursor))
+
+
+def _parse_ranked(value):
+    """Parse the `<rank>:<id>` key of a cursor into a ranked result set."""
+    rank, pk = value.split(':')
+    return int(rank), int(pk)
+
+
+def get_limit():
+    """Return the page size requested through the `limit` query param."""
+    default = current_app.config.get('PAGINATION_DEFAULT_LIMIT', 100)
+    maximum = current_app.config.get('PAGINATION_MAX_LIMIT', 1000)
+    limit = request.args.get('limit')
+    if limit is None:
+        return default
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError("Invalid limit: {}".format(limit))
+    if limit < 1:
+        raise ValueError("Invalid limit: {}".format(limit))
+    return min(limit, maximum)
+
+
+def next_link(cursor):
+    """Return the url of the current request with `after` set to cursor."""
+    args = [(key, value) for key, value in request.args.items(multi=True)
+            if key != 'after']
+    args.append(('after', cursor))
+    return '{}?{}'.format(request.base_url, urlencode(args))
+
+
+def paginate(statement, column, rank=None):
+    """
+    Return one page of rows selected by a Core select statement together
+    with the link to the next page.
+
+    Rows are ordered by `column` (the primary key) and the page starts right
+    after the row named by the `after` cursor, so the database seeks straight
+    into the index no matter how deep into the collection the client is.
+    The link is None on the last page.
+
+    When an integer `rank` expression is given (see app.search), rows are
+    ordered by rank first and the cursor carries both the rank and the
+    primary key of the last row.
+    """
+    if rank is not None:
+        return _paginate_ranked(statement, column, rank)
+    limit = get_limit()
+    after = decode_cursor(request.args.get('after'))
+    if after is not None:
+        statement = statement.where(column > after)
+    # fetch one extra row to know whether there is a next page
+    rows = db.session.execute(
+        statement.order_by(column).limit(limit + 1)).fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, next_link(encode_cursor(rows[-1][column.key]))
+
+
+def _paginate_ranked(statement, column, rank):
+    """Return a page of the statement rows ordered by (rank, column)."""
+    limit = get_limit()
+    after = decode_cursor(request.args.get('after'), parse=_parse_ranked)
+    if after is not None:
+        after_rank, after_pk = after
+        statement = statement.where(or_(
+            rank > after_rank, and_(rank == after_rank, column > after_pk)))
+    statement = statement.column(rank.label('_rank'))
+    rows = db.session.execute(
+        statement.order_by(rank, column).limit(limit + 1)).fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    cursor = encode_cursor('{}:{}'.format(last['_rank'], last[column.key]))
+    return rows, next_link(cursor)
+
+
+def paginated_response(response, next_url, status=200):
+    """
+    Return the json response for a page, advertising the next page. Its
+    rows are sent as json lines to the clients accepting
+    application/x-ndjson.
+    """
+    if ndjson_requested():
+        res = Response(ndjson_lines(response), mimetype=NDJSON)
+    else:
+        res = make_response(jsonify(response))
+    # shared caches keep both representations
+    res.vary.add('Accept')
+    if next_url is not None:
+        res.headers['Link'] = '<{}>; rel="next"'.format(next_url)
+    return res, status
@@ -0,0 +1,80 @@
+import json
+
+from flask import current_app, request
+
+try:
+    import msgpack
+except ImportError:
+    # optional, msgpack bodies are refused without it
+    msgpack = None
+
+FORM_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+# bodies sent without a content type (or as text) are read as json
+JSON_TYPES = ('application/json', 'text/plain', '')
+
+# where the decoded body is kept for the rest of the request
+ENVIRON_KEY = 'registry.payload'
+
+
+class PayloadError(Exception):
+    """A body that cannot be read, with the status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _check_size():
+    limit = current_app.config.get('MAX_CONTENT_LENGTH')
+    length = request.content_length
+    if limit is not None and length is not None and length > limit:
+        raise PayloadError(
+            "Request body larger than {} bytes".format(limit), 413)
+
+
+def _decode():
+    _check_size()
+    mimetype = request.mimetype
+    if mimetype in FORM_TYPES:
+        # every value of a form is a string
+        return request.form.to_dict()
+    if mimetype not in JSON_TYPES and mimetype not in MSGPACK_TYPES and \
+            not mimetype.endswith('+json'):
+        raise PayloadError("Unsupported content type: {}".format(mimetype),
+                           415)
+
+    body = request.get_data(cache=False)
+    if not body:
+        return None
+    if mimetype in MSGPACK_TYPES:
+        if msgpack is None:
+            raise PayloadError("msgpack bodies are not supported", 415)
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise PayloadError("Invalid msgpack: {}".format(e))
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise PayloadError("Invalid json: {}".format(e))
+
+
+def read_payload():
+    """
+    Return the body of the request decoded from json, a form or msgpack,
+    according to its content type, or None when it is empty.
+
+    The body is decoded once, the first time it is asked for, and kept for
+    the rest of the request. PayloadError is raised for the bodies over
+    MAX_CONTENT_LENGTH (413), of another content type (415) or malformed.
+    """
+    environ = request.environ
+    if ENVIRON_KEY not in environ:
+        environ[ENVIRON_KEY] = _decode()
+    return environ[ENVIRON_KEY]
+
+
+def from_form():
+    """Tell whether the body of the request is a form."""
+    return request.mimetype in FORM_TYPES
@@ -1,7 +1,16 @@
-from flask import Blueprint, make_response, request, jsonify, abort
+from flask import Blueprint, make_response, abort
 from flask.views import MethodView
 
+from app.cache import cached
+from app.encoding import jsonify
 from app.models import PhysicalAddress, Organization, Location
+from app.nested import exists_or_404, get_or_404
+from app.pagination import paginate, paginated_response
+from app.payload import read_payload
+from app.serializers import requested_fields, row_serializer
+from app.streaming import stream_requested, stream_response
+from app.validation import validated
+from app.versions import conditional
 
 address_blueprint = Blueprint('address', __name__)
 
@@ -16,30 +25,21 @@ class PhysicalAddressView(MethodView):
     /api/organizations/<org_id>/locations/<location_id>/addresses/<id> - DELETE
     """
 
+    decorators = [validated(PhysicalAddress), conditional(PhysicalAddress),
+                  cached(PhysicalAddress)]
+
     def post(self, organization_id, location_id):
         """Create an address and return a json response of it."""
 
+        exists_or_404((Organization, organization_id), (Location, location_id))
         try:
-            if request.headers['Content-Type'] == "application/json":
-                payload = request.data
-            elif request.form:
-                payload = request.data.to_dict()
-            else:
-                payload = request.get_json(force=True)
-
-            if organization_id is not None:
-                org = Organization.query.filter_by(id=organization_id).first()
-                if not org:
-                    abort(404)
-                else:
-                    if location_id is not None:
-                        payload['location_id'] = location_id
-                        address = PhysicalAddress(**payload)
-                        address.save()
-                        response = address.serialize()
-                        return make_response(jsonify(response)), 201
-                    else:
-                        abort(404)
+            payload = read_payload()
+
+            payload['location_id'] = location_id
+            address = PhysicalAddress(**payload)
+            address.save()
+            response = address.serialize()
+            return make_response(jsonify(response)), 201
         except Exception as e:
             response = {"message": str(e)}
             return make_response(jsonify(response)), 400
@@ -47,56 +47,48 @@ class PhysicalAddressView(MethodView):
     def get(self, organization_id, location_id, address_id):
         """Retrieve an address, returning it as json."""
 
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
-            abort(404)
-        else:
-            loc = Location.query.filter_by(id=location_id).first()
-            if not loc:
-                abort(404)
         if address_id is not None:
             # get the address by id
-            address = PhysicalAddress.query.filter_by(id=address_id).first()
-            if not address:
-                abort(404)
-            else:
-                try:
-                    res = address.serialize()
-                    return make_response(jsonify(res)), 200
-                except Exception as e:
-                    res = {"message": str(e)}
-                    return make_response(jsonify(res)), 400
+            address = get_or_404((Organization, organization_id),
+                                 (Location, location_id),
+                                 (PhysicalAddress, address_id))
+            try:
+                res = address.serialize(requested_fields(PhysicalAddress))
+                return make_response(jsonify(res)), 200
+            except Exception as e:
+                res = {"message": str(e)}
+                return make_response(jsonify(res)), 400
         else:
             # get all addresses
-            addresses = PhysicalAddress.get_all(location_id)
-            res = [address.serialize() for address in addresses]
-            return make_response(jsonify(res)), 200
+            exists_or_404((Organization, organization_id),
+                          (Location, location_id))
+            try:
+                fields = requested_fields(PhysicalAddress)
+                addresses = PhysicalAddress.select(fields).where(
+                    PhysicalAddress.location_id == location_id)
+                serialize = row_serializer(PhysicalAddress, fields)
+                if stream_requested():
+                    return stream_response(addresses, PhysicalAddress.id,
+                                           serialize)
+                page, next_url = paginate(addresses, PhysicalAddress.id)
+            except ValueError as e:
+                res = {"message": str(e)}
+                return make_response(jsonify(res)), 400
+            res = [serialize(row) for row in page]
+            return paginated_response(res, next_url)
 
     def put(self, organization_id, location_id, address_id):
         """Update an address and return it as json."""
 
-        if request.headers['Content-Type'] == "application/json":
-            payload = request.data
-        elif request.form:
-            payload = request.data.to_dict()
-        else:
-            payload = request.get_json(force=True)
-
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
-            abort(404)
-        else:
-            loc = Location.query.filter_by(id=location_id).first()
-            if not loc:
-                abort(404)
-
         if address_id is not None:
+            address = get_or_404((Organization, organization_id),
+                                 (Location, location_id),
+                                 (PhysicalAddress, address_id))
             try:
-                address = PhysicalAddress.query.filter_by(
-                    id=address_id).first()
+                payload = read_payload()
 
                 for key in payload.keys():
-                    setattr(address, key, request.data.get(key))
+                    setattr(address, key, payload.get(key))
                 address.save()
                 res = address.serialize()
                 return make_response(jsonify(res)), 200
@@ -109,25 +101,16 @@ class PhysicalAddressView(MethodView):
     def delete(self, organization_id, location_id, address_id):
         """Delete an address given its id."""
 
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
-            abort(404)
-        else:
-            loc = Location.query.filter_by(id=location_id).first()
-            if not loc:
-                abort(404)
-
         if address_id is not None:
-            address = PhysicalAddress.query.filter_by(id=address_id).first()
-            if not address:
-                abort(404)
-            else:
-                try:
-                    address.delete()
-                    return make_response(jsonify({})), 202
-                except Exception as e:
-                    res = {"message": str(e)}
-                    return make_response(jsonify(res)), 500
+            address = get_or_404((Organization, organization_id),
+                                 (Location, location_id),
+                                 (PhysicalAddress, address_id))
+            try:
+                address.delete()
+                return make_response(jsonify({})), 202
+            except Exception as e:
+                res = {"message": str(e)}
+                return make_response(jsonify(res)), 500
         else:
             abort(404)
 
@@ -1,7 +1,18 @@
-from flask import Blueprint, make_response, request, jsonify, abort
+from flask import Blueprint, make_response, request, abort
 from flask.views import MethodView
 
-from app.models import db, Program, Organization
+from app.bulk import bulk_create
+from app.cache import cached
+from app.encoding import jsonify
+from app.models import Program, Organization
+from app.nested import exists_or_404, get_or_404
+from app.pagination import paginate, paginated_response
+from app.payload import read_payload
+from app.serializers import requested_fields, row_serializer
+from app.search import matching, rank
+from app.streaming import stream_requested, stream_response
+from app.validation import validated
+from app.versions import conditional
 
 
 program_blueprint = Blueprint('program', __name__)
@@ -16,86 +27,78 @@ class ProgramView(MethodView):
     /api/organizations/<org_id>/programs/<id> - DELETE
     """
 
+    decorators = [validated(Program), conditional(Program),
+                  cached(Program)]
+
     def post(self, organization_id):
         """
         Create a program and return a json response containing it.
         """
 
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
-            abort(404)
-        else:
-            try:
-                if request.headers['Content-Type'] == "application/json":
-                    payload = request.get_json(silent=True)
-                elif request.form:
-                    payload = request.data.to_dict()
-                else:
-                    payload = request.get_json(force=True)
-
-                payload['organization_id'] = organization_id
-                program = Program(**payload)
-                program.save()
-                response = program.serialize()
-                return make_response(jsonify(response)), 201
-            except Exception as e:
-                response = {"message": str(e)}
-                return make_response(jsonify(response)), 400
+        exists_or_404((Organization, organization_id))
+        try:
+            payload = read_payload()
+
+            payload['organization_id'] = organization_id
+            program = Program(**payload)
+            program.save()
+            response = program.serialize()
+            return make_response(jsonify(response)), 201
+        except Exception as e:
+            response = {"message": str(e)}
+            return make_response(jsonify(response)), 400
 
     def get(self, organization_id, program_id):
         """
         Get an existing program(s) and return as a json response
         """
 
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
-            abort(404)
-
         if program_id is not None:
             # handle the get by id
-            program = Program.query.filter_by(id=program_id).first()
-            if not program:
-                abort(404)
-            else:
-                try:
-                    response = program.serialize()
-                    return make_response(jsonify(response)), 200
-
-                except Exception as e:
-                    response = {"message": str(e)}
-                    return make_response(jsonify(response)), 400
+            program = get_or_404((Organization, organization_id),
+                                 (Program, program_id))
+            try:
+                response = program.serialize(requested_fields(Program))
+                return make_response(jsonify(response)), 200
+
+            except Exception as e:
+                response = {"message": str(e)}
+                return make_response(jsonify(response)), 400
         else:
             # handle get all
-            programs = Program.query.filter_by(organization_id=organization_id)
-
-            if request.args.get('name'):
-                # Search by name
-                search_query = request.args.get('name')
-                search_results = db.session.query(Program).filter(
-                    Program.name.ilike('%{0}%'.format(search_query)))
-                programs = search_results
-            response = [prog.serialize() for prog in programs]
+            exists_or_404((Organization, organization_id))
+            try:
+                fields = requested_fields(Program)
+                programs = Program.select(fields).where(
+                    Program.organization_id == organization_id)
+
+                name_rank = None
+                if request.args.get('name'):
+                    # Search by name
+                    search_query = request.args.get('name')
+                    programs = programs.where(
+                        matching(Program.name, search_query))
+                    name_rank = rank(Program.name, search_query)
+
+                serialize = row_serializer(Program, fields)
+                if stream_requested():
+                    return stream_response(programs, Program.id, serialize)
+                page, next_url = paginate(programs, Program.id, name_rank)
+            except ValueError as e:
+                response = {"message": str(e)}
+                return make_response(jsonify(response)), 400
+            response = [serialize(row) for row in page]
 
-            return make_response(jsonify(response)), 200
+            return paginated_response(response, next_url)
 
     def put(self, organization_id, program_id):
         """Update an existing program and return a json response."""
 
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
-            abort(404)
-
         if program_id is not None:
+            program = get_or_404((Organization, organization_id),
+                                 (Program, program_id))
             try:
-                response = {}
-                program = Program.query.filter_by(id=program_id).first()
-
-                if request.headers['Content-Type'] == "application/json":
-                    payload = request.data
-                elif request.form:
-                    payload = request.data.to_dict()
-                else:
-                    payload = request.get_json(force=True)
+                payload = read_payload()
 
                 for key in payload.keys():
                     setattr(program, key, payload.get(key))
@@ -105,8 +108,6 @@ class ProgramView(MethodView):
                 return make_response(jsonify(response)), 200
 
             except Exception as e:
-                if not program:
-                    abort(404)
                 response = {"message": str(e)}
                 return make_response(jsonify(response)), 400
         else:
@@ -115,22 +116,34 @@ class ProgramView(MethodView):
     def delete(self, organization_id, program_id):
         """Delete a program given its id."""
 
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
+        if program_id is not None:
+            prog = get_or_404((Organization, organization_id),
+                              (Program, program_id))
+            try:
+                prog.delete()
+                return make_response(jsonify({})), 202
+
+            except Exception as e:
+                response = {"message": str(e)}
+                return make_response(jsonify(response)), 400
+        else:
             abort(404)
 
-        if program_id is not None:
-            prog = Program.query.filter_by(id=program_id).first()
-            if not prog:
-                abort(404)
-            else:
-                try:
-                    prog.delete()
-                    return make_response(jsonify({})), 202
 
-                except Exception as e:
-                    response = {"message": str(e)}
-                    return make_response(jsonify(response)), 400
+class ProgramBulkView(MethodView):
+    """
+    This class handles bulk requests for the program resource.
+
+    /api/organizations/<org_id>/programs/:bulk - POST
+    """
+
+    def post(self, organization_id):
+        """
+        Create a json array of programs and return the count written and the
+        per-item errors.
+        """
+        exists_or_404((Organization, organization_id))
+        return bulk_create(Program, organization_id=organization_id)
 
 
 program_view = ProgramView.as_view('program_view')
@@ -146,3 +159,7 @@ program_blueprint.add_url_rule(
     '/api/organizations/<int:organization_id>/programs/<int:program_id>',
     view_func=program_view,
     methods=['GET', 'PUT', 'DELETE'])
+program_blueprint.add_url_rule(
+    '/api/organizations/<int:organization_id>/programs/:bulk',
+    view_func=ProgramBulkView.as_view('program_bulk_view'),
+    methods=['POST'])
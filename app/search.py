@@ -0,0 +1,44 @@
+from sqlalchemy import Integer, case, cast, func
+
+from app import db
+
+
+def escape_like(term):
+    """Escape the LIKE wildcards in a user supplied search term."""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def matching(column, term):
+    """
+    Return the criterion selecting rows whose `column` contains `term`.
+
+    On postgres the unanchored ILIKE is answered from the pg_trgm GIN index
+    declared on the name columns in app.models instead of a sequential scan.
+    """
+    return column.ilike('%{}%'.format(escape_like(term)), escape='\\')
+
+
+def rank(column, term):
+    """
+    Return an integer expression ranking how well `column` matches `term`,
+    lower being better.
+
+    Postgres ranks by trigram similarity (scaled to 0-1000 so the rank can
+    be carried in a pagination cursor). Other databases fall back to
+    tiers: exact match, prefix match, word prefix match, anywhere else.
+    """
+    if _is_postgres():
+        return cast((1 - func.similarity(column, term)) * 1000, Integer)
+
+    lowered = func.lower(column)
+    term = term.lower()
+    pattern = escape_like(term)
+    return case([
+        (lowered == term, 0),
+        (lowered.like(pattern + '%', escape='\\'), 1),
+        (lowered.like('% ' + pattern + '%', escape='\\'), 2),
+    ], else_=3)
@@ -0,0 +1,145 @@
+from datetime import datetime
+from operator import attrgetter, itemgetter
+
+from flask import request
+from sqlalchemy.orm import ColumnProperty, class_mapper
+
+# the forms isoformat() (and str()) writes naive dates in
+ISO_FORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d')
+
+# model class -> tuple of its column attribute names
+_columns = {}
+# (model class, fields) -> serializer function
+_serializers = {}
+
+
+def columns(model):
+    """
+    Return the names of the column attributes of a model, in mapper order.
+
+    The mapper is only reflected the first time a model is seen.
+    """
+    try:
+        return _columns[model]
+    except KeyError:
+        keys = tuple(prop.key for prop in
+                     class_mapper(model).iterate_properties
+                     if isinstance(prop, ColumnProperty))
+        _columns[model] = keys
+        return keys
+
+
+def _keys(model, fields):
+    """Return the column names to output for the given fields."""
+    keys = columns(model)
+    if fields is not None:
+        keys = tuple(k for k in keys if k in fields)
+    return keys
+
+
+def select_columns(model, fields=None):
+    """
+    Return the table columns to select to serialize the given fields,
+    followed by the primary key when it was not asked for (it is needed for
+    pagination cursors and ignored by row serializers).
+    """
+    mapper = class_mapper(model)
+    selected = [mapper.columns[key] for key in _keys(model, fields)]
+    for pk in mapper.primary_key:
+        if not any(pk is column for column in selected):
+            selected.append(pk)
+    return selected
+
+
+def row_serializer(model, fields=None):
+    """
+    Return a function mapping a Core result row selected with
+    select_columns to the same dict the model serializer produces.
+
+    Any extra trailing column in the row is ignored.
+    """
+    keys = _keys(model, None if fields is None else frozenset(fields))
+
+    def serialize(row):
+        return dict(zip(keys, row))
+
+    return serialize
+
+
+def serializer(model, fields=None):
+    """
+    Return a function mapping an instance (or a result row with the same
+    attribute names) of the model to a dict of its columns.
+
+    `fields` optionally narrows the output to the given column names; the
+    function for every (model, fields) pair is built once and reused.
+    """
+    if fields is not None:
+        fields = frozenset(fields)
+    key = (model, fields)
+    try:
+        return _serializers[key]
+    except KeyError:
+        pass
+
+    keys = _keys(model, fields)
+    if len(keys) == 1:
+        name = keys[0]
+
+        def loaded(state):
+            return (state[name],)
+
+        def getter(obj):
+            return (getattr(obj, name),)
+    else:
+        loaded = itemgetter(*keys)
+        getter = attrgetter(*keys)
+
+    def serialize(obj):
+        try:
+            # loaded columns are read straight from the instance dict,
+            # bypassing the instrumented attribute descriptors
+            return dict(zip(keys, loaded(obj.__dict__)))
+        except KeyError:
+            # expired, deferred or never set attributes go through the ORM
+            return dict(zip(keys, getter(obj)))
+
+    _serializers[key] = serialize
+    return serialize
+
+
+def requested_fields(model):
+    """
+    Return the column names asked for through the `fields` query param as a
+    frozenset, or None when the full representation is wanted. Raises a
+    ValueError for names that are not columns of the model.
+    """
+    fields = request.args.get('fields')
+    if not fields:
+        return None
+    fields = frozenset(f.strip() for f in fields.split(',') if f.strip())
+    if not fields:
+        return None
+    unknown = fields.difference(columns(model))
+    if unknown:
+        raise ValueError("Unknown fields: {}".format(
+            ', '.join(sorted(unknown))))
+    return fields
+
+
+def parse_isoformat(value):
+    """
+    Parse a naive date as isoformat() writes it, with a T or a space before
+    the time, with or without microseconds and the Z of the dates the api
+    sends (datetime.fromisoformat is only in python 3.7). Raises a
+    ValueError for anything else.
+    """
+    value = value.replace('T', ' ', 1)
+    if value.endswith('Z'):
+        value = value[:-1]
+    for fmt in ISO_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError("Invalid date: {}".format(value))
@@ -1,7 +1,18 @@
-from flask import Blueprint, make_response, request, jsonify, abort
+from flask import Blueprint, make_response, request, abort
 from flask.views import MethodView
 
+from app.bulk import bulk_create
+from app.cache import cached
+from app.encoding import jsonify
 from app.models import Service, Organization, Program
+from app.nested import exists_or_404, get_or_404
+from app.pagination import paginate, paginated_response
+from app.payload import read_payload
+from app.serializers import requested_fields, row_serializer
+from app.search import matching, rank
+from app.streaming import stream_requested, stream_response
+from app.validation import validated
+from app.versions import conditional
 
 
 service_blueprint = Blueprint('service', __name__)
@@ -19,137 +30,81 @@ class ServiceView(MethodView):
     /api/organizations/<org_id>/programs/<program_id>/services/<id> - DELETE
     """
 
+    decorators = [validated(Service), conditional(Service),
+                  cached(Service)]
+
     def post(self, organization_id, program_id):
         """
         Create a service and return a json response containing it.
         """
-        if request.headers['Content-Type'] == "application/json":
-            payload = request.data
-        elif request.form:
-            payload = request.data.to_dict()
-        else:
-            payload = request.get_json(force=True)
+        # check that the org (and the program, when the service comes under
+        # one) exist and belong together
+        exists_or_404((Organization, organization_id), (Program, program_id))
+        try:
+            payload = read_payload()
+
+            payload['organization_id'] = organization_id
+            if program_id is not None:
+                payload['program_id'] = program_id
+            service = Service(**payload)
+            service.save()
+            response = service.serialize()
+            return make_response(jsonify(response)), 201
+        except Exception as e:
+            response = {"message": str(e)}
+            return make_response(jsonify(response)), 400
 
-        # validation check for org
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
-            abort(404)
+    def get(self, organization_id, program_id, service_id):
+        """Get a service and return it as json."""
 
-        # First, check to see whether the service comes under a given program
-        if program_id is not None:
+        if service_id is not None:
+            # handle get by id, for services under a program or on their own
+            service = get_or_404((Organization, organization_id),
+                                 (Program, program_id),
+                                 (Service, service_id))
             try:
-                # check whether the program exists
-                prog = Program.query.filter_by(id=program_id).first()
-                abort(404) if prog is None else prog
-
-                if organization_id is not None:
-                    # check to see whether the org exists
-                    org = Organization.query.filter_by(
-                        id=organization_id).first()
-                    if org is not None:
-                        payload['organization_id'] = organization_id
-                        service = Service(**payload)
-                        service.save()
-                        response = service.serialize()
-                        return make_response(jsonify(response)), 201
-                    else:
-                        # the org is none-existent - return 404 not found
-                        abort(404)
+                response = service.serialize(requested_fields(Service))
+                return make_response(jsonify(response)), 200
             except Exception as e:
                 response = {"message": str(e)}
                 return make_response(jsonify(response)), 400
-        else:
-            # Create the service without the program ID (the service is on its
-            # own
-            if organization_id is not None:
-                org = Organization.query.filter_by(
-                    id=organization_id).first()
-                if org is not None:
-                    payload['organization_id'] = organization_id
-                    service = Service(**payload)
-                    service.save()
-                    response = service.serialize()
-                    return make_response(jsonify(response)), 201
-                else:
-                    # the org doe not exist
-                    abort(404)
-            else:
-                abort(404)
-
-    def get(self, organization_id, program_id, service_id):
-        """Get a service and return it as json."""
-
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
-            abort(404)
-
-        service = Service.query.filter_by(id=service_id).first()
-        if service_id is not None:
-            if program_id is None:
-                # handle get by id for a service that is not under any program
-                if not service:
-                    abort(404)
-                else:
-                    response = service.serialize()
-                    return make_response(jsonify(response)), 200
-
-            else:
-                # handle the get by id for service under a program
-                program = Program.query.filter_by(id=program_id).first()
-                if not program:
-                    abort(404)
-                else:
-                    if not service:
-                        abort(404)
-                    if service.program_id != program_id:
-                        abort(404)
-                    else:
-                        try:
-                            response = service.serialize()
-                            return make_response(jsonify(response)), 200
-                        except Exception as e:
-                            response = {"message": str(e)}
-                            return make_response(jsonify(response)), 400
         else:
             # handle get all
+            exists_or_404((Organization, organization_id),
+                          (Program, program_id))
             try:
-                services = Service.get_all(organization_id)
-                response = []
-
+                fields = requested_fields(Service)
+                services = Service.select(fields).where(
+                    Service.organization_id == organization_id)
+                if program_id is not None:
+                    services = services.where(
+                        Service.program_id == program_id)
+
+                name_rank = None
                 if request.args.get('name'):
                     name = request.args.get('name')
-                    search = services.filter(
-                        Service.name.ilike('%{0}%'.format(name)))
-                    if search is None:
-                        abort(404)
-                    services = search
-
-                for service in services:
-                    response.append(service.serialize())
-                return make_response(jsonify(response)), 200
+                    services = services.where(matching(Service.name, name))
+                    name_rank = rank(Service.name, name)
+
+                serialize = row_serializer(Service, fields)
+                if stream_requested():
+                    return stream_response(services, Service.id, serialize)
+                page, next_url = paginate(services, Service.id, name_rank)
+                response = [serialize(row) for row in page]
+                return paginated_response(response, next_url)
             except Exception as e:
                 response = {"message": str(e)}
-                return make_response(jsonify(e)), 400
+                return make_response(jsonify(response)), 400
 
     def put(self, organization_id, program_id, service_id):
         """Update a service and return it as json."""
 
         if service_id is not None:
-            # test that the org exists
-            org = Organization.query.filter_by(id=organization_id).first()
-            service = Service.query.filter_by(id=service_id).first()
-            if org is None:
-                abort(404)
-            if service is None:
-                abort(404)
-
+            service = get_or_404((Organization, organization_id),
+                                 (Program, program_id),
+                                 (Service, service_id))
             try:
-                if request.headers['Content-Type'] == "application/json":
-                    payload = request.data
-                elif request.form:
-                    payload = request.data.to_dict()
-                else:
-                    payload = request.get_json(force=True)
+                payload = read_payload()
 
                 for key in payload.keys():
                     setattr(service, key, payload.get(key))
@@ -165,27 +120,14 @@ class ServiceView(MethodView):
             abort(404)
 
     def delete(self, organization_id, program_id, service_id):
-        """Delete a program given its id."""
-
-        org = Organization.query.filter_by(id=organization_id).first()
-        if not org:
-            abort(404)
-
-        if program_id is None and service_id is not None:
-            # the service has no program associated to it
-            try:
-                service = Service.query.filter_by(id=service_id).first()
-                service.delete()
-                return make_response(jsonify({})), 202
-            except Exception as e:
-                response = {"message": str(e)}
-                return make_response(jsonify(response)), 400
+        """Delete a service given its id."""
 
         if service_id is not None:
+            service = get_or_404((Organization, organization_id),
+                                 (Program, program_id),
+                                 (Service, service_id))
             try:
-                service = Service.query.filter_by(id=service_id).first()
                 service.delete()
-
                 return make_response(jsonify({})), 202
 
             except Exception as e:
@@ -195,6 +137,26 @@ class ServiceView(MethodView):
             abort(404)
 
 
+class ServiceBulkView(MethodView):
+    """
+    This class handles bulk requests for the service resource.
+
+    /api/organizations/<org_id>/services/:bulk - POST
+    /api/organizations/<org_id>/programs/<program_id>/services/:bulk - POST
+    """
+
+    def post(self, organization_id, program_id):
+        """
+        Create a json array of services and return the count written and the
+        per-item errors.
+        """
+        exists_or_404((Organization, organization_id), (Program, program_id))
+        parents = {'organization_id': organization_id}
+        if program_id is not None:
+            parents['program_id'] = program_id
+        return bulk_create(Service, **parents)
+
+
 service_view = ServiceView.as_view('service_view')
 service_blueprint.add_url_rule(
     '/api/organizations/<int:organization_id>/services/',
@@ -212,3 +174,11 @@ service_blueprint.add_url_rule(
 service_blueprint.add_url_rule(
     '/api/organizations/<int:organization_id>/programs/' + '<int:program_id>/services/<int:service_id>',
     view_func=service_view, methods=['GET', 'PUT', 'DELETE'])
+service_bulk_view = ServiceBulkView.as_view('service_bulk_view')
+service_blueprint.add_url_rule(
+    '/api/organizations/<int:organization_id>/services/:bulk',
+    view_func=service_bulk_view, defaults={'program_id': None},
+    methods=['POST'])
+service_blueprint.add_url_rule(
+    '/api/organizations/<int:organization_id>/programs/' + '<int:program_id>/services/:bulk',
+    view_func=service_bulk_view, methods=['POST'])
@@ -0,0 +1,56 @@
+import copy
+import hashlib
+import os
+import pickle
+
+SPEC_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                         '.openapi', 'swagger.yaml')
+
+
+def _parse(contents):
+    import yaml
+    # the C loader, when libyaml is there, is several times faster
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    spec = yaml.load(contents, Loader=loader)
+    try:
+        from swagger_spec_validator.validator20 import validate_spec
+    except ImportError:
+        # only installed along with connexion
+        return spec
+    # the validator may modify what it validates
+    validate_spec(copy.deepcopy(spec))
+    return spec
+
+
+def load_spec(path=SPEC_PATH, cache_dir=None):
+    """
+    Return the OpenAPI spec as a dict, parsed and validated once per version
+    of the file: the result is kept in `cache_dir` (__pycache__ next to the
+    spec by default) under the digest of the yaml, and read back from there
+    as long as the yaml is unchanged.
+    """
+    with open(path, 'rb') as f:
+        contents = f.read()
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(path), '__pycache__')
+    cached = os.path.join(cache_dir, '{}-{}.pickle'.format(
+        os.path.splitext(os.path.basename(path))[0],
+        hashlib.sha256(contents).hexdigest()[:16]))
+    try:
+        with open(cached, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+
+    spec = _parse(contents)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # written aside and renamed, for the workers starting together
+        partial = '{}.{}'.format(cached, os.getpid())
+        with open(partial, 'wb') as f:
+            pickle.dump(spec, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(partial, cached)
+    except OSError:
+        # a read-only checkout parses the yaml every time
+        pass
+    return spec
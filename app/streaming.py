@@ -0,0 +1,66 @@
+import time
+
+from flask import Response, current_app, request, stream_with_context
+
+from app import db
+from app.encoding import (NDJSON, add_encoding_time, get_backend,
+                          ndjson_requested)
+from app.pagination import decode_cursor
+
+
+def stream_requested():
+    """Return True when the client asked for the streaming list mode."""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_response(statement, column, serialize):
+    """
+    Return a response streaming every row selected by a Core select
+    statement as a json array (or json lines, when the client accepts
+    application/x-ndjson), each row being mapped through `serialize`.
+
+    Rows are fetched from the database in batches of STREAM_BATCH_SIZE
+    (server side cursors on postgres) and each one is encoded as soon as it
+    arrives, so neither the rows nor the encoded body are ever held in
+    memory all at once. The `after` cursor is honoured so a client can
+    resume an interrupted stream.
+    """
+    batch_size = current_app.config.get('STREAM_BATCH_SIZE', 1000)
+    after = decode_cursor(request.args.get('after'))
+    if after is not None:
+        statement = statement.where(column > after)
+    statement = statement.order_by(column).execution_options(
+        stream_results=True)
+    encode = get_backend().compact().encode
+    if ndjson_requested():
+        mimetype, start, end = NDJSON, b'', b''
+
+        def join(lines, first):
+            return b''.join(line + b'\n' for line in lines)
+    else:
+        mimetype, start, end = 'application/json', b'[', b']'
+
+        def join(items, first):
+            return b','.join(items) if first else b',' + b','.join(items)
+
+    def generate():
+        # encoded rows are flushed one batch at a time to keep the number of
+        # writes to the socket down
+        yield start
+        first = True
+        result = db.session.execute(statement)
+        try:
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                began = time.perf_counter()
+                chunk = join([encode(serialize(row)) for row in rows], first)
+                add_encoding_time(began)
+                yield chunk
+                first = False
+        finally:
+            result.close()
+        yield end
+
+    return Response(stream_with_context(generate()), mimetype=mimetype)
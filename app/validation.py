@@ -0,0 +1,195 @@
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from app.encoding import jsonify
+from app.models import PhysicalAddress
+from app.payload import PayloadError, from_form, read_payload
+from app.spec import load_spec
+
+# the swagger definition describing the bodies of each model, when its name
+# differs from the model's
+DEFINITIONS = {
+    PhysicalAddress: 'Address',
+}
+
+_TYPES = {
+    'integer': ((int,), 'an integer'),
+    'number': ((int, float), 'a number'),
+    'string': ((str,), 'a string'),
+    'boolean': ((bool,), 'a boolean'),
+    'array': ((list,), 'an array'),
+    'object': ((dict,), 'an object'),
+}
+# form fields are strings, these are read from them
+_PARSERS = {
+    'integer': int,
+    'number': float,
+}
+
+
+def _expected(kind, schema):
+    """Describe the values a property accepts, for the error messages."""
+    text = _TYPES[kind][1]
+    low, high = schema.get('minimum'), schema.get('maximum')
+    if low is not None and high is not None:
+        text += ' from {} to {}'.format(low, high)
+    elif low is not None:
+        text += ' of at least {}'.format(low)
+    elif high is not None:
+        text += ' of at most {}'.format(high)
+    shortest, longest = schema.get('minLength'), schema.get('maxLength')
+    if shortest is not None and shortest == longest:
+        text += ' of {} characters'.format(longest)
+    elif shortest is not None and longest is not None:
+        text += ' of {} to {} characters'.format(shortest, longest)
+    elif shortest is not None:
+        text += ' of at least {} characters'.format(shortest)
+    elif longest is not None:
+        text += ' of at most {} characters'.format(longest)
+    if 'enum' in schema:
+        text += ' among {}'.format(', '.join(map(str, schema['enum'])))
+    return text
+
+
+def compile_property(name, schema):
+    """
+    Return a function checking a value of a property against its schema,
+    returning the error message or None. Its second argument tells that the
+    value comes from a form, where numbers are given as strings.
+    """
+    kind = schema.get('type', 'string')
+    types = _TYPES[kind][0]
+    strict = bool not in types
+    parse = _PARSERS.get(kind)
+    # every constraint as a predicate on a value of the right type
+    tests = []
+    if 'minimum' in schema:
+        tests.append(lambda value, low=schema['minimum']: value >= low)
+    if 'maximum' in schema:
+        tests.append(lambda value, high=schema['maximum']: value <= high)
+    if 'minLength' in schema:
+        tests.append(lambda value, low=schema['minLength']: len(value) >= low)
+    if 'maxLength' in schema:
+        tests.append(
+            lambda value, high=schema['maxLength']: len(value) <= high)
+    if 'enum' in schema:
+        tests.append(lambda value, choices=frozenset(schema['enum']):
+                     value in choices)
+    error = "Invalid {}: expected {}".format(name, _expected(kind, schema))
+
+    def check(value, form=False):
+        if form and parse is not None and isinstance(value, str):
+            if value == '':
+                # an empty field leaves the property unset
+                return None
+            try:
+                value = parse(value)
+            except ValueError:
+                return error
+        if not isinstance(value, types) or \
+                (strict and isinstance(value, bool)):
+            return error
+        for test in tests:
+            if not test(value):
+                return error
+        return None
+
+    return check
+
+
+def compile_definition(schema):
+    """
+    Return a validator of the bodies described by a swagger definition: a
+    function of the payload returning the list of its errors (empty when it
+    is valid).
+
+    Its keyword arguments tell whether the payload is a `partial` update
+    (the required properties may be left out), the properties `provided`
+    by the url and whether the payload comes from a `form`. The read-only
+    properties are dropped from the payload.
+    """
+    properties = schema.get('properties', {})
+    read_only = frozenset(name for name, prop in properties.items()
+                          if prop.get('readOnly'))
+    checks = {name: compile_property(name, prop)
+              for name, prop in properties.items() if name not in read_only}
+    required = tuple(schema.get('required', ()))
+
+    def validate(payload, partial=False, provided=(), form=False):
+        if not isinstance(payload, dict):
+            return ["Expected a json object"]
+        # sent back by the clients updating what they read
+        for name in read_only.intersection(payload):
+            del payload[name]
+        errors = []
+        unknown = sorted(name for name in payload if name not in checks)
+        if unknown:
+            errors.append("Unknown fields: {}".format(', '.join(unknown)))
+        missing = [name for name in required
+                   if all((not partial or name in payload,
+                           payload.get(name) is None,
+                           name not in provided))]
+        if missing:
+            errors.append("Missing fields: {}".format(', '.join(missing)))
+        for name, value in payload.items():
+            check = checks.get(name)
+            if check is not None and value is not None:
+                message = check(value, form)
+                if message is not None:
+                    errors.append(message)
+        return errors
+
+    return validate
+
+
+def init_app(app, spec=None):
+    """Compile the validators of the swagger definitions, once."""
+    if spec is None:
+        spec = load_spec()
+    app.extensions['validators'] = {
+        name: compile_definition(schema)
+        for name, schema in spec.get('definitions', {}).items()}
+
+
+def validator(model):
+    """Return the validator of the bodies of a model, None without one."""
+    name = DEFINITIONS.get(model, model.__name__)
+    return current_app.extensions['validators'].get(name)
+
+
+def validated(model):
+    """
+    Return a decorator rejecting the POST and PUT requests whose body cannot
+    be decoded, or does not match the swagger definition of the model (with
+    a 400), before the view runs any query. To be listed in the view's
+    `decorators`.
+
+    The body is decoded by app.payload, where the views read it from. PUT
+    bodies are partial updates and the ids in the url are taken as given,
+    the views setting them on the payload.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('POST', 'PUT'):
+                return view(*args, **kwargs)
+            try:
+                payload = read_payload()
+            except PayloadError as e:
+                return make_response(jsonify({"message": str(e)})), e.status
+            validate = validator(model)
+            if validate is None:
+                return view(*args, **kwargs)
+            provided = [name for name, value in kwargs.items()
+                        if value is not None]
+            errors = validate(payload, partial=request.method == 'PUT',
+                              provided=provided, form=from_form())
+            if errors:
+                response = {"message": '; '.join(errors)}
+                return make_response(jsonify(response)), 400
+            return view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
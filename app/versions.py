@@ -0,0 +1,200 @@
+import hashlib
+import json
+from functools import wraps
+from itertools import chain
+from urllib.parse import urlencode
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event, literal, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import cascade_tags, collection_tags, read_scopes
+from app.expand import requested_expansions
+from app.models import BaseMixin, CollectionVersion
+from app.streaming import stream_requested
+
+# the counter bumped by the writes that bypass the unit of work, like bulk
+# inserts and imports, which every ETag depends on
+EPOCH = '*'
+
+
+def bump(connection, tags):
+    """Increment the version counters of the given tags."""
+    # always in the same order, so concurrent writers cannot deadlock
+    tags = sorted(set(tags))
+    table = CollectionVersion.__table__
+    if connection.dialect.name == 'postgresql':
+        statement = pg_insert(table).values(
+            [{'key': tag, 'version': 1} for tag in tags])
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=['key'], set_={'version': table.c.version + 1}))
+        return
+
+    connection.execute(table.update().where(table.c.key.in_(tags)).values(
+        version=table.c.version + 1))
+    existing = {key for key, in connection.execute(
+        select([table.c.key]).where(table.c.key.in_(tags)))}
+    missing = [{'key': tag, 'version': 1} for tag in tags
+               if tag not in existing]
+    if missing:
+        connection.execute(table.insert(), missing)
+
+
+def bump_on_commit(session, tags):
+    """Bump the counters of the tags once the session commits."""
+    session.info.setdefault('version_tags', set()).update(tags)
+
+
+def bump_all():
+    """
+    Change every ETag, for writes whose rows are not known to the session,
+    once the current transaction commits.
+    """
+    bump_on_commit(db.session, [EPOCH])
+
+
+def counters(tags):
+    """Return the current version counters of the given tags."""
+    table = CollectionVersion.__table__
+    statement = select([table.c.key, table.c.version]).where(
+        table.c.key.in_(tags))
+    return dict(db.session.execute(statement).fetchall())
+
+
+def _collect(session, flush_context):
+    tags = set()
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, BaseMixin):
+            tags.update(collection_tags(instance))
+    if tags:
+        bump_on_commit(session, tags)
+
+
+def _bump(session):
+    tags = session.info.pop('version_tags', None)
+    if tags:
+        # in a transaction of its own, the row locks of the counters are
+        # only held for the time of the upsert, not for the whole write
+        with session.get_bind().begin() as connection:
+            bump(connection, tags)
+
+
+def _discard(session):
+    session.info.pop('version_tags', None)
+
+
+# the counters are bumped once the rows are committed, so that a counter
+# never changes before the rows it stands for can be read; before the
+# cache drops its entries (see app.cache), for a response cached in
+# between not to keep the ETag of the previous rows
+event.listen(Session, 'after_flush', _collect)
+event.listen(Session, 'after_commit', _bump, insert=True)
+event.listen(Session, 'after_rollback', _discard)
+
+
+def _remember_version(instance, context):
+    versions = g.get('loaded_versions') if has_request_context() else None
+    if versions is not None:
+        versions[(instance.__tablename__, instance.id)] = instance.version
+
+
+# the versions of the rows loaded by a view whose ETag depends on them
+event.listen(BaseMixin, 'load', _remember_version, propagate=True)
+
+
+def _digest(versions):
+    """Return the ETag of the current request, showing the versions."""
+    state = [request.path, urlencode(sorted(request.args.items(multi=True))),
+             request.headers.get('Accept', ''), versions]
+    return hashlib.sha1(
+        json.dumps(state, default=str).encode('utf-8')).hexdigest()
+
+
+def etag(rows, collections):
+    """
+    Return the ETag of a GET response, or None when one of the rows named
+    by the url does not exist.
+
+    It is a digest of the request and of the versions of everything the
+    response shows (see app.cache.read_scopes): the row versions of the
+    resources in the url and the counters of the collections listed and of
+    the tables they show, bumped by the deletes cascading to them. They are
+    all read in a single query, without loading any row, whatever the size
+    of the collections.
+    """
+    collections = collections + cascade_tags(rows, collections) + [EPOCH]
+    table = CollectionVersion.__table__
+    parts = [select([table.c.key, table.c.version]).where(
+        table.c.key.in_(collections))]
+    tags = ['{}:{}'.format(*row) for row in rows]
+    for tag, (name, pk) in zip(tags, rows):
+        table = db.metadata.tables[name]
+        parts.append(select([literal(tag), table.c.version]).where(
+            table.c.id == pk))
+    statement = parts[0] if len(parts) == 1 else union_all(*parts)
+    found = dict(db.session.execute(statement).fetchall())
+
+    if any(tag not in found for tag in tags):
+        return None
+    return _digest([found.get(tag, 0) for tag in tags + collections])
+
+
+def conditional(model):
+    """
+    Return a decorator adding ETags to the GET responses of a view of the
+    model and answering 304 to the requests whose If-None-Match matches.
+    To be listed in the view's `decorators`.
+
+    Lists are answered 304 without running the view. The ETag of a single
+    row is derived from the version of the row the view loads, so that it
+    still takes one query.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or stream_requested():
+                return view(*args, **kwargs)
+            try:
+                expansions = requested_expansions(model)
+            except ValueError:
+                # the view answers with the error
+                return view(*args, **kwargs)
+
+            rows, collections = read_scopes(model, kwargs, expansions)
+            if not collections:
+                return _row_conditional(view, rows[-1], args, kwargs)
+            tag = etag(rows, collections)
+            if tag is None:
+                return view(*args, **kwargs)
+            if request.if_none_match.contains_weak(tag):
+                response = Response(status=304)
+                response.set_etag(tag)
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(tag)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def _row_conditional(view, row, args, kwargs):
+    """Run the view of a single row and add the ETag of its version."""
+    g.loaded_versions = {}
+    try:
+        response = current_app.make_response(view(*args, **kwargs))
+        version = g.loaded_versions.get(row)
+    finally:
+        del g.loaded_versions
+    if response.status_code != 200 or version is None:
+        return response
+    tag = _digest([version])
+    if request.if_none_match.contains_weak(tag):
+        response = Response(status=304)
+    response.set_etag(tag)
+    return response
@@ -0,0 +1,68 @@
+"""
+Compare creating locations one POST at a time against the bulk endpoint.
+
+Usage:
+    python -m benchmarks.bulk --rows 10000
+
+Requests go through the test client against the sqlite testing database;
+its tables are dropped and recreated.
+"""
+import argparse
+import json
+import time
+
+from app import create_app, db
+from app.models import Location, Organization
+
+
+def items(count, offset=0):
+    return [dict(name="Location {}".format(offset + i),
+                 description="The windy city", transportation="Train")
+            for i in range(count)]
+
+
+def single(client, payloads):
+    for payload in payloads:
+        res = client.post('/api/organizations/1/locations/',
+                          data=json.dumps(payload),
+                          content_type='application/json')
+        assert res.status_code == 201
+
+
+def bulk(client, payloads):
+    res = client.post('/api/organizations/1/locations/:bulk',
+                      data=json.dumps(payloads),
+                      content_type='application/json')
+    assert res.status_code == 201
+
+
+def timed(label, func, client, payloads):
+    start = time.perf_counter()
+    func(client, payloads)
+    elapsed = time.perf_counter() - start
+    print("{:<24} {:>9.1f} ms {:>12.0f} rows/s".format(
+        label, elapsed * 1000, len(payloads) / elapsed))
+    return elapsed
+
+
+def run(count):
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Organization(name="BHive", description="Bees"))
+        db.session.commit()
+        client = app.test_client()
+
+        one = timed("one POST per row", single, client, items(count))
+        many = timed("bulk POST", bulk, client, items(count, count))
+        assert Location.query.count() == 2 * count
+        print("speedup: {:.1f}x".format(one / many))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=10000)
+    run(parser.parse_args().rows)
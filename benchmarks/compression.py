@@ -0,0 +1,115 @@
+"""
+Weigh the bandwidth saved by compressing the list responses against the
+CPU it takes.
+
+Usage:
+    python -m benchmarks.compression --scale 1000 --mbps 10
+
+A synthetic registry of `scale` organizations (see benchmarks.suite) is
+seeded into the sqlite testing database, whose tables are dropped and
+recreated. A page of organizations, a nested list and the whole streamed
+collection are then compressed by gzip and brotli (when installed) at
+several levels, each reported with its size, ratio and compression time,
+and with the time it takes to send over a `--mbps` link, CPU included.
+The same lists are last requested through the test client, uncompressed
+and compressed, with the response cache off, on a miss and on a hit.
+"""
+import argparse
+import random
+import time
+
+from app import create_app, db
+from app.compression import Brotli, Gzip
+from benchmarks.suite import seed
+
+LISTS = [
+    ('page of 100', '/api/organizations/?limit=100'),
+    ('nested list', '/api/organizations/1/programs/1/services/'),
+    ('stream', '/api/organizations/?stream=true'),
+]
+LEVELS = [(Gzip, (1, 6, 9)), (Brotli, (1, 4, 6, 11))]
+
+
+def best(func, runs):
+    elapsed = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), result
+
+
+def codecs(runs, body, mbps, compress):
+    """Report every codec and level compressing a body."""
+    link = mbps * 1e6 / 8
+    print("  {:<12} {:>9.1f} kB {:>6} {:>12} {:>9.2f} ms".format(
+        'identity', len(body) / 1024.0, '', '', len(body) / link * 1000))
+    for cls, levels in LEVELS:
+        if not cls.installed:
+            print("  {:<12} not installed".format(cls.name))
+            continue
+        for level in levels:
+            codec = cls(level)
+            elapsed, data = best(lambda: compress(codec), runs)
+            print("  {:<12} {:>9.1f} kB {:>5.1f}x {:>9.2f} ms {:>9.2f} ms"
+                  .format('{} {}'.format(cls.name, level),
+                          len(data) / 1024.0, len(body) / len(data),
+                          elapsed * 1000,
+                          (elapsed + len(data) / link) * 1000))
+
+
+def run(scale, runs, mbps):
+    app = create_app('testing')
+    app.config['PAGINATION_MAX_LIMIT'] = scale
+    client = app.test_client()
+    cache = app.extensions['cache']
+    with app.app_context():
+        seed(scale, random.Random(0))
+        print("{:<14} {:>12} {:>6} {:>12} {:>12}".format(
+            '', 'size', 'ratio', 'compress', '{:g} Mbit/s'.format(mbps)))
+        app.extensions['cache'] = None
+        for label, url in LISTS:
+            # compressed batch by batch when streamed, as the app does
+            chunks = list(client.get(url).response)
+            body = b''.join(chunks)
+            print(label)
+            if len(chunks) > 1:
+                codecs(runs, body, mbps, lambda codec: b''.join(
+                    codec.stream(iter(chunks))))
+            else:
+                codecs(runs, body, mbps, lambda codec: codec.compress(body))
+
+        print("\n{:<14} {:<10} {:>10} {:>10} {:>10}".format(
+            '', 'encoding', 'no cache', 'miss', 'hit'))
+        for label, url in LISTS:
+            for encoding in ('identity', 'gzip', 'br'):
+                def get():
+                    return client.get(url, headers={
+                        'Accept-Encoding': encoding}).get_data()
+
+                def miss():
+                    cache.clear()
+                    return get()
+
+                app.extensions['cache'] = None
+                times = [best(get, runs)[0]]
+                app.extensions['cache'] = cache
+                # streams are never cached
+                if cache is not None and 'stream' not in url:
+                    times.append(best(miss, runs)[0])
+                    times.append(best(get, runs)[0])
+                print("{:<14} {:<10}".format(label, encoding) + ''.join(
+                    ' {:>7.2f} ms'.format(elapsed * 1000)
+                    for elapsed in times))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scale', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mbps', type=float, default=10,
+                        help='Bandwidth of the link, in Mbit/s')
+    args = parser.parse_args()
+    run(args.scale, args.runs, args.mbps)
@@ -0,0 +1,89 @@
+"""
+Time deleting an organization with many descendants.
+
+Usage:
+    python -m benchmarks.deletes --descendants 100000
+
+An organization with programs, services, locations, addresses and
+services at locations, `--descendants` rows in all, is seeded into the
+sqlite testing database, whose tables are dropped and recreated, and
+deleted through the ORM (`session.delete`) and through app.deletes, with
+the time and the python memory each path takes.
+"""
+import argparse
+import time
+import tracemalloc
+
+from app import create_app, db
+from app.deletes import delete
+from app.models import (Location, Organization, PhysicalAddress, Program,
+                        Service, ServiceLocation, Tombstone)
+
+TABLES = (Program, Service, Location, PhysicalAddress, ServiceLocation)
+
+
+def populate(count):
+    """Seed an organization with about `count` descendants."""
+    per_table = count // len(TABLES)
+    db.session.add(Organization(name="BHive", description="Bees"))
+    db.session.commit()
+    rows = {
+        Program: [dict(organization_id=1, name="Program") for _ in
+                  range(per_table)],
+        Service: [dict(organization_id=1, program_id=i % per_table + 1,
+                       name="Service") for i in range(per_table)],
+        Location: [dict(organization_id=1, name="Location") for _ in
+                   range(per_table)],
+        PhysicalAddress: [dict(location_id=i + 1, address="1 Main St",
+                               city="Chicago", state="Illinois",
+                               postal_code="60621", country="US")
+                          for i in range(per_table)],
+        ServiceLocation: [dict(service_id=i + 1, location_id=i + 1,
+                               description="Main") for i in
+                          range(per_table)],
+    }
+    for model in TABLES:
+        for start in range(0, per_table, 10000):
+            db.session.execute(model.__table__.insert(),
+                               rows[model][start:start + 10000])
+    db.session.commit()
+    return per_table * len(TABLES)
+
+
+def orm_delete():
+    db.session.delete(Organization.query.get(1))
+    db.session.commit()
+
+
+def set_delete():
+    delete(Organization, [1])
+
+
+def run(count):
+    app = create_app('testing')
+    with app.app_context():
+        for label, func in (("session.delete", orm_delete),
+                            ("app.deletes.delete", set_delete)):
+            db.drop_all()
+            db.create_all()
+            descendants = populate(count)
+            db.session.remove()
+            tracemalloc.start()
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            assert sum(model.query.count() for model in TABLES) == 0
+            assert Tombstone.query.count() == descendants + 1
+            print("{:<20} {} descendants {:>9.0f} ms {:>9.0f} kB peak".format(
+                label, descendants, elapsed * 1000, peak / 1024))
+            db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--descendants', type=int, default=100000)
+    args = parser.parse_args()
+    run(args.descendants)
@@ -0,0 +1,80 @@
+"""
+Compare the json backends on 10k-row list responses.
+
+Usage:
+    python -m benchmarks.encoding --rows 10000
+
+The organizations of a synthetic registry (see benchmarks.suite) are seeded
+into the sqlite testing database, whose tables are dropped and recreated.
+Their serialized rows, dates included, are encoded by every installed
+backend, as a json array and as json lines, next to Flask's jsonify. The
+whole collection is then streamed through the test client with each one.
+"""
+import argparse
+import random
+import time
+
+from flask import jsonify as flask_jsonify
+
+from app import create_app, db
+from app.encoding import BACKENDS, ndjson_lines
+from app.models import Organization
+from app.serializers import row_serializer
+from benchmarks.suite import seed
+
+
+def best(func, runs):
+    elapsed = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        elapsed.append(time.perf_counter() - start)
+    return min(elapsed), result
+
+
+def report(label, elapsed, size):
+    print("{:<28} {:>9.2f} ms {:>9.0f} kB {:>7.0f} MB/s".format(
+        label, elapsed * 1000, size / 1024.0, size / elapsed / 1e6))
+
+
+def run(count, runs):
+    app = create_app('testing')
+    app.extensions['cache'] = None
+    app.config['PAGINATION_MAX_LIMIT'] = count
+    client = app.test_client()
+    with app.app_context():
+        seed(count, random.Random(0))
+        serialize = row_serializer(Organization)
+        rows = [serialize(row) for row in db.session.execute(
+            Organization.select(None).order_by(Organization.id))]
+
+        elapsed, body = best(lambda: flask_jsonify(rows).get_data(), runs)
+        report("flask jsonify", elapsed, len(body))
+        for cls in BACKENDS.values():
+            if not cls.installed:
+                print("{:<28} not installed".format(cls.name))
+                continue
+            backend = cls(sort_keys=app.config['JSON_SORT_KEYS'])
+            elapsed, body = best(lambda: backend.encode(rows), runs)
+            report(cls.name + " array", elapsed, len(body))
+            elapsed, body = best(lambda: ndjson_lines(rows, backend), runs)
+            report(cls.name + " lines", elapsed, len(body))
+
+            app.extensions['json'] = backend
+            for accept in ('application/json', 'application/x-ndjson'):
+                elapsed, body = best(lambda: client.get(
+                    '/api/organizations/?stream=true',
+                    headers={'Accept': accept}).get_data(), runs)
+                report("{} stream {}".format(
+                    cls.name, 'lines' if 'ndjson' in accept else 'array'),
+                    elapsed, len(body))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    run(args.rows, args.runs)
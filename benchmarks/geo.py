@@ -0,0 +1,98 @@
+"""
+Time the distance searches against scanning every location.
+
+Usage:
+    python -m benchmarks.geo --rows 200000 --queries 200
+
+Locations are spread over the contiguous US in the sqlite testing
+database, whose tables are dropped and recreated, and searched through the
+in-process grid.
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import select
+
+from app import create_app, db
+from app.geo import distance, get_index, nearest
+from app.models import Location, Organization
+
+
+def populate(count):
+    random.seed(0)
+    db.session.add(Organization(name="BHive", description="Bees"))
+    db.session.commit()
+    rows = [dict(name="Location {}".format(i), organization_id=1,
+                 latitude=random.uniform(25, 49),
+                 longitude=random.uniform(-124, -67)) for i in range(count)]
+    for start in range(0, count, 10000):
+        db.session.execute(Location.__table__.insert(),
+                           rows[start:start + 10000])
+    db.session.commit()
+
+
+def scan(lat, lon, radius=None, limit=100):
+    rows = db.session.execute(select([Location.id, Location.latitude,
+                                      Location.longitude]))
+    found = [(distance(lat, lon, point_lat, point_lon), pk)
+             for pk, point_lat, point_lon in rows]
+    if radius is not None:
+        found = [item for item in found if item[0] <= radius]
+    return sorted(found)[:limit]
+
+
+def timed(label, func, points, **kwargs):
+    start = time.perf_counter()
+    results = [func(lat, lon, **kwargs) for lat, lon in points]
+    elapsed = (time.perf_counter() - start) / len(points)
+    print("{:<32} {:>9.2f} ms/query".format(label, elapsed * 1000))
+    return results, elapsed
+
+
+def run(count, queries):
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        populate(count)
+        # every row was just written, none is to be caught up with
+        app.config['GEO_REFRESH_WINDOW'] = 0
+        points = [(random.uniform(26, 48), random.uniform(-123, -68))
+                  for _ in range(queries)]
+
+        start = time.perf_counter()
+        get_index()
+        print("{:<32} {:>9.1f} ms".format(
+            "grid build", (time.perf_counter() - start) * 1000))
+        for label, kwargs in (("10 nearest", dict(limit=10)),
+                              ("within 25 km", dict(radius=25))):
+            few = max(1, queries // 20)
+            expected, slow = timed(label + " (scan)", scan, points[:few],
+                                   **kwargs)
+            found, fast = timed(label + " (grid)", nearest, points[:few],
+                                **kwargs)
+            assert [[pk for _, pk in r] for r in found] == \
+                [[pk for _, pk in r] for r in expected]
+            timed(label + " (grid, all queries)", nearest, points, **kwargs)
+            print("speedup: {:.0f}x".format(slow / fast))
+
+        # a write is caught up with rather than rebuilding the grid
+        location = Location.query.first()
+        location.latitude = 40.0
+        db.session.commit()
+        start = time.perf_counter()
+        get_index()
+        print("{:<32} {:>9.1f} ms".format(
+            "grid refresh after a write",
+            (time.perf_counter() - start) * 1000))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+    run(args.rows, args.queries)
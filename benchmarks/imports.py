@@ -0,0 +1,59 @@
+"""
+Measure the throughput of loading an export back with the import command.
+
+Usage:
+    python -m benchmarks.imports --rows 1000000 --format csv
+
+Services are exported from the sqlite testing database and imported into
+the emptied tables; the tables are dropped and recreated.
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from app import create_app, db
+from app.export import export
+from app.importer import import_tables
+from app.models import Organization, Service
+
+
+def run(count, fmt):
+    directory = tempfile.mkdtemp()
+    with create_app('testing').app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.bulk_insert_mappings(Organization, [
+            dict(name="Organization {}".format(i), description="An org")
+            for i in range(count // 100 or 1)])
+        db.session.bulk_insert_mappings(Service, [
+            dict(name="Service {}".format(i), organization_id=i % 100 + 1,
+                 email="service@mail.com", url="service.com", fees="1000",
+                 status="On") for i in range(count)])
+        db.session.commit()
+        export(directory, fmt, ['organizations', 'services'])
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        for dry_run in (True, False):
+            start = time.perf_counter()
+            counts, errors = import_tables(directory, fmt, dry_run=dry_run)
+            elapsed = time.perf_counter() - start
+            assert not errors, errors
+            rows = sum(counts.values())
+            print("{:<24} {:>9.1f} s {:>12.0f} rows/s".format(
+                "validate" if dry_run else "import", elapsed,
+                rows / elapsed))
+        assert Service.query.count() == count
+        db.session.remove()
+        db.drop_all()
+    shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--format', default='csv', choices=['csv', 'ndjson'])
+    args = parser.parse_args()
+    run(args.rows, args.format)
@@ -0,0 +1,84 @@
+"""
+Time the nested listings and the cascading deletes with and without the
+indexes on the foreign keys.
+
+Usage:
+    python -m benchmarks.indexes --scale 20000 --requests 200
+
+A synthetic registry (see benchmarks.suite) is seeded into the sqlite
+testing database, whose tables are dropped and recreated, once with every
+index of the models and once without those on the foreign keys.
+"""
+import argparse
+import random
+import time
+
+from app import create_app, db
+from benchmarks.suite import LOCATIONS, PROGRAMS, seed
+
+ROUTES = [
+    ('programs', lambda org: '/api/organizations/{}/programs/'.format(org)),
+    ('services', lambda org: '/api/organizations/{}/programs/{}/services/'
+        .format(org, (org - 1) * PROGRAMS + 1)),
+    ('locations', lambda org: '/api/organizations/{}/locations/'.format(org)),
+    ('addresses', lambda org: '/api/organizations/{}/locations/{}/'
+        'addresses/'.format(org, (org - 1) * LOCATIONS + 1)),
+]
+
+
+def drop_foreign_key_indexes():
+    """Drop the indexes starting with a foreign key."""
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            # the expressions of the functional ones are not columns
+            columns = list(index.columns)
+            if columns and columns[0].foreign_keys:
+                index.drop(db.engine)
+
+
+def timed(label, client, method, paths):
+    start = time.perf_counter()
+    for path in paths:
+        res = client.open(path, method=method)
+        assert res.status_code < 300, (path, res.status_code)
+    elapsed = (time.perf_counter() - start) / len(paths)
+    print("{:<28} {:>9.2f} ms/request".format(label, elapsed * 1000))
+    return elapsed
+
+
+def run(scale, requests, indexed):
+    app = create_app('testing')
+    # every request goes to the database
+    app.extensions['cache'] = None
+    app.config['N_PLUS_ONE_THRESHOLD'] = float('inf')
+    client = app.test_client()
+    rng = random.Random(0)
+    results = {}
+    with app.app_context():
+        seed(scale, rng)
+        if not indexed:
+            drop_foreign_key_indexes()
+        for name, route in ROUTES:
+            paths = [route(rng.randint(1, scale)) for _ in range(requests)]
+            results[name] = timed("list " + name, client, 'GET', paths)
+        doomed = rng.sample(range(1, scale + 1), min(requests, scale))
+        results['delete'] = timed(
+            "delete organization", client, 'DELETE',
+            ['/api/organizations/{}'.format(org) for org in doomed])
+        db.session.remove()
+        db.drop_all()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--scale', type=int, default=20000,
+                        help='Number of organizations seeded')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    print("without the foreign key indexes")
+    before = run(args.scale, args.requests, False)
+    print("with the foreign key indexes")
+    after = run(args.scale, args.requests, True)
+    for name, elapsed in after.items():
+        print("{:<28} {:>9.0f}x".format(name, before[name] / elapsed))
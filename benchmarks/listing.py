@@ -0,0 +1,62 @@
+"""
+Compare listing rows through ORM instances against the column-only path.
+
+Usage:
+    python -m benchmarks.listing --rows 100000
+
+Rows are loaded from the sqlite testing database; its tables are dropped
+and recreated.
+"""
+import argparse
+import time
+
+from app import create_app, db
+from app.models import Service
+from app.serializers import row_serializer, serializer
+
+
+def timed(label, func, count):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    assert len(result) == count
+    print("{:<24} {:>9.1f} ms {:>12.0f} rows/s".format(
+        label, elapsed * 1000, count / elapsed))
+    return elapsed
+
+
+def orm_listing():
+    serialize = serializer(Service)
+    rows = Service.query.order_by(Service.id).all()
+    result = [serialize(service) for service in rows]
+    db.session.expunge_all()
+    return result
+
+
+def core_listing():
+    serialize = row_serializer(Service)
+    rows = db.session.execute(Service.select().order_by(Service.id))
+    return [serialize(row) for row in rows]
+
+
+def run(count):
+    with create_app('testing').app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.bulk_insert_mappings(Service, [
+            dict(name="Service {}".format(i), organization_id=1, program_id=1,
+                 email="service@mail.com", url="service.com", fees="1000",
+                 status="On") for i in range(count)])
+        db.session.commit()
+
+        orm = timed("ORM instances", orm_listing, count)
+        core = timed("Core select", core_listing, count)
+        print("speedup: {:.1f}x".format(orm / core))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    run(parser.parse_args().rows)
@@ -0,0 +1,107 @@
+"""
+Load test a running registry with many concurrent clients.
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi
+    python -m benchmarks.load --url http://127.0.0.1:5000 --clients 500
+
+Every client keeps a connection open (reopening it when the server closes
+it) and requests the paths in turn for `--duration` seconds. The requests
+per second and the latency percentiles are printed at the end. Only the
+standard library is used, so that the client is not the bottleneck.
+"""
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+PATHS = [
+    '/api/organizations/',
+    '/api/organizations/1',
+    '/api/organizations/1/programs/',
+    '/api/organizations/1/locations/',
+]
+
+
+async def request(reader, writer, host, path):
+    """Send a GET and read its response, return (status, keep alive)."""
+    writer.write('GET {} HTTP/1.1\r\nHost: {}\r\n\r\n'.format(
+        path, host).encode('ascii'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length, keep_alive = 0, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection' and value == 'close':
+            keep_alive = False
+    await reader.readexactly(length)
+    return status, keep_alive
+
+
+async def client(url, paths, deadline, latencies, errors):
+    host, port = url.hostname, url.port or 80
+    connection = None
+    turn = 0
+    while time.monotonic() < deadline:
+        path = paths[turn % len(paths)]
+        turn += 1
+        start = time.monotonic()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection(host, port)
+            status, keep_alive = await request(*connection, host, path)
+        except (OSError, ValueError, IndexError,
+                asyncio.IncompleteReadError):
+            errors.append('connection')
+            connection = None
+            continue
+        latencies.append(time.monotonic() - start)
+        if status != 200:
+            errors.append(status)
+        if not keep_alive:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(url, clients, duration, paths):
+    latencies, errors = [], []
+    start = time.monotonic()
+    await asyncio.gather(*[
+        client(url, paths, start + duration, latencies, errors)
+        for _ in range(clients)])
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    print("{} clients, {:.0f} s: {} requests, {} errors".format(
+        clients, elapsed, len(latencies), len(errors)))
+    if latencies:
+        print("{:.0f} requests/s, latency p50 {:.1f} ms, p90 {:.1f} ms, "
+              "p99 {:.1f} ms, max {:.1f} ms".format(
+                  len(latencies) / elapsed,
+                  *[percentile(latencies, f) * 1000
+                    for f in (0.5, 0.9, 0.99, 1)]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--paths', default=','.join(PATHS),
+                        help='Comma separated paths requested in turn')
+    args = parser.parse_args()
+    # asyncio.run is only in python 3.7
+    asyncio.get_event_loop().run_until_complete(run(
+        urlsplit(args.url), args.clients, args.duration,
+        args.paths.split(',')))
@@ -0,0 +1,75 @@
+"""
+Time the decoding of large bulk bodies, as json and as msgpack.
+
+Usage:
+    python -m benchmarks.payload --items 1000,10000,100000
+
+For every size, a bulk body of service items is decoded by app.payload in
+a request context, next to what the views used before: Flask's
+`request.get_json()` (the bulk views) and Flask-API's `request.data`. No
+database is needed.
+"""
+import argparse
+import json
+import time
+
+from flask import request
+
+from app import create_app
+from app.payload import msgpack, read_payload
+
+
+def items(count):
+    return [{"name": "Service {}".format(index), "organization_id": 1,
+             "program_id": index % 50 + 1, "email": "service@mail.com",
+             "url": "https://example.org/services/{}".format(index),
+             "fees": "0", "status": "active"}
+            for index in range(count)]
+
+
+def timed(app, decode, body, content_type, count, runs):
+    best = None
+    for _ in range(runs):
+        with app.test_request_context('/api/organizations/1/services/:bulk',
+                                      method='POST', data=body,
+                                      content_type=content_type):
+            start = time.perf_counter()
+            decoded = decode()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    assert len(decoded) == count
+    return best
+
+
+def run(sizes, runs):
+    app = create_app('testing', blueprints=())
+    app.config['MAX_CONTENT_LENGTH'] = None
+    formats = [
+        ('json', json.dumps, 'application/json', read_payload),
+        ('json get_json', json.dumps, 'application/json',
+         lambda: request.get_json(force=True)),
+        ('json data', json.dumps, 'application/json', lambda: request.data),
+    ]
+    if msgpack is not None:
+        formats.append(('msgpack', msgpack.packb, 'application/msgpack',
+                        read_payload))
+    with app.app_context():
+        for count in sizes:
+            payload = items(count)
+            for name, encode, content_type, decode in formats:
+                body = encode(payload)
+                elapsed = timed(app, decode, body, content_type, count,
+                                runs)
+                print("{:>7} items {:<14} {:>8.1f} kB {:>9.2f} ms "
+                      "{:>7.0f} MB/s".format(
+                          count, name, len(body) / 1024.0, elapsed * 1000,
+                          len(body) / elapsed / 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--items', default='1000,10000,100000',
+                        help='Comma separated numbers of items per body')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    run([int(size) for size in args.items.split(',')], args.runs)
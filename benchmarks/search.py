@@ -0,0 +1,74 @@
+"""
+Measure the latency of the organization name search against table size.
+
+Usage:
+    APP_SETTINGS=development DATABASE_URL=... python -m benchmarks.search \
+        --sizes 1000,10000,100000
+
+Without APP_SETTINGS the benchmark runs against the sqlite testing config.
+The tables are dropped and recreated, never point it at real data.
+"""
+import argparse
+import os
+import random
+import time
+
+from app import create_app, db
+from app.models import Organization
+
+WORDS = ["youth", "data", "hive", "learning", "center", "works", "code",
+         "city", "future", "bridge", "community", "health", "arts", "labs"]
+
+
+def seed(count, rng):
+    """Replace the organizations table with `count` synthetic rows."""
+    db.drop_all()
+    db.create_all()
+    rows = []
+    for i in range(count):
+        name = "{} {} {}".format(rng.choice(WORDS).title(),
+                                 rng.choice(WORDS).title(), i)
+        rows.append({"name": name, "description": "Synthetic org"})
+        if len(rows) == 10000:
+            db.session.bulk_insert_mappings(Organization, rows)
+            rows = []
+    db.session.bulk_insert_mappings(Organization, rows)
+    db.session.commit()
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+
+def run(sizes, repeat, terms):
+    app = create_app(os.getenv('APP_SETTINGS') or 'testing')
+    client = app.test_client()
+    rng = random.Random(42)
+    print("{:>10} {:>10} {:>10} {:>10}".format(
+        "rows", "p50 ms", "p95 ms", "max ms"))
+    with app.app_context():
+        for size in sizes:
+            seed(size, rng)
+            samples = []
+            for _ in range(repeat):
+                for term in terms:
+                    start = time.perf_counter()
+                    res = client.get('/api/organizations/?name=' + term)
+                    samples.append((time.perf_counter() - start) * 1000)
+                    assert res.status_code == 200
+            print("{:>10} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+                size, percentile(samples, 50), percentile(samples, 95),
+                max(samples)))
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--terms', default='hive,youth c,labs 9')
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(',')], args.repeat,
+        args.terms.split(','))
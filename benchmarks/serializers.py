@@ -0,0 +1,60 @@
+"""
+Compare the cached serializers against per-row mapper reflection.
+
+Usage:
+    python -m benchmarks.serializers --rows 100000
+
+Rows are loaded from the sqlite testing database; its tables are dropped
+and recreated.
+"""
+import argparse
+import time
+
+from sqlalchemy.orm import ColumnProperty, class_mapper
+
+from app import create_app, db
+from app.models import Service
+from app.serializers import serializer
+
+
+def reflect(obj):
+    """The mapper reflecting serializer BaseMixin.serialize used to be."""
+    result = {}
+    for prop in class_mapper(obj.__class__).iterate_properties:
+        if isinstance(prop, ColumnProperty):
+            result[prop.key] = getattr(obj, prop.key)
+    return result
+
+
+def timed(label, func, rows):
+    start = time.perf_counter()
+    for row in rows:
+        func(row)
+    elapsed = time.perf_counter() - start
+    print("{:<28} {:>9.1f} ms {:>12.0f} rows/s".format(
+        label, elapsed * 1000, len(rows) / elapsed))
+
+
+def run(count):
+    with create_app('testing').app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.bulk_insert_mappings(Service, [
+            dict(name="Service {}".format(i), organization_id=1, program_id=1,
+                 email="service@mail.com", url="service.com", fees="1000",
+                 status="On") for i in range(count)])
+        db.session.commit()
+        rows = Service.query.all()
+
+        timed("reflection", reflect, rows)
+        timed("cached serializer", serializer(Service), rows)
+        timed("cached serializer id,name",
+              serializer(Service, ('id', 'name')), rows)
+        db.session.remove()
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    run(parser.parse_args().rows)
@@ -0,0 +1,116 @@
+"""
+Measure the cold start of the entry points against their budgets.
+
+Usage:
+    python -m benchmarks.startup --runs 5
+
+Every entry point is started in a fresh interpreter `--runs` times (with
+the testing settings) and its median wall time compared to its budget.
+The packages taking the most time to import, as reported by
+`python -X importtime`, are listed for each of them when the interpreter
+has it (python 3.7 and later).
+"""
+import argparse
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.spec import load_spec
+
+# (name, code run by the interpreter, budget in ms); most of it goes to
+# importing flask and sqlalchemy, which every entry point needs
+ENTRY_POINTS = [
+    ('gunicorn worker (wsgi)', 'import wsgi', 550),
+    ('manage.py test', "import sys; sys.argv = ['manage.py', 'test']; "
+     "import manage", 550),
+    # alembic is imported for the db commands only
+    ('manage.py db', "import sys; sys.argv = ['manage.py', 'db']; "
+     "import manage", 800),
+]
+# the spec read from its cache by app.py, in ms
+SPEC_BUDGET = 5
+# -X importtime is ignored by the interpreters before 3.7
+IMPORTTIME = sys.version_info >= (3, 7)
+
+
+def _run(code, *options):
+    env = dict(os.environ, APP_SETTINGS='testing', PYTHONWARNINGS='ignore')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + list(options) + ['-c', code],
+                            env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, check=True)
+    return time.perf_counter() - start, result.stderr.decode()
+
+
+def slowest_imports(code, count):
+    """
+    Return the (ms, package) of the packages taking the most time to
+    import: the time spent in each of their modules, summed. None when the
+    interpreter cannot time its imports.
+    """
+    if not IMPORTTIME:
+        return None
+    _, report = _run(code, '-X', 'importtime')
+    packages = {}
+    for line in report.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(own) / 1000.0
+    return sorted(((ms, package) for package, ms in packages.items()),
+                  reverse=True)[:count]
+
+
+def run(runs, count):
+    over = []
+    for name, code, budget in ENTRY_POINTS:
+        try:
+            # the first start warms the caches: bytecode, spec, disk
+            _run(code)
+            elapsed = statistics.median(_run(code)[0] for _ in range(runs))
+        except subprocess.CalledProcessError as e:
+            over.append(name)
+            print("{:<26} failed to start: {}".format(
+                name, e.stderr.decode().strip().splitlines()[-1]))
+            continue
+        status = 'ok' if elapsed * 1000 <= budget else 'OVER BUDGET'
+        if elapsed * 1000 > budget:
+            over.append(name)
+        print("{:<26} {:>7.0f} ms  budget {:>4} ms  {}".format(
+            name, elapsed * 1000, budget, status))
+        imports = slowest_imports(code, count)
+        if imports is None:
+            print("    slowest imports unavailable: -X importtime needs "
+                  "python 3.7, this is {}".format(platform.python_version()))
+            continue
+        for ms, package in imports:
+            print("    {:>7.1f} ms  {}".format(ms, package))
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        start = time.perf_counter()
+        load_spec(cache_dir=cache_dir)
+        parsed = time.perf_counter() - start
+        start = time.perf_counter()
+        load_spec(cache_dir=cache_dir)
+        cached = time.perf_counter() - start
+    if cached * 1000 > SPEC_BUDGET:
+        over.append('openapi spec')
+    print("{:<26} {:>7.1f} ms  budget {:>4} ms  {} (parsed in {:.0f} ms)"
+          .format('openapi spec (cached)', cached * 1000, SPEC_BUDGET,
+                  'ok' if cached * 1000 <= SPEC_BUDGET else 'OVER BUDGET',
+                  parsed * 1000))
+    return over
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--imports', type=int, default=8,
+                        help='Slowest imports listed per entry point')
+    args = parser.parse_args()
+    sys.exit(1 if run(args.runs, args.imports) else 0)
@@ -0,0 +1,359 @@
+"""
+Benchmark the REST API end to end and record the results as json.
+
+Usage:
+    python manage.py bench --scale 1000 --requests 200 --output bench.json
+    python manage.py bench --compare bench.json
+    python manage.py bench --accept-encoding gzip --compare bench.json
+
+A synthetic registry of `scale` organizations (each with programs,
+services, locations and addresses) is seeded into the sqlite testing
+database by default; its tables are dropped and recreated, never point it
+at real data: other settings than testing and development are refused
+unless `--i-know-this-drops-tables` is given. Every scenario is then run
+through the Flask test client and over real HTTP, against a server
+started in process or the one at `--url`, and reported with its
+throughput, latency percentiles, queries per request, memory and the
+bytes of its responses (compressed as the `--accept-encoding` sent says).
+
+The response cache is off, the scenarios repeating the same urls would
+mostly measure it; `--cache` runs them a second time with the cache on,
+reported apart as the `client+cache` and `http+cache` transports.
+"""
+import json
+import platform
+import random
+import resource
+import socket
+import subprocess
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime
+from http.client import HTTPConnection
+from urllib.parse import urlsplit
+
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import create_app, db
+from app.models import (Location, Organization, PhysicalAddress, Program,
+                        Service, ServiceLocation)
+
+WORDS = ["youth", "data", "hive", "learning", "center", "works", "code",
+         "city", "future", "bridge", "community", "health", "arts", "labs"]
+
+# the settings whose tables the benchmarks drop without asking
+DISPOSABLE_CONFIGS = ('testing', 'development')
+
+# rows seeded for every organization
+PROGRAMS, SERVICES, LOCATIONS = 2, 3, 2
+
+# name -> function(rng, scale) returning the (method, path, json body) of
+# a request
+SCENARIOS = OrderedDict([
+    ('list_organizations', lambda rng, scale: (
+        'GET', '/api/organizations/?limit=100', None)),
+    ('get_organization', lambda rng, scale: (
+        'GET', '/api/organizations/{}'.format(rng.randint(1, scale)), None)),
+    ('search_organizations', lambda rng, scale: (
+        'GET', '/api/organizations/?name={}'.format(rng.choice(WORDS)),
+        None)),
+    ('list_nested_services', lambda rng, scale: _nested_services(rng, scale)),
+    ('expand_organization', lambda rng, scale: (
+        'GET', '/api/organizations/{}?expand=programs,services,'
+        'locations.addresses'.format(rng.randint(1, scale)), None)),
+    ('near_locations', lambda rng, scale: (
+        'GET', '/api/locations/near?lat={:.4f}&lon={:.4f}&limit=10'.format(
+            rng.uniform(25, 49), rng.uniform(-124, -67)), None)),
+    ('create_program', lambda rng, scale: (
+        'POST', '/api/organizations/{}/programs/'.format(
+            rng.randint(1, scale)), {"name": "Benchmark program"})),
+    ('update_program', lambda rng, scale: _update_program(rng, scale)),
+])
+
+
+def _nested_services(rng, scale):
+    organization = rng.randint(1, scale)
+    return ('GET', '/api/organizations/{}/programs/{}/services/'.format(
+        organization, (organization - 1) * PROGRAMS + 1), None)
+
+
+def _update_program(rng, scale):
+    organization = rng.randint(1, scale)
+    program = (organization - 1) * PROGRAMS + rng.randint(1, PROGRAMS)
+    return ('PUT', '/api/organizations/{}/programs/{}'.format(
+        organization, program), {"alternate_name": "Updated"})
+
+
+def seed(scale, rng):
+    """Replace the registry with `scale` synthetic organizations."""
+    db.drop_all()
+    db.create_all()
+    for start in range(1, scale + 1, 1000):
+        ids = range(start, min(start + 1000, scale + 1))
+        db.session.bulk_insert_mappings(Organization, [dict(
+            id=i, name="{} {} {}".format(rng.choice(WORDS).title(),
+                                         rng.choice(WORDS).title(), i),
+            description="Synthetic organization") for i in ids])
+        db.session.bulk_insert_mappings(Program, [dict(
+            organization_id=i, name="Program {}".format(j))
+            for i in ids for j in range(PROGRAMS)])
+        db.session.bulk_insert_mappings(Service, [dict(
+            organization_id=i, program_id=(i - 1) * PROGRAMS + 1,
+            name="Service {}".format(j), status="On")
+            for i in ids for j in range(SERVICES)])
+        db.session.bulk_insert_mappings(Location, [dict(
+            organization_id=i, name="Location {}".format(j),
+            latitude=rng.uniform(25, 49), longitude=rng.uniform(-124, -67))
+            for i in ids for j in range(LOCATIONS)])
+        db.session.bulk_insert_mappings(PhysicalAddress, [dict(
+            location_id=(i - 1) * LOCATIONS + j + 1, address="1 Main St",
+            city="Chicago", state="Illinois", postal_code="60621",
+            country="US") for i in ids for j in range(LOCATIONS)])
+        db.session.bulk_insert_mappings(ServiceLocation, [dict(
+            service_id=(i - 1) * SERVICES + j + 1,
+            location_id=(i - 1) * LOCATIONS + 1, description="Main")
+            for i in ids for j in range(SERVICES)])
+    db.session.commit()
+
+
+class QueryCounter(object):
+    """Count the statements an engine executes."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+class QuietHandler(WSGIRequestHandler):
+    """A request handler keeping connections alive, without access logs."""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # headers and body are written apart, do not wait for an ack
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_request(self, *args):
+        pass
+
+
+class ClientTransport(object):
+    """Send the requests through the Flask test client."""
+    name = 'client'
+
+    def __init__(self, app, headers=None):
+        self.client = app.test_client()
+        self.headers = headers or {}
+
+    def __call__(self, method, path, body):
+        """Send a request, return its status and the size of its body."""
+        kwargs = {}
+        if body is not None:
+            kwargs = dict(data=json.dumps(body),
+                          content_type='application/json')
+        res = self.client.open(path, method=method, headers=self.headers,
+                               **kwargs)
+        return res.status_code, len(res.get_data())
+
+    def close(self):
+        pass
+
+
+class HTTPTransport(object):
+    """Send the requests over a keep-alive HTTP connection to a server."""
+    name = 'http'
+
+    def __init__(self, url, headers=None):
+        self.headers = headers or {}
+        url = urlsplit(url)
+        self.connection = HTTPConnection(url.hostname, url.port or 80)
+        self.connection.connect()
+        self.connection.sock.setsockopt(socket.IPPROTO_TCP,
+                                        socket.TCP_NODELAY, 1)
+
+    def __call__(self, method, path, body):
+        headers = dict(self.headers)
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        self.connection.request(method, path, body, headers)
+        res = self.connection.getresponse()
+        return res.status, len(res.read())
+
+    def close(self):
+        self.connection.close()
+
+
+def percentile(samples, pct):
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+
+def measure(send, scenario, count, rng, scale, counter):
+    """Run a scenario `count` times and return its statistics."""
+    build = SCENARIOS[scenario]
+    # warm up the caches and the connection first
+    send(*build(rng, scale))
+    queries = counter.count if counter is not None else 0
+    samples, errors, received = [], 0, 0
+    start = time.perf_counter()
+    for _ in range(count):
+        request = build(rng, scale)
+        sent = time.perf_counter()
+        status, size = send(*request)
+        samples.append((time.perf_counter() - sent) * 1000)
+        received += size
+        if status >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - start
+    samples.sort()
+    result = OrderedDict([
+        ('requests', count),
+        ('errors', errors),
+        ('throughput', round(count / elapsed, 1)),
+        ('p50_ms', round(percentile(samples, 50), 3)),
+        ('p95_ms', round(percentile(samples, 95), 3)),
+        ('p99_ms', round(percentile(samples, 99), 3)),
+        ('queries_per_request', None if counter is None else
+         round((counter.count - queries) / count, 2)),
+        ('response_bytes', round(received / count)),
+    ])
+    # the memory allocated while serving a single request, in process only
+    if counter is not None:
+        tracemalloc.start()
+        send(*build(rng, scale))
+        result['peak_memory_kb'] = round(
+            tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return result
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(config='testing', scale=1000, requests=200, transports=None,
+        url=None, scenarios=None, cache=False, seed_value=42,
+        accept_encoding=None, drop_tables=False):
+    """
+    Seed the registry and run the scenarios over every transport, return
+    the results as a json serializable dict. The response cache of the app
+    run in process is disabled, `cache` measures the scenarios once more
+    with it, under the transport names suffixed with +cache (a server at
+    `url` is measured as it is configured). `accept_encoding` is sent
+    with every request, for compressed responses. The tables of the
+    settings other than DISPOSABLE_CONFIGS are only dropped with
+    `drop_tables` set.
+    """
+    if config not in DISPOSABLE_CONFIGS and not drop_tables:
+        raise ValueError("The tables of the {} database would be dropped, "
+                         "pass drop_tables to go on".format(config))
+    transports = transports or ['client', 'http']
+    scenarios = scenarios or list(SCENARIOS)
+    unknown = set(scenarios).difference(SCENARIOS)
+    if unknown:
+        raise ValueError("Unknown scenarios: {}".format(
+            ', '.join(sorted(unknown))))
+    app = create_app(config)
+    # (suffix of the transport names, response cache) of every run
+    runs = [('', None)]
+    if cache and app.extensions['cache'] is not None:
+        runs.append(('+cache', app.extensions['cache']))
+    rng = random.Random(seed_value)
+    results = OrderedDict()
+    with app.app_context():
+        start = time.perf_counter()
+        seed(scale, rng)
+        seeding = time.perf_counter() - start
+        counter = QueryCounter(db.engine)
+        dialect = db.engine.dialect.name
+
+        server = None
+        if 'http' in transports and url is None:
+            server = make_server('127.0.0.1', 0, app, threaded=True,
+                                 request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = 'http://127.0.0.1:{}'.format(server.server_port)
+        try:
+            headers = {}
+            if accept_encoding:
+                headers['Accept-Encoding'] = accept_encoding
+            for name in transports:
+                if name == 'client':
+                    send = ClientTransport(app, headers)
+                else:
+                    send = HTTPTransport(url, headers)
+                # a server elsewhere runs its own queries, with its cache
+                counted = counter if name == 'client' or server else None
+                for suffix, response_cache in runs:
+                    if suffix and counted is None:
+                        continue
+                    app.extensions['cache'] = response_cache
+                    for scenario in scenarios:
+                        results.setdefault(scenario, OrderedDict())[
+                            name + suffix] = measure(
+                                send, scenario, requests, rng, scale,
+                                counted)
+                send.close()
+        finally:
+            if server is not None:
+                server.shutdown()
+            db.session.remove()
+            db.drop_all()
+
+    return OrderedDict([
+        ('date', datetime.utcnow().isoformat()),
+        ('commit', _commit()),
+        ('python', platform.python_version()),
+        ('database', dialect),
+        ('scale', scale),
+        ('cache', len(runs) > 1),
+        ('accept_encoding', accept_encoding),
+        ('requests', requests),
+        ('seed_seconds', round(seeding, 2)),
+        ('max_rss_kb', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss),
+        ('results', results),
+    ])
+
+
+def report(bench, baseline=None):
+    """Return the results as a table, against a baseline run if any."""
+    lines = ["{:<22} {:<12} {:>9} {:>9} {:>9} {:>9} {:>8} {:>9} {:>9}".format(
+        "scenario", "via", "req/s", "p50 ms", "p95 ms", "p99 ms",
+        "queries", "mem kB", "resp kB")]
+    for scenario, transports in bench['results'].items():
+        for name, result in transports.items():
+            line = "{:<22} {:<12} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                scenario, name, result['throughput'], result['p50_ms'],
+                result['p95_ms'], result['p99_ms'])
+            queries = result['queries_per_request']
+            line += " {:>8}".format('-' if queries is None else queries)
+            line += " {:>9}".format(result.get('peak_memory_kb', '-'))
+            size = result.get('response_bytes')
+            line += " {:>9}".format('-' if size is None else
+                                    round(size / 1024.0, 1))
+            try:
+                before = baseline['results'][scenario][name]
+            except (KeyError, TypeError):
+                before = None
+            if before is not None:
+                line += "  p50 {:+.0%} req/s {:+.0%}".format(
+                    result['p50_ms'] / before['p50_ms'] - 1,
+                    result['throughput'] / before['throughput'] - 1)
+                if size and before.get('response_bytes'):
+                    line += " kB {:+.0%}".format(
+                        size / before['response_bytes'] - 1)
+            if result['errors']:
+                line += "  {} errors".format(result['errors'])
+            lines.append(line)
+    return '\n'.join(lines)
@@ -0,0 +1,108 @@
+"""
+Measure what validating the bodies against the swagger definitions costs.
+
+Usage:
+    python -m benchmarks.validation --requests 5000
+
+The compiled validators are timed on their own (next to jsonschema, when it
+is installed), then what they add to a request, apart from reading the body
+that the views read anyway. No database is needed.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from flask import request
+
+from app import create_app
+from app.models import Location
+from app.spec import load_spec
+from app.payload import read_payload
+from app.validation import compile_definition, validated
+
+PAYLOADS = {
+    'Organization': {"name": "BHive", "description": "A bee hive of data",
+                     "email": "hello@bhive.org", "url": "bhive.org"},
+    'Location': {"name": "Chicago", "organization_id": 1,
+                 "description": "The windy city", "latitude": 41.8781,
+                 "longitude": -87.6298},
+    'Address': {"location_id": 1, "address": "1 Main St", "city": "Chicago",
+                "state": "IL", "postal_code": "60601", "country": "US"},
+}
+
+
+def per_call(func, payload, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func(payload)
+    return (time.perf_counter() - start) / count
+
+
+def validators(count):
+    definitions = load_spec()['definitions']
+    try:
+        from jsonschema import Draft4Validator
+    except ImportError:
+        Draft4Validator = None
+    for name, payload in PAYLOADS.items():
+        compiled = per_call(compile_definition(definitions[name]), payload,
+                            count)
+        line = "{:<28} {:>9.2f} us".format("validate " + name,
+                                           compiled * 1e6)
+        if Draft4Validator is not None:
+            schema = Draft4Validator(definitions[name])
+            generic = per_call(lambda p: list(schema.iter_errors(p)),
+                               payload, count)
+            line += "  jsonschema {:>7.1f} us".format(generic * 1e6)
+        print(line)
+
+
+def overhead(app, method, count, **body):
+    """
+    Return the median time a request takes to read its body and the one
+    the validation adds to it. Each call gets a fresh request context, as
+    the body is parsed once per request, and only the call is timed.
+    """
+    view = validated(Location)(lambda **kwargs: None)
+    path = '/api/organizations/1/locations/1'
+    elapsed = []
+    for func in (read_payload,
+                 lambda: view(organization_id=1, location_id=1)):
+        times = []
+        for _ in range(count):
+            with app.test_request_context(path, method=method, **body):
+                # read by the dispatch of the views first
+                request.method
+                start = time.perf_counter()
+                func()
+                times.append(time.perf_counter() - start)
+        elapsed.append(statistics.median(times))
+    return elapsed[0], elapsed[1] - elapsed[0]
+
+
+def run(count):
+    validators(count * 10)
+    app = create_app('testing', blueprints=())
+    with app.app_context():
+        requests = [
+            ('PUT json', 'PUT', {
+                'data': json.dumps({"description": "Still windy",
+                                    "latitude": 41.9}),
+                'content_type': 'application/json'}),
+            ('POST form', 'POST', {'data': PAYLOADS['Location']}),
+            ('POST json', 'POST', {
+                'data': json.dumps(PAYLOADS['Location']),
+                'content_type': 'application/json'}),
+        ]
+        for label, method, body in requests:
+            read, checked = overhead(app, method, count, **body)
+            print("{:<28} {:>9.2f} us/request  (reading the body {:.1f} us)"
+                  .format(label + " location", checked * 1e6, read * 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+    run(args.requests)
@@ -0,0 +1,49 @@
+"""
+Gunicorn settings of the registry, used with:
+
+    gunicorn -c gunicorn.conf.py wsgi
+
+Workers are sync ones by default, each serving one request at a time.
+GUNICORN_WORKER_CLASS=gevent makes each serve up to
+GUNICORN_WORKER_CONNECTIONS requests at once, switching to another while
+one waits on postgres instead of blocking on every round trip.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = '0.0.0.0:{}'.format(os.getenv('PORT', '5000'))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+# requests are concurrent within a gevent worker, one per core is enough;
+# sync workers wait on the database, gunicorn's 2 per core + 1 keep it busy
+cores = multiprocessing.cpu_count()
+workers = int(os.getenv('GUNICORN_WORKERS', cores if worker_class == 'gevent'
+                        else 2 * cores + 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# connections beyond what the workers take wait in the listen queue
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+
+
+def on_starting(server):
+    """
+    Give the workers an empty directory to write their metrics to, for
+    /metrics to add up those of every worker (see app.metrics).
+    """
+    directory = os.getenv('METRICS_DIR')
+    if directory is None:
+        os.environ['METRICS_DIR'] = tempfile.mkdtemp(
+            prefix='registry-metrics-')
+        return
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+
+
+def post_worker_init(worker):
+    """Make psycopg2 yield to the other greenlets while it waits."""
+    if worker_class == 'gevent' and \
+            os.getenv('DATABASE_URL', '').startswith('postgres'):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -11,6 +11,7 @@ if [ ! -d "$DIRECTORY" ]; then
   python3 manage.py db init
 fi
 python3 manage.py db migrate
+python3 manage.py create_extensions
 python3 manage.py db upgrade
 python3 manage.py test
-python3 app.py
+exec gunicorn -c gunicorn.conf.py wsgi
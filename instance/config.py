@@ -2,17 +2,96 @@ import os
 import tempfile
 
 
+def _shared_cache_backend():
+    """
+    Return the cache backend of the deployments running several workers:
+    redis when CACHE_REDIS_URL is set, none otherwise. A memory cache is
+    per process, so a write would only invalidate the responses cached by
+    the worker making it, the others serving stale bodies (and answering
+    304 to stale ETags) for up to CACHE_TTL seconds.
+    """
+    if os.getenv('CACHE_REDIS_URL'):
+        return 'redis'
+    # gunicorn.conf.py runs several workers unless told otherwise
+    return 'memory' if os.getenv('GUNICORN_WORKERS') == '1' else 'none'
+
+
 class Config(object):
     """Parent configuration class."""
     DEBUG = False
     CSRF_ENABLED = True
     SECRET = os.getenv('SECRET')
+    # connections kept open per worker process, and the extra ones opened
+    # under load; a sync worker uses one at a time but gevent workers serve
+    # many requests at once, so keep workers * (pool size + overflow) below
+    # postgres' max_connections with them
+    SQLALCHEMY_POOL_SIZE = int(os.getenv('SQLALCHEMY_POOL_SIZE', 10))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', 10))
+    # seconds a request waits for a connection before failing
+    SQLALCHEMY_POOL_TIMEOUT = int(os.getenv('SQLALCHEMY_POOL_TIMEOUT', 10))
+    # seconds after which connections are replaced, and whether they are
+    # tested before use, to survive database restarts and idle timeouts
+    SQLALCHEMY_POOL_RECYCLE = int(os.getenv('SQLALCHEMY_POOL_RECYCLE', 1800))
+    SQLALCHEMY_POOL_PRE_PING = os.getenv(
+        'SQLALCHEMY_POOL_PRE_PING', 'true').lower() == 'true'
+    # page sizes for the collection endpoints
+    PAGINATION_DEFAULT_LIMIT = int(os.getenv('PAGINATION_DEFAULT_LIMIT', 100))
+    PAGINATION_MAX_LIMIT = int(os.getenv('PAGINATION_MAX_LIMIT', 1000))
+    # rows fetched per round trip when streaming a whole collection
+    STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 1000))
+    # rows written per statement by the bulk endpoints and imports
+    BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', 1000))
+    # largest request body accepted, in bytes (413 above), the bulk ones
+    # being the largest
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH',
+                                       16 * 1024 * 1024))
+    # json encoding of the responses: orjson, ujson, json (the standard
+    # library) or auto, the fastest one installed
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+    # compression of the responses, with brotli (when installed) or gzip as
+    # the client accepts: bodies under COMPRESSION_MIN_SIZE bytes are sent
+    # as they are, streamed ones are always compressed. Higher levels (1-9
+    # for gzip, 0-11 for brotli) save bandwidth for more CPU
+    COMPRESSION = os.getenv('COMPRESSION', 'true').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+    COMPRESSION_BROTLI_LEVEL = int(os.getenv('COMPRESSION_BROTLI_LEVEL', 4))
+    # response cache of the GET endpoints: memory (per process, only right
+    # with a single worker), redis (shared, needs the redis package) or none
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 60))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    # distance searches: the cell size, in degrees, of the in-process grid
+    # used off postgres, how far back (in seconds) it looks for the writes
+    # it catches up with and how often it is rebuilt anyway, and the radius,
+    # in km, nearest searches start from
+    GEO_GRID_CELL = float(os.getenv('GEO_GRID_CELL', 0.1))
+    GEO_REFRESH_WINDOW = int(os.getenv('GEO_REFRESH_WINDOW', 60))
+    GEO_REBUILD_AGE = int(os.getenv('GEO_REBUILD_AGE', 600))
+    GEO_SEARCH_RADIUS = float(os.getenv('GEO_SEARCH_RADIUS', 10))
+    # report the time spent on SQL, json encoding and the whole request in
+    # a Server-Timing header, and log the requests running a statement this
+    # many times (N+1 queries)
+    SERVER_TIMING = os.getenv('SERVER_TIMING', 'true').lower() == 'true'
+    N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+    # the directory the worker processes write their metrics to, every
+    # this many seconds, for /metrics to add them up (gunicorn.conf.py
+    # makes one); the metrics of the answering process only when unset
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    METRICS_WRITE_INTERVAL = float(os.getenv('METRICS_WRITE_INTERVAL', 1))
+    # the change feed leaves out the last seconds of changes, stamped when
+    # flushed, until the transactions writing them have had time to commit:
+    # keep it over the longest write transaction (and the clock skew)
+    CHANGES_DELAY = int(os.getenv('CHANGES_DELAY', 30))
 
 
 class DevelopmentConfig(Config):
     """Configurations for Development."""
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
+    # init.sh starts gunicorn with several workers under these settings too
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', _shared_cache_backend())
 
 
 class TestingConfig(Config):
@@ -22,6 +101,7 @@ class TestingConfig(Config):
     DB_FD, DATABASE = tempfile.mkstemp()
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(DATABASE)
     SECRET = "Secret"
+    CHANGES_DELAY = 0
 
 
 class StagingConfig(Config):
@@ -34,6 +114,8 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
+    # gunicorn runs a worker per core, which must share their cache
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', _shared_cache_backend())
 
 
 app_config = {
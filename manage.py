@@ -1,20 +1,149 @@
+import json
 import os
+import sys
 import unittest
 
-from flask_script import Manager
-from flask_migrate import Migrate, MigrateCommand
-from app import db, create_app
+from flask_script import Command, Manager, Option
+from app import BLUEPRINTS, db, create_app
+from app.export import FORMATS, TABLES, export as export_tables
+from app.importer import import_tables
+from app.indexes import unindexed_columns
+from app.models import CREATE_EXTENSIONS
 
+# every command starts the app: only those serving requests import the
+# views, and only db (or the help listing it) imports alembic
+COMMAND = sys.argv[1] if len(sys.argv) > 1 else None
+SERVING = ('runserver', 'shell')
 
-app = create_app(config_name=os.getenv('APP_SETTINGS'))
-migrate = Migrate(app, db)
+app = create_app(config_name=os.getenv('APP_SETTINGS'),
+                 blueprints=BLUEPRINTS if COMMAND in SERVING else ())
 
 # create an instance of the command handling class
 manager = Manager(app)
 
 # Define the migration command to always be prepended by the word "db"
 # Example usage: python manage.py db init
-manager.add_command('db', MigrateCommand)
+if COMMAND in (None, 'db', '-?', '-h', '--help'):
+    from flask_migrate import Migrate, MigrateCommand
+    migrate = Migrate(app, db)
+    manager.add_command('db', MigrateCommand)
+
+
+class ImportCommand(Command):
+    """Load the <input>/<table>.<format> files written by export."""
+
+    option_list = (
+        Option('-i', '--input', dest='directory', default='export',
+               help='Directory the files are read from'),
+        Option('-f', '--format', dest='fmt', default='ndjson',
+               choices=sorted(FORMATS), help='Format of the files'),
+        Option('-t', '--tables', dest='tables', default=None,
+               help='Comma separated tables to import, by default those '
+               'with a file'),
+        Option('--dry-run', dest='dry_run', action='store_true',
+               help='Only validate the files'),
+    )
+
+    def run(self, directory, fmt, tables, dry_run):
+        if tables is not None:
+            tables = [table.strip() for table in tables.split(',')]
+        counts, errors = import_tables(directory, fmt, tables, dry_run)
+        for error in errors:
+            print(error)
+        for table, count in counts.items():
+            print('{}: {} rows'.format(table, count))
+        if errors:
+            return 1
+        return 0
+
+
+manager.add_command('import', ImportCommand())
+
+
+@manager.command
+def create_extensions():
+    """Create the postgres extensions the schema depends on (pg_trgm)."""
+    if db.engine.dialect.name == 'postgresql':
+        db.engine.execute(CREATE_EXTENSIONS)
+
+
+@manager.command
+def check_indexes():
+    """Report the filtered columns no index of the database starts with."""
+    missing = unindexed_columns()
+    for table, column in missing:
+        print('{}.{} is not indexed'.format(table, column))
+    if missing:
+        print('Generate and apply the missing migration with db migrate and '
+              'db upgrade')
+        return 1
+    return 0
+
+
+@manager.option('-o', '--output', dest='output', default='export',
+                help='Directory the files are written to')
+@manager.option('-f', '--format', dest='fmt', default='ndjson',
+                choices=sorted(FORMATS), help='Format of the files')
+@manager.option('-t', '--tables', dest='tables', default=None,
+                help='Comma separated tables to export, all by default: '
+                '{}'.format(', '.join(TABLES)))
+def export(output, fmt, tables):
+    """Dump the registry tables to <output>/<table>.<format> files."""
+    if tables is not None:
+        tables = [table.strip() for table in tables.split(',')]
+    for path in export_tables(output, fmt, tables):
+        print(path)
+
+
+@manager.option('-c', '--config', dest='config', default='testing',
+                help='Settings of the database seeded, whose tables are '
+                'dropped: testing (sqlite) by default')
+@manager.option('-s', '--scale', dest='scale', type=int, default=1000,
+                help='Number of organizations seeded')
+@manager.option('-n', '--requests', dest='requests', type=int, default=200,
+                help='Requests per scenario and transport')
+@manager.option('-t', '--transports', dest='transports',
+                default='client,http', help='Comma separated transports')
+@manager.option('-u', '--url', dest='url', default=None,
+                help='Server the http transport targets, one started in '
+                'process by default')
+@manager.option('--scenarios', dest='scenarios', default=None,
+                help='Comma separated scenarios, all of those of '
+                'benchmarks.suite by default')
+@manager.option('--cache', dest='cache', action='store_true',
+                help='Also run the scenarios with the response cache of the '
+                'app, reported apart')
+@manager.option('--accept-encoding', dest='accept_encoding', default=None,
+                help='Accept-Encoding sent, e.g. gzip or br, for compressed '
+                'responses')
+@manager.option('-o', '--output', dest='output', default=None,
+                help='File the json results are written to')
+@manager.option('--compare', dest='compare', default=None,
+                help='Json results of a previous run to compare against')
+@manager.option('--i-know-this-drops-tables', dest='drop_tables',
+                action='store_true',
+                help='Run with other settings than testing and development')
+def bench(config, scale, requests, transports, url, scenarios, cache,
+          accept_encoding, output, compare, drop_tables):
+    """Benchmark the API endpoints on a synthetic registry."""
+    from benchmarks import suite
+    if config not in suite.DISPOSABLE_CONFIGS and not drop_tables:
+        print("bench drops the tables of the {} database, pass "
+              "--i-know-this-drops-tables to go on".format(config))
+        return 1
+    if scenarios is not None:
+        scenarios = [scenario.strip() for scenario in scenarios.split(',')]
+    results = suite.run(config, scale, requests, transports.split(','), url,
+                        scenarios, cache, accept_encoding=accept_encoding,
+                        drop_tables=drop_tables)
+    baseline = None
+    if compare is not None:
+        with open(compare) as f:
+            baseline = json.load(f)
+    print(suite.report(results, baseline))
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
 
 
 @manager.command
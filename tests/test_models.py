@@ -2,9 +2,13 @@
 import unittest
 import os
 
+from datetime import datetime
+
 from app import create_app, db
 from app.models import Organization, Service, Program, Location, \
     ServiceLocation, PhysicalAddress
+from app.indexes import filter_columns, unindexed_columns
+from app.serializers import row_serializer
 from instance import config
 
 
@@ -40,6 +44,39 @@ class OrganizationTestCase(BaseTestCase):
         new_count = Organization.query.count()
         self.assertNotEqual(new_count, old_count)
 
+    def test_organization_serialization(self):
+        """Test that an organization serializes to all or some columns."""
+        organization = Organization(name="Test-Org",
+                                    description="Test Description")
+        organization.save()
+        self.assertEqual(organization.serialize(), {
+            "id": organization.id,
+            "name": "Test-Org",
+            "description": "Test Description",
+            "email": None,
+            "url": None,
+            "year_incorporated": None,
+            "version": 1,
+            "created_at": organization.created_at,
+            "updated_at": organization.updated_at
+        })
+        self.assertEqual(organization.serialize(fields=["id", "name"]),
+                         {"id": organization.id, "name": "Test-Org"})
+
+    def test_core_rows_serialize_like_instances(self):
+        """Test that the column-only read path matches serialize()."""
+        organization = Organization(name="Test-Org",
+                                    description="Test Description",
+                                    year_incorporated=datetime(2016, 5, 1))
+        organization.save()
+        row = db.session.execute(Organization.select()).first()
+        self.assertEqual(row_serializer(Organization)(row),
+                         organization.serialize())
+
+        row = db.session.execute(Organization.select(["name"])).first()
+        self.assertEqual(row_serializer(Organization, ["name"])(row),
+                         {"name": "Test-Org"})
+
 
 class ProgramTestCase(BaseTestCase):
     """This class represents the program model test case."""
@@ -165,5 +202,18 @@ class PhysicalAddressModelTestCase(BaseTestCase):
         self.assertNotEqual(new_count, old_count)
 
 
+class IndexTestCase(BaseTestCase):
+    """This class represents the tests of the indexes of the models."""
+
+    def test_filter_columns_are_indexed(self):
+        """Test that every foreign key and update time starts an index."""
+        self.assertIn(('service_location', 'location_id'), filter_columns())
+        self.assertEqual(unindexed_columns(), [])
+
+        db.engine.execute('DROP INDEX ix_program_organization_id_name')
+        self.assertEqual(unindexed_columns(),
+                         [('program', 'organization_id')])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,9 +1,27 @@
 # test suite for API views
 import unittest
+import gzip
 import os
 import json
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
 
 from app import create_app, db
+from app import encoding, metrics
+from app.compression import brotli
+from app.export import TABLES, export
+from app.importer import import_tables
+from app.payload import msgpack
+from app.serializers import parse_isoformat
+from app.spec import SPEC_PATH, load_spec
+from app.models import (CollectionVersion, Location, Organization,
+                        PhysicalAddress, Program, Service, ServiceLocation,
+                        Tombstone)
 from instance import config
 
 
@@ -33,8 +51,8 @@ class BaseTestCase(unittest.TestCase):
             "organization_id": 1,
             "description": "The windy city",
             "transportation": "Train, Uber",
-            "longitude": "N41.8781",
-            "latitude": "W87.6298"
+            "latitude": 41.8781,
+            "longitude": -87.6298
         }
 
         self.app_context = self.app.app_context()
@@ -73,6 +91,48 @@ class OrganizationViewTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn("Andela", str(response.data))
 
+    def test_view_paginates_organizations(self):
+        """Test that the org list can be walked page by page with cursors."""
+        for name in ["BHive", "Udacity", "Andela"]:
+            self.client().post('/api/organizations/',
+                               data={"name": name, "description": "An org"})
+
+        res = self.client().get('/api/organizations/?limit=2')
+        self.assertEqual(res.status_code, 200)
+        first_page = json.loads(res.data.decode())
+        self.assertEqual([org['name'] for org in first_page],
+                         ["BHive", "Udacity"])
+        link = res.headers['Link']
+        self.assertIn('rel="next"', link)
+
+        # follow the next link to the last page
+        next_url = link[link.index('<') + 1:link.index('>')]
+        res = self.client().get(next_url)
+        self.assertEqual(res.status_code, 200)
+        last_page = json.loads(res.data.decode())
+        self.assertEqual([org['name'] for org in last_page], ["Andela"])
+        self.assertNotIn('Link', res.headers)
+
+    def test_view_can_stream_organizations(self):
+        """Test that the stream mode returns the whole collection at once."""
+        for name in ["BHive", "Udacity", "Andela"]:
+            self.client().post('/api/organizations/',
+                               data={"name": name, "description": "An org"})
+
+        res = self.client().get('/api/organizations/?stream=true&limit=1')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/json')
+        names = [org['name'] for org in json.loads(res.data.decode())]
+        self.assertEqual(names, ["BHive", "Udacity", "Andela"])
+        self.assertNotIn('Link', res.headers)
+
+    def test_view_rejects_invalid_cursors(self):
+        """Test that a malformed cursor or limit returns a 400."""
+        res = self.client().get('/api/organizations/?after=not-a-cursor')
+        self.assertEqual(res.status_code, 400)
+        res = self.client().get('/api/organizations/?limit=0')
+        self.assertEqual(res.status_code, 400)
+
     def test_view_can_search_for_org_by_name(self):
         """Tests users can search for an existing org by name"""
 
@@ -103,6 +163,133 @@ class OrganizationViewTestCase(BaseTestCase):
         self.assertEqual(results_length, 1)
         self.assertIn("BHive", str(rv.data))
 
+    def test_view_ranks_search_results(self):
+        """Test that the best name matches come first across pages."""
+        for name in ["Beehive Labs", "Data Hive", "Hivemind", "Hive"]:
+            self.client().post('/api/organizations/',
+                               data={"name": name, "description": "An org"})
+
+        rv = self.client().get('/api/organizations/?name=hive&limit=2')
+        self.assertEqual(rv.status_code, 200)
+        names = [org['name'] for org in json.loads(rv.data.decode())]
+        self.assertEqual(names, ["Hive", "Hivemind"])
+
+        link = rv.headers['Link']
+        rv = self.client().get(link[link.index('<') + 1:link.index('>')])
+        names = [org['name'] for org in json.loads(rv.data.decode())]
+        self.assertEqual(names, ["Data Hive", "Beehive Labs"])
+        self.assertNotIn('Link', rv.headers)
+
+    def test_view_search_treats_wildcards_literally(self):
+        """Test that LIKE wildcards in a search term match themselves."""
+        for name in ["100% Youth", "Youth Works"]:
+            self.client().post('/api/organizations/',
+                               data={"name": name, "description": "An org"})
+        rv = self.client().get('/api/organizations/?name=%25')
+        names = [org['name'] for org in json.loads(rv.data.decode())]
+        self.assertEqual(names, ["100% Youth"])
+
+    def test_view_can_select_fields(self):
+        """Test that ?fields= narrows down the returned representation."""
+        res = self.client().post('/api/organizations/', data=self.org_data)
+        org_id = json.loads(res.data.decode())['id']
+
+        rv = self.client().get('/api/organizations/?fields=id,name')
+        self.assertEqual(json.loads(rv.data.decode()),
+                         [{"id": org_id, "name": "BHive"}])
+        rv = self.client().get(
+            '/api/organizations/{}?fields=name'.format(org_id))
+        self.assertEqual(json.loads(rv.data.decode()), {"name": "BHive"})
+
+        rv = self.client().get('/api/organizations/?fields=id,secret')
+        self.assertEqual(rv.status_code, 400)
+        self.assertIn("secret", str(rv.data))
+
+    def test_view_can_expand_an_organization(self):
+        """Test that ?expand= embeds the org's collections in few queries."""
+        self.client().post('/api/organizations/', data=self.org_data)
+        self.client().post('/api/organizations/1/programs/',
+                           data={"name": "Program", "organization_id": 1})
+        self.client().post('/api/organizations/1/programs/1/services/',
+                           data={"name": "Service", "organization_id": 1})
+        for name in ["Chicago", "Denver"]:
+            self.client().post('/api/organizations/1/locations/',
+                               data={"name": name, "organization_id": 1})
+            self.client().post(
+                '/api/organizations/1/locations/{}/addresses/'.format(
+                    2 if name == "Denver" else 1),
+                data={"address": "1 Main St", "city": name, "state": "IL",
+                      "postal_code": "60601", "country": "US"})
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            res = self.client().get('/api/organizations/1?expand=programs,'
+                                    'services,locations.addresses')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(res.status_code, 200)
+        org = json.loads(res.data.decode())
+        self.assertEqual([p['name'] for p in org['programs']], ["Program"])
+        self.assertEqual([s['name'] for s in org['services']], ["Service"])
+        cities = [[address['city'] for address in location['addresses']]
+                  for location in org['locations']]
+        self.assertEqual(cities, [["Chicago"], ["Denver"]])
+        # the ETag versions, the org and one query per expanded collection
+        self.assertEqual(len(statements), 6)
+
+        res = self.client().get('/api/organizations/?expand=locations')
+        orgs = json.loads(res.data.decode())
+        self.assertEqual(len(orgs[0]['locations']), 2)
+        self.assertNotIn('addresses', orgs[0]['locations'][0])
+
+        res = self.client().get('/api/organizations/1?expand=owners')
+        self.assertEqual(res.status_code, 400)
+
+    def test_view_can_bulk_create_organizations(self):
+        """Test that :bulk writes the valid items and reports the others."""
+        self.client().post('/api/organizations/', data=self.org_data)
+        items = [{"name": name, "description": "An org"}
+                 for name in ["Udacity", "BHive", None, "Coursera", "Udacity"]]
+        res = self.client().post('/api/organizations/:bulk',
+                                 data=json.dumps(items),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 207)
+        result = json.loads(res.data.decode())
+        self.assertEqual(result['count'], 2)
+        self.assertEqual([error['index'] for error in result['errors']],
+                         [1, 2, 4])
+
+        res = self.client().get('/api/organizations/')
+        names = [org['name'] for org in json.loads(res.data.decode())]
+        self.assertEqual(names, ["BHive", "Udacity", "Coursera"])
+
+        res = self.client().post('/api/organizations/:bulk',
+                                 data=json.dumps(self.org_data),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+
+    def test_view_can_bulk_upsert_organizations(self):
+        """Test that :bulk?upsert=true updates the orgs matched by name."""
+        self.client().post('/api/organizations/', data=self.org_data)
+        items = [{"name": "BHive", "description": "Updated"},
+                 {"name": "Udacity", "description": "An org"}]
+        res = self.client().post('/api/organizations/:bulk?upsert=true',
+                                 data=json.dumps(items),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(json.loads(res.data.decode())['count'], 2)
+
+        res = self.client().get('/api/organizations/1')
+        self.assertEqual(json.loads(res.data.decode())['description'],
+                         "Updated")
+        res = self.client().get('/api/organizations/')
+        self.assertEqual(len(json.loads(res.data.decode())), 2)
+
     def test_view_can_update_organization(self):
         """Test that view handle a PUT request to make a change on the org."""
         res = self.client().post('/api/organizations/', data=self.org_data)
@@ -229,6 +416,22 @@ class ProgramViewTestCase(BaseTestCase):
         self.assertEqual(results_length, 2)
         self.assertIn("Computer", str(rv.data))
 
+    def test_view_paginates_programs(self):
+        """Test that the program list honours the limit and after params."""
+        self.create_org()
+        for name in ["First", "Second", "Third"]:
+            self.client().post('/api/organizations/1/programs/',
+                               data={"name": name, "organization_id": 1})
+
+        res = self.client().get('/api/organizations/1/programs/?limit=1')
+        self.assertEqual(len(json.loads(res.data.decode())), 1)
+        link = res.headers['Link']
+        next_url = link[link.index('<') + 1:link.index('>')]
+        # the next link keeps the page size of the original request
+        res = self.client().get(next_url)
+        names = [prog['name'] for prog in json.loads(res.data.decode())]
+        self.assertEqual(names, ["Second"])
+
     def test_view_can_get_program_by_id(self):
         """Test that the view can handle a GET(single) program by id."""
         res = self.client().post('/api/organizations/', data=self.org_data)
@@ -306,6 +509,30 @@ class ProgramViewTestCase(BaseTestCase):
             '/api/organizations/100/programs/100')
         self.assertEqual(del_response.status_code, 404)
 
+    def test_bulk_upsert_keeps_programs_under_their_org(self):
+        """Test that an upsert never moves a program of another org."""
+        self.create_org()
+        self.client().post('/api/organizations/',
+                           data={"name": "Udacity", "description": "An org"})
+        self.client().post('/api/organizations/2/programs/',
+                           data={"name": "Theirs", "organization_id": 2})
+        items = [{"id": 1, "name": "Hijacked"}, {"name": "Ours"}]
+        res = self.client().post(
+            '/api/organizations/1/programs/:bulk?upsert=true',
+            data=json.dumps(items), content_type='application/json')
+        self.assertEqual(res.status_code, 207)
+        result = json.loads(res.data.decode())
+        self.assertEqual(result['count'], 1)
+        self.assertEqual(result['errors'], [
+            {"index": 0, "message": "id 1 belongs to another organization"}])
+
+        res = self.client().get('/api/organizations/2/programs/')
+        self.assertEqual([p['name'] for p in json.loads(res.data.decode())],
+                         ["Theirs"])
+        res = self.client().get('/api/organizations/1/programs/')
+        self.assertEqual([p['name'] for p in json.loads(res.data.decode())],
+                         ["Ours"])
+
 
 class ServiceViewTestCase(BaseTestCase):
     """This class represents the tests for the service method view."""
@@ -522,6 +749,41 @@ class ServiceViewTestCase(BaseTestCase):
             '/api/organizations/1/programs/1/services/1')
         self.assertEqual(response.status_code, 404)
 
+    def test_view_can_bulk_create_services(self):
+        """Test that :bulk under a program sets the parents of every item."""
+        self.create_org()
+        self.create_program()
+        items = [{"name": "Meals"}, {"name": "Rides", "organization_id": 7}]
+        res = self.client().post(
+            '/api/organizations/1/programs/1/services/:bulk',
+            data=json.dumps(items), content_type='application/json')
+        self.assertEqual(res.status_code, 201)
+        res = self.client().get('/api/organizations/1/programs/1/services/')
+        services = json.loads(res.data.decode())
+        self.assertEqual([s['name'] for s in services], ["Meals", "Rides"])
+
+        res = self.client().post(
+            '/api/organizations/1/programs/9/services/:bulk',
+            data=json.dumps(items), content_type='application/json')
+        self.assertEqual(res.status_code, 404)
+
+    def test_view_checks_the_service_program(self):
+        """Test that a service is not reachable through another program."""
+        self.create_org()
+        self.create_program()
+        self.create_program()
+        self.client().post(
+            '/api/organizations/1/programs/1/services/',
+            data=self.service_data)
+
+        res = self.client().get('/api/organizations/1/programs/2/services/1')
+        self.assertEqual(res.status_code, 404)
+        res = self.client().put('/api/organizations/1/programs/2/services/1',
+                                data={"name": "Moved"})
+        self.assertEqual(res.status_code, 404)
+        res = self.client().get('/api/organizations/1/programs/2/services/')
+        self.assertEqual(json.loads(res.data.decode()), [])
+
     def test_view_returns_404_for_nonexistent_orgs(self):
         """Test that the view returns a 404 if the program does not exist."""
         # test for a GET request
@@ -691,6 +953,45 @@ class PhysicalAddressViewTestCase(BaseTestCase):
         self.assertEqual(res.status_code, 200)
         self.assertIn("Chicago", str(res.data))
 
+    def test_view_checks_the_address_parents(self):
+        """Test that an address is only reachable through its own parents."""
+        self.create_org()
+        self.create_location()
+        self.client().post('/api/organizations/',
+                           data={"name": "Other", "description": "Org"})
+        self.client().post('/api/organizations/1/locations/1/addresses/',
+                           data=self.address_data)
+
+        res = self.client().get('/api/organizations/2/locations/1/addresses/1')
+        self.assertEqual(res.status_code, 404)
+        res = self.client().get('/api/organizations/1/locations/2/addresses/')
+        self.assertEqual(res.status_code, 404)
+        res = self.client().delete(
+            '/api/organizations/2/locations/1/addresses/1')
+        self.assertEqual(res.status_code, 404)
+
+    def test_view_resolves_an_address_in_one_query(self):
+        """Test that a GET by id validates the parent chain in one query."""
+        self.create_org()
+        self.create_location()
+        self.client().post('/api/organizations/1/locations/1/addresses/',
+                           data=self.address_data)
+
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            res = self.client().get(
+                '/api/organizations/1/locations/1/addresses/1')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(res.status_code, 200)
+        # the address, whose version the ETag is derived from
+        self.assertEqual(len(statements), 1)
+
     def test_view_can_update_a_physical_address(self):
         """Test view handles a PUT request to update a location's address."""
 
@@ -729,6 +1030,838 @@ class PhysicalAddressViewTestCase(BaseTestCase):
         self.assertEqual(response.status_code, 404)
 
 
+class ExportViewTestCase(BaseTestCase):
+    """This class represents the tests for the registry export."""
+
+    def setUp(self):
+        super().setUp()
+        self.client().post('/api/organizations/', data=self.org_data)
+        self.client().post('/api/organizations/1/locations/',
+                           data=self.location_data)
+        self.client().post('/api/organizations/1/locations/',
+                           data={"name": "Denver, CO", "organization_id": 1})
+
+    def test_view_can_export_a_table(self):
+        """Test that a table is streamed as json lines or csv."""
+        res = self.client().get('/api/export/locations')
+        self.assertEqual(res.status_code, 200)
+        lines = res.data.decode().splitlines()
+        self.assertEqual([json.loads(line)['name'] for line in lines],
+                         ["Chicago", "Denver, CO"])
+
+        res = self.client().get('/api/export/locations?format=csv')
+        self.assertEqual(res.status_code, 200)
+        lines = res.data.decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('id,'))
+        self.assertIn('"Denver, CO"', lines[2])
+
+        res = self.client().get('/api/export/locations?format=xml')
+        self.assertEqual(res.status_code, 400)
+        res = self.client().get('/api/export/users')
+        self.assertEqual(res.status_code, 404)
+
+    def test_export_writes_a_file_per_table(self):
+        """Test that the export dumps every table to its own file."""
+        directory = tempfile.mkdtemp()
+        try:
+            paths = export(directory, 'ndjson')
+            self.assertEqual(
+                [os.path.basename(path) for path in paths],
+                ['{}.ndjson'.format(table) for table in TABLES])
+            with open(os.path.join(directory, 'organizations.ndjson')) as f:
+                self.assertEqual(json.loads(f.read())['name'], "BHive")
+        finally:
+            shutil.rmtree(directory)
+
+
+class ImportTestCase(BaseTestCase):
+    """This class represents the tests for the registry import."""
+
+    def setUp(self):
+        super().setUp()
+        self.client().post('/api/organizations/', data=self.org_data)
+        self.client().post('/api/organizations/1/locations/',
+                           data={"name": "Chicago", "organization_id": 1})
+        self.client().post(
+            '/api/organizations/1/locations/1/addresses/',
+            data={"address": "1 Main St", "city": "Chicago", "state": "IL",
+                  "postal_code": "60601", "country": "US"})
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def test_import_loads_an_export(self):
+        """Test that an export loads back into an empty database."""
+        for fmt in ['ndjson', 'csv']:
+            export(self.directory, fmt)
+            db.session.remove()
+            db.drop_all()
+            db.create_all()
+
+            counts, errors = import_tables(self.directory, fmt)
+            self.assertEqual(errors, [])
+            self.assertEqual(counts['physical_addresses'], 1)
+            address = PhysicalAddress.query.one()
+            self.assertEqual(address.location.organization.name, "BHive")
+
+    def test_import_shifts_ids_past_existing_rows(self):
+        """Test that imported rows keep referencing their imported parents."""
+        export(self.directory, 'csv', ['locations', 'physical_addresses'])
+        counts, errors = import_tables(self.directory, 'csv')
+        self.assertEqual(errors, [])
+        self.assertEqual([l.id for l in Location.query], [1, 2])
+        addresses = PhysicalAddress.query.order_by(PhysicalAddress.id).all()
+        self.assertEqual([a.location_id for a in addresses], [1, 2])
+        # locations reference the org already stored
+        self.assertEqual(Location.query.get(2).organization_id, 1)
+
+    def test_import_validates_before_writing(self):
+        """Test that invalid files are reported and nothing is written."""
+        export(self.directory, 'ndjson')
+        with open(os.path.join(self.directory, 'locations.ndjson'), 'a') as f:
+            f.write(json.dumps({"id": 5, "organization_id": 9}) + '\n')
+            f.write(json.dumps({"id": 6, "name": "Oops", "alias": "x"}))
+
+        counts, errors = import_tables(self.directory, 'ndjson')
+        self.assertEqual(len(errors), 4)
+        self.assertIn("locations line 3: unknown columns alias", errors)
+        self.assertIn("organizations: 1 rows whose name already exists (1)",
+                      errors)
+        self.assertIn("locations: 1 rows without a name (5)", errors)
+        self.assertIn("locations: 1 rows referencing a missing organization "
+                      "(5)", errors)
+        self.assertEqual(Organization.query.count(), 1)
+        self.assertEqual(Location.query.count(), 1)
+
+        counts, errors = import_tables(self.directory, 'ndjson',
+                                       ['locations'], dry_run=True)
+        self.assertEqual(counts, {'locations': 2})
+        self.assertEqual(Location.query.count(), 1)
+
+
+class CacheTestCase(BaseTestCase):
+    """This class represents the tests for the response cache."""
+
+    def setUp(self):
+        super().setUp()
+        for name in ["BHive", "Udacity"]:
+            self.client().post('/api/organizations/',
+                               data={"name": name, "description": "An org"})
+
+    def get(self, url):
+        res = self.client().get(url)
+        self.assertEqual(res.status_code, 200)
+        return res.headers['X-Cache'], json.loads(res.data.decode())
+
+    def test_cache_serves_repeated_gets(self):
+        """Test that a repeated GET is a hit, whatever the args order."""
+        self.assertEqual(self.get('/api/organizations/1?fields=id,name')[0],
+                         "MISS")
+        cached, org = self.get('/api/organizations/1?fields=name,id')
+        self.assertEqual(cached, "MISS")
+        cached, org = self.get('/api/organizations/1?fields=name,id')
+        self.assertEqual((cached, org['name']), ("HIT", "BHive"))
+
+        res = self.client().get('/api/cache')
+        stats = json.loads(res.data.decode())
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_cache_invalidates_the_affected_entries(self):
+        """Test that a write drops its entries and its parents' ones."""
+        urls = ['/api/organizations/', '/api/organizations/1',
+                '/api/organizations/1?expand=programs',
+                '/api/organizations/1/programs/',
+                '/api/organizations/2', '/api/organizations/2/programs/']
+        for url in urls:
+            self.get(url)
+
+        self.client().post('/api/organizations/1/programs/',
+                           data={"name": "Program", "organization_id": 1})
+        state = {url: self.get(url)[0] for url in urls}
+        self.assertEqual(state, {
+            '/api/organizations/': "HIT",
+            '/api/organizations/1': "HIT",
+            '/api/organizations/1?expand=programs': "MISS",
+            '/api/organizations/1/programs/': "MISS",
+            '/api/organizations/2': "HIT",
+            '/api/organizations/2/programs/': "HIT",
+        })
+
+        self.client().put('/api/organizations/1', data={"name": "BrightHive"})
+        self.assertEqual(self.get('/api/organizations/')[0], "MISS")
+        self.assertEqual(self.get('/api/organizations/1/programs/1')[0],
+                         "MISS")
+        self.client().delete('/api/organizations/1')
+        res = self.client().get('/api/organizations/1/programs/1')
+        self.assertEqual(res.status_code, 404)
+
+    def test_session_deletes_invalidate_the_cascaded_rows(self):
+        """Test that the rows the database deletes are not served again."""
+        self.client().post('/api/organizations/1/programs/',
+                           data={"name": "Program", "organization_id": 1})
+        db.session.add(Service("Meals", 1, program_id=1))
+        db.session.commit()
+        for _ in range(2):
+            cached = self.get('/api/organizations/1/services/1')[0]
+        self.assertEqual(cached, "HIT")
+
+        db.session.delete(Program.query.get(1))
+        db.session.commit()
+        res = self.client().get('/api/organizations/1/services/1')
+        self.assertEqual(res.status_code, 404)
+
+    def test_deletes_invalidate_the_cascaded_rows(self):
+        """Test that the rows deleted by cascade are not served again."""
+        self.client().post('/api/organizations/1/programs/',
+                           data={"name": "Program", "organization_id": 1})
+        db.session.add(Service("Meals", 1, program_id=1))
+        db.session.commit()
+        for _ in range(2):
+            cached = self.get('/api/organizations/1/services/1')[0]
+        self.assertEqual(cached, "HIT")
+
+        expanded = '/api/organizations/1?expand=services'
+        etag = self.client().get(expanded).headers['ETag']
+
+        res = self.client().delete('/api/organizations/1/programs/1')
+        self.assertEqual(res.status_code, 202)
+        res = self.client().get('/api/organizations/1/services/1')
+        self.assertEqual(res.status_code, 404)
+        # services of the organization, which the cascade went around
+        self.app.extensions['cache'].clear()
+        res = self.client().get(expanded, headers={'If-None-Match': etag})
+        self.assertEqual((res.status_code, res.get_json()['services']),
+                         (200, []))
+
+
+class ConditionalGetTestCase(BaseTestCase):
+    """This class represents the tests for the ETags of the responses."""
+
+    def setUp(self):
+        super().setUp()
+        self.client().post('/api/organizations/', data=self.org_data)
+        self.client().post('/api/organizations/1/programs/',
+                           data={"name": "Program", "organization_id": 1})
+
+    def test_view_answers_304_for_a_matching_etag(self):
+        """Test that If-None-Match gets a 304 until the data changes."""
+        url = '/api/organizations/1/programs/'
+        res = self.client().get(url)
+        etag = res.headers['ETag']
+        self.assertEqual(res.status_code, 200)
+
+        # whether served from the cache or not
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual((res.status_code, res.data), (304, b''))
+        self.app.extensions['cache'].clear()
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual((res.status_code, res.headers['ETag']), (304, etag))
+
+        self.client().put('/api/organizations/1/programs/1',
+                          data={"name": "Renamed"})
+        res = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertIn("Renamed", str(res.data))
+
+    def test_etags_follow_row_and_collection_versions(self):
+        """Test that an ETag only changes with the data it depends on."""
+        def etag(url):
+            return self.client().get(url).headers['ETag']
+
+        org = etag('/api/organizations/1')
+        program = etag('/api/organizations/1/programs/1')
+        expanded = etag('/api/organizations/1?expand=programs')
+        self.assertNotEqual(etag('/api/organizations/1?fields=id'), org)
+
+        self.client().post('/api/organizations/1/programs/',
+                           data={"name": "Another", "organization_id": 1})
+        self.assertEqual(etag('/api/organizations/1'), org)
+        self.assertEqual(etag('/api/organizations/1/programs/1'), program)
+        self.assertNotEqual(etag('/api/organizations/1?expand=programs'),
+                            expanded)
+
+        self.client().put('/api/organizations/1', data={"url": "bhive.org"})
+        self.assertNotEqual(etag('/api/organizations/1'), org)
+        # the program does not show its organization
+        self.assertEqual(etag('/api/organizations/1/programs/1'), program)
+        self.client().put('/api/organizations/1/programs/1',
+                          data={"name": "Renamed"})
+        self.assertNotEqual(etag('/api/organizations/1/programs/1'), program)
+        # one counter per collection, whatever its size
+        self.assertEqual(CollectionVersion.query.get(
+            'program@organization:1').version, 3)
+        self.assertEqual(self.client().get(
+            '/api/organizations/1').get_json()['version'], 2)
+
+        # deletes bypass the session, their counters are bumped all the same
+        expanded = etag('/api/organizations/1?expand=programs')
+        self.client().delete('/api/organizations/1/programs/2')
+        self.assertNotEqual(etag('/api/organizations/1?expand=programs'),
+                            expanded)
+
+
+class ChangeFeedTestCase(BaseTestCase):
+    """This class represents the tests for the change feed."""
+
+    def setUp(self):
+        super().setUp()
+        self.client().post('/api/organizations/', data=self.org_data)
+        for name in ("First", "Second"):
+            self.client().post('/api/organizations/1/programs/',
+                               data={"name": name, "organization_id": 1})
+
+    def feed(self, url):
+        res = self.client().get(url)
+        self.assertEqual(res.status_code, 200)
+        link = res.headers.get('Link')
+        if link is not None:
+            link = link[1:link.index('>')]
+        return res.get_json(), link
+
+    def test_feed_resumes_from_its_cursor(self):
+        """Test that a poll only returns what changed since the last one."""
+        changes, link = self.feed('/api/changes/programs')
+        self.assertEqual([(c['id'], c['deleted'], c['data']['name'])
+                          for c in changes],
+                         [(1, False, "First"), (2, False, "Second")])
+        changes, resume = self.feed(link)
+        self.assertEqual((changes, resume), ([], None))
+
+        self.client().put('/api/organizations/1/programs/1',
+                          data={"name": "Renamed"})
+        self.client().delete('/api/organizations/1/programs/2')
+        changes, link = self.feed(link)
+        self.assertEqual([(c['id'], c['deleted'], c['data'])
+                          for c in changes][1:], [(2, True, None)])
+        self.assertEqual(changes[0]['data']['name'], "Renamed")
+        self.assertEqual(changes[0]['data']['version'], 2)
+        self.assertEqual(self.feed(link)[0], [])
+
+    def test_feed_holds_the_latest_changes_back(self):
+        """Test that changes younger than CHANGES_DELAY wait a poll."""
+        self.app.config['CHANGES_DELAY'] = 60
+        self.assertEqual(self.feed('/api/changes/programs'), ([], None))
+        self.assertEqual(self.feed(
+            '/api/changes/programs?updated_since=2000-01-01T00:00:00')[0],
+            [])
+        self.app.config['CHANGES_DELAY'] = 0
+        self.assertEqual(len(self.feed('/api/changes/programs')[0]), 2)
+
+    def test_feed_filters_on_updated_since(self):
+        """Test the updated_since filter, its errors and unknown tables."""
+        self.assertEqual(len(self.feed(
+            '/api/changes/programs?limit=1')[0]), 1)
+        self.assertEqual(self.feed(
+            '/api/changes/organizations?updated_since=2999-01-01')[0], [])
+        changes, link = self.feed(
+            '/api/changes/organizations?updated_since=2000-01-01')
+        self.assertIn('updated_since=2000-01-01', link)
+        self.assertEqual([c['id'] for c in changes], [1])
+        self.assertEqual(self.client().get(
+            '/api/changes/organizations?updated_since=yesterday'
+        ).status_code, 400)
+        self.assertEqual(self.client().get(
+            '/api/changes/organizations?after=nope').status_code, 400)
+        self.assertEqual(self.client().get(
+            '/api/changes/unknown').status_code, 404)
+
+    def test_organization_deletes_cascade_in_the_database(self):
+        """Test that deleting an org removes and tombstones its hierarchy."""
+        db.session.add(Service("Meals", 1, program_id=1))
+        db.session.add(Location("Home", 1))
+        db.session.commit()
+        db.session.add(PhysicalAddress(location_id=1, address="1 Main St",
+                                       city="Chicago", state="Illinois",
+                                       postal_code="60621", country="US"))
+        service_location = ServiceLocation(service_id=1, location_id=1)
+        service_location.description = "Main"
+        db.session.add(service_location)
+        db.session.commit()
+        db.session.remove()
+        self.client().get('/api/organizations/1/locations/')
+
+        res = self.client().delete('/api/organizations/1')
+        self.assertEqual(res.status_code, 202)
+        tombstones = db.session.query(Tombstone.table_name, Tombstone.row_id)
+        # the service is reached through its program and its org, once
+        self.assertEqual(sorted(tombstones), [
+            ('location', 1), ('organization', 1), ('physical_address', 1),
+            ('program', 1), ('program', 2), ('service', 1),
+            ('service_location', 1)])
+        for model in (Program, Service, Location, PhysicalAddress,
+                      ServiceLocation):
+            self.assertEqual(model.query.count(), 0)
+        self.assertEqual(self.client().get(
+            '/api/organizations/1/locations/').status_code, 404)
+
+
+class NearbyViewTestCase(BaseTestCase):
+    """This class represents the tests for the distance searches."""
+
+    def setUp(self):
+        super().setUp()
+        self.client().post('/api/organizations/', data=self.org_data)
+        points = [("Chicago", 41.8781, -87.6298),
+                  ("Evanston", 42.0451, -87.6877),
+                  ("New York", 40.7128, -74.0060),
+                  ("Fiji", -17.7134, 178.0650),
+                  ("Nowhere", None, None)]
+        for name, lat, lon in points:
+            db.session.add(Location(name, 1, latitude=lat, longitude=lon))
+        db.session.add(Service("Meals", 1))
+        db.session.commit()
+        service_location = ServiceLocation(service_id=1, location_id=2)
+        service_location.description = "Lunch"
+        db.session.add(service_location)
+        db.session.commit()
+
+    def near(self, query):
+        res = self.client().get('/api/locations/near?' + query)
+        self.assertEqual(res.status_code, 200)
+        return [(item['location']['name'], round(item['distance']))
+                for item in res.get_json()]
+
+    def test_nearest_locations_come_with_their_services(self):
+        """Test the k nearest search and the services of the locations."""
+        self.assertEqual(self.near('lat=41.88&lon=-87.63&limit=3'), [
+            ("Chicago", 0), ("Evanston", 19), ("New York", 1144)])
+        res = self.client().get('/api/locations/near?lat=42&lon=-87.7')
+        services = {item['location']['name']: item['services']
+                    for item in res.get_json()}
+        self.assertEqual([s['name'] for s in services['Evanston']],
+                         ["Meals"])
+        self.assertEqual(services['Chicago'], [])
+        self.assertNotIn("Nowhere", services)
+
+    def test_radius_search_follows_writes(self):
+        """Test the radius search across the antimeridian and after writes."""
+        self.assertEqual(self.near('lat=41.88&lon=-87.63&radius=50'),
+                         [("Chicago", 0), ("Evanston", 19)])
+        self.assertEqual(self.near('lat=-17.7&lon=-179.9&radius=300'),
+                         [("Fiji", 216)])
+        self.client().put('/api/organizations/1/locations/1',
+                          data={"latitude": 40.73, "longitude": -74.0})
+        self.assertEqual(self.near('lat=41.88&lon=-87.63&radius=50'),
+                         [("Evanston", 19)])
+        self.client().delete('/api/organizations/1/locations/2')
+        self.assertEqual(self.near('lat=41.88&lon=-87.63&radius=50'), [])
+        self.assertEqual(self.near('lat=40.71&lon=-74.0&radius=5'),
+                         [("New York", 1), ("Chicago", 2)])
+
+        for query in ('lat=91&lon=0', 'lon=0', 'lat=1&lon=x',
+                      'lat=1&lon=1&radius=-1'):
+            res = self.client().get('/api/locations/near?' + query)
+            self.assertEqual(res.status_code, 400)
+        res = self.client().post('/api/organizations/1/locations/',
+                                 data={"name": "Bad", "latitude": "N41"})
+        self.assertEqual(res.status_code, 400)
+
+
+class EngineOptionsTestCase(BaseTestCase):
+    """This class represents the tests for the connection pool settings."""
+
+    def test_pool_settings_apply_to_postgres_only(self):
+        """Test that the pool settings reach the engine but for sqlite."""
+        options = {}
+        db.apply_pool_defaults(self.app, options)
+        postgres = options.copy()
+        db.apply_driver_hacks(self.app, make_url(
+            'postgresql://localhost/registry'), postgres)
+        self.assertEqual((postgres['pool_size'], postgres['max_overflow'],
+                          postgres['pool_pre_ping']), (10, 10, True))
+        sqlite = options.copy()
+        db.apply_driver_hacks(self.app, make_url('sqlite:///registry.db'),
+                              sqlite)
+        self.assertNotIn('pool_size', sqlite)
+        self.assertEqual(sqlite['poolclass'].__name__, 'NullPool')
+
+
+class InstrumentationTestCase(BaseTestCase):
+    """This class represents the tests for the request instrumentation."""
+
+    def test_responses_report_their_timings(self):
+        """Test the Server-Timing header and the endpoint histograms."""
+        self.client().post('/api/organizations/', data=self.org_data)
+        res = self.client().get('/api/organizations/1')
+        timing = res.headers['Server-Timing']
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ statements", '
+                                 r'serialize;dur=[\d.]+, '
+                                 r'compress;dur=[\d.]+, app;dur=[\d.]+$')
+
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        body = res.get_data(as_text=True)
+        self.assertIn('# TYPE registry_endpoint_seconds histogram', body)
+        self.assertRegex(body, r'registry_endpoint_statements_count'
+                               r'\{endpoint="organization.organization_view"'
+                               r'\} \d+')
+
+    def test_repeated_statements_are_flagged(self):
+        """Test that a statement run N_PLUS_ONE_THRESHOLD times is logged."""
+        self.app.config['N_PLUS_ONE_THRESHOLD'] = 3
+        with self.app.test_request_context('/api/organizations/1'):
+            self.app.preprocess_request()
+            for pk in range(3):
+                db.session.execute(Organization.select().where(
+                    Organization.id == pk))
+            with self.assertLogs(self.app.logger, 'WARNING') as logs:
+                response = self.app.process_response(self.app.response_class())
+        self.assertIn('ran 3 times: SELECT', logs.output[0])
+        self.assertIn('desc="3 statements"', response.headers['Server-Timing'])
+
+
+class ValidationTestCase(BaseTestCase):
+    """This class represents the tests for the validation of the bodies."""
+
+    def test_bodies_read_back_can_be_put(self):
+        """Test that the read-only fields of a GET body are dropped."""
+        self.client().post('/api/organizations/', data=self.org_data)
+        body = self.client().get('/api/organizations/1').get_json()
+        body['description'] = "Edited"
+        res = self.client().put('/api/organizations/1',
+                                data=json.dumps(body),
+                                content_type='application/json')
+        self.assertEqual(res.status_code, 200)
+        org = self.client().get('/api/organizations/1').get_json()
+        self.assertEqual((org['description'], org['version']), ("Edited", 2))
+
+    def test_invalid_bodies_are_rejected_before_any_query(self):
+        """Test that invalid bodies are answered with a 400, unqueried."""
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            res = self.client().post(
+                '/api/organizations/1/locations/',
+                data=json.dumps({"name": "Chicago", "latitude": 100,
+                                 "version": 3, "alias": "x"}),
+                content_type='application/json')
+            self.assertEqual(res.status_code, 400)
+            message = json.loads(res.data.decode())['message']
+            self.assertIn("Unknown fields: alias", message)
+            self.assertNotIn("version", message)
+            self.assertIn("Invalid latitude: expected a number from -90 to 90",
+                          message)
+
+            res = self.client().post('/api/organizations/',
+                                     data={"description": "No name"})
+            self.assertEqual(res.status_code, 400)
+            self.assertIn("Missing fields: name", str(res.data))
+
+            res = self.client().put('/api/organizations/1/programs/1',
+                                    data=json.dumps({"name": 7}),
+                                    content_type='application/json')
+            self.assertEqual(res.status_code, 400)
+            self.assertIn("Invalid name: expected a string", str(res.data))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count)
+        self.assertEqual(statements, [])
+
+    def test_valid_bodies_reach_the_views(self):
+        """Test that forms, partial updates and url ids are accepted."""
+        self.client().post('/api/organizations/', data=self.org_data)
+        # the organization id comes from the url, the coordinates are strings
+        res = self.client().post('/api/organizations/1/locations/',
+                                 data={"name": "Chicago", "latitude": "41.8",
+                                       "longitude": ""})
+        self.assertEqual(res.status_code, 201)
+        res = self.client().put('/api/organizations/1/locations/1',
+                                data=json.dumps({"latitude": 42}),
+                                content_type='application/json')
+        self.assertEqual(res.status_code, 200)
+        res = self.client().post('/api/organizations/1/locations/1/addresses/',
+                                 data={"address": "1 Main St",
+                                       "city": "Chicago", "state": "IL",
+                                       "postal_code": "60601",
+                                       "country": "USA"})
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("Invalid country: expected a string of 2 characters",
+                      str(res.data))
+
+    def test_bulk_items_are_validated(self):
+        """Test that the items of a bulk request are checked the same way."""
+        items = [{"name": "BHive", "description": "An org"},
+                 {"name": "x" * 101, "description": "An org"}]
+        res = self.client().post('/api/organizations/:bulk',
+                                 data=json.dumps(items),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 207)
+        errors = json.loads(res.data.decode())['errors']
+        self.assertEqual(errors, [{
+            "index": 1,
+            "message": "Invalid name: expected a string of at most 100 "
+                       "characters"}])
+
+
+class PayloadTestCase(BaseTestCase):
+    """This class represents the tests for the decoding of the bodies."""
+
+    def test_bodies_without_content_type_are_read_as_json(self):
+        """Test that a body without Content-Type is decoded as json."""
+        res = self.client().post('/api/organizations/',
+                                 data=json.dumps(self.org_data),
+                                 content_type='')
+        self.assertEqual(res.status_code, 201)
+        res = self.client().put('/api/organizations/1',
+                                data=json.dumps({"url": "bhive.org"}))
+        self.assertEqual(res.status_code, 200)
+
+    def test_unreadable_bodies_are_rejected(self):
+        """Test the malformed, oversized and unsupported bodies."""
+        res = self.client().post('/api/organizations/', data='{"name": ',
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("Invalid json", str(res.data))
+
+        res = self.client().post('/api/organizations/', data='<org/>',
+                                 content_type='application/xml')
+        self.assertEqual(res.status_code, 415)
+
+        self.app.config['MAX_CONTENT_LENGTH'] = 64
+        items = [self.org_data] * 10
+        res = self.client().post('/api/organizations/:bulk',
+                                 data=json.dumps(items),
+                                 content_type='application/json')
+        self.assertEqual(res.status_code, 413)
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_bodies_can_be_msgpack(self):
+        """Test that the single and bulk bodies can be sent as msgpack."""
+        res = self.client().post('/api/organizations/',
+                                 data=msgpack.packb(self.org_data),
+                                 content_type='application/msgpack')
+        self.assertEqual(res.status_code, 201)
+        items = [{"name": "Udacity", "description": "An org"}]
+        res = self.client().post('/api/organizations/:bulk',
+                                 data=msgpack.packb(items),
+                                 content_type='application/msgpack')
+        self.assertEqual(res.status_code, 201)
+
+
+class EncodingTestCase(BaseTestCase):
+    """This class represents the tests for the json backends."""
+
+    def test_backends_encode_dates_in_iso_8601(self):
+        """Test that every installed backend writes RFC 3339 dates."""
+        value = {"year_incorporated": datetime(2015, 6, 1, 12, 30),
+                 "created_at": datetime(2015, 6, 1, 12, 30, 5, 250),
+                 "opened": date(2015, 6, 1), "fees": Decimal('12.50'),
+                 "changed_at": datetime(2015, 6, 1, 1, 30,
+                                        tzinfo=timezone.utc),
+                 "updated_at": datetime(2015, 6, 1, 1, 30, tzinfo=timezone(
+                     timedelta(hours=2)))}
+        expected = {"year_incorporated": "2015-06-01T12:30:00Z",
+                    "created_at": "2015-06-01T12:30:05.000250Z",
+                    "opened": "2015-06-01", "fees": 12.5,
+                    "changed_at": "2015-06-01T01:30:00Z",
+                    "updated_at": "2015-06-01T01:30:00+02:00"}
+        for cls in encoding.BACKENDS.values():
+            if cls.installed:
+                for pretty in (False, True):
+                    self.assertEqual(
+                        json.loads(cls(pretty=pretty).encode(value)),
+                        expected, cls.name)
+
+        # what the api sends is what it reads back
+        self.assertEqual(parse_isoformat(expected["created_at"]),
+                         value["created_at"])
+
+        self.app.config['JSON_BACKEND'] = 'yaml'
+        with self.assertRaises(ValueError):
+            encoding.init_app(self.app)
+
+    def test_lists_can_be_json_lines(self):
+        """Test the application/x-ndjson lists, paged and streamed."""
+        for name in ["BHive", "Udacity", "Andela"]:
+            self.client().post('/api/organizations/',
+                               data={"name": name, "description": "An org"})
+        headers = {'Accept': 'application/x-ndjson'}
+        for path in ('/api/organizations/?limit=2',
+                     '/api/organizations/?stream=true'):
+            res = self.client().get(path, headers=headers)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.mimetype, 'application/x-ndjson')
+            lines = res.get_data(as_text=True).splitlines()
+            self.assertEqual(json.loads(lines[0])['name'], "BHive")
+            self.assertEqual(len(lines), 2 if 'limit' in path else 3)
+
+        # the cached json array is not served to them, nor the other way
+        res = self.client().get('/api/organizations/?limit=2')
+        self.assertEqual(res.mimetype, 'application/json')
+        self.assertEqual(len(json.loads(res.data.decode())), 2)
+        self.assertIn('Accept', res.headers['Vary'])
+
+
+class CompressionTestCase(BaseTestCase):
+    """This class represents the tests for the response compression."""
+
+    def setUp(self):
+        super().setUp()
+        for index in range(30):
+            self.client().post('/api/organizations/', data={
+                "name": "Org {}".format(index),
+                "description": "An org sharing data for social good"})
+        self.url = '/api/organizations/?limit=30'
+        self.plain = self.client().get(self.url).data
+
+    def test_large_responses_are_gzipped(self):
+        """Test that only the responses over the threshold are gzipped."""
+        res = self.client().get(self.url,
+                                headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', res.headers['Vary'])
+        self.assertEqual(gzip.decompress(res.data), self.plain)
+        self.assertLess(len(res.data), len(self.plain))
+
+        res = self.client().get('/api/organizations/1',
+                                headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', res.headers)
+        res = self.client().get(self.url, headers={
+            'Accept-Encoding': 'gzip;q=0, identity'})
+        self.assertEqual(res.data, self.plain)
+
+    @unittest.skipIf(brotli is None, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        """Test that brotli wins when the client accepts both."""
+        res = self.client().get(self.url,
+                                headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(res.data), self.plain)
+
+    def test_streams_are_compressed_as_they_go(self):
+        """Test that a streamed list is gzipped whatever its size."""
+        url = '/api/organizations/?stream=true'
+        res = self.client().get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', res.headers)
+        self.assertEqual(gzip.decompress(res.data),
+                         self.client().get(url).data)
+
+    def test_cache_keeps_the_compressed_body(self):
+        """Test that hits are served as compressed when stored."""
+        headers = {'Accept-Encoding': 'gzip'}
+        miss = self.client().get(self.url, headers=headers)
+        hit = self.client().get(self.url, headers=headers)
+        self.assertEqual(hit.headers['X-Cache'], 'HIT')
+        self.assertEqual((hit.headers['Content-Encoding'], hit.data),
+                         ('gzip', miss.data))
+        self.assertEqual(gzip.decompress(hit.data), self.plain)
+
+        # compressed bodies carry weak ETags, still matched for a 304
+        etag = hit.headers['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        res = self.client().get(self.url, headers=dict(
+            headers, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 304)
+
+
+class MetricsTestCase(BaseTestCase):
+    """This class represents the tests for the request metrics."""
+
+    def test_requests_are_counted(self):
+        """Test the request counts, latencies, sizes and in flight gauge."""
+        # observed once the whole body has been sent
+        self.client().post('/api/organizations/',
+                           data=self.org_data).get_data()
+        in_flight = metrics.IN_FLIGHT._values.get((), 0)
+        self.client().get('/api/organizations/1').get_data()
+        self.assertEqual(metrics.IN_FLIGHT._values[()], in_flight)
+
+        body = self.client().get('/metrics').get_data(as_text=True)
+        self.assertRegex(body, r'registry_http_requests_total\{blueprint='
+                               r'"organization",method="GET",status="200"\} '
+                               r'\d+')
+        self.assertRegex(body, r'registry_endpoint_seconds_count\{'
+                               r'blueprint="organization",method="POST",'
+                               r'endpoint="organization.organization_view"'
+                               r'\} \d+')
+        self.assertNotIn('registry_http_request_duration_seconds', body)
+        # the metrics are kept for the whole process
+        self.assertRegex(body, r'registry_http_response_size_bytes_sum'
+                               r'\{blueprint="organization",method="GET"\} '
+                               r'[1-9]\d*')
+        # the /metrics request itself
+        self.assertIn('registry_http_requests_in_flight {}\n'.format(
+            in_flight + 1), body)
+
+    def test_workers_metrics_are_added_up(self):
+        """Test that /metrics adds up the snapshots of every worker."""
+        registry = metrics.Registry(tempfile.mkdtemp())
+        try:
+            requests = metrics.Counter('requests', 'Requests', ['method'],
+                                       registry=registry)
+            seconds = metrics.Histogram('seconds', 'Seconds', ['method'],
+                                        buckets=(1,), registry=registry)
+            in_flight = metrics.Gauge('in_flight', 'In flight',
+                                      registry=registry)
+            requests.inc(('GET',), 2)
+            seconds.observe(('GET',), 0.5)
+            in_flight.inc()
+            # a worker which exited, and one still running
+            for pid in (2 ** 22 + 1, os.getppid()):
+                with open(os.path.join(registry.directory,
+                                       '{}.json'.format(pid)), 'w') as f:
+                    json.dump(registry.snapshot(), f)
+
+            body = registry.render()
+            self.assertIn('requests{method="GET"} 6\n', body)
+            self.assertIn('seconds_bucket{method="GET",le="1"} 3\n', body)
+            self.assertIn('seconds_sum{method="GET"} 1.5\n', body)
+            # the gauges of the workers gone are left out
+            self.assertIn('in_flight 2\n', body)
+        finally:
+            shutil.rmtree(registry.directory)
+
+    def test_server_errors_are_logged(self):
+        """Test that the errors the views answer with are logged."""
+        with self.app.test_request_context('/api/organizations/1'):
+            response = self.app.response_class(
+                '{"message": "database is locked"}', status=500,
+                mimetype='application/json')
+            with self.assertLogs(self.app.logger, 'ERROR') as logs:
+                self.app.process_response(response)
+        self.assertIn('GET /api/organizations/1 failed with 500: '
+                      'database is locked', logs.output[0])
+
+
+class StartupTestCase(unittest.TestCase):
+    """This class represents the tests for the startup path."""
+
+    def test_spec_is_cached_per_version(self):
+        """Test that the parsed spec is read back until the yaml changes."""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'swagger.yaml')
+            shutil.copy(SPEC_PATH, path)
+            spec = load_spec(path)
+            self.assertEqual(spec['basePath'], '/api')
+            self.assertEqual(load_spec(path), spec)
+            cache = os.path.join(directory, '__pycache__')
+            self.assertEqual(len(os.listdir(cache)), 1)
+
+            with open(path, 'a') as f:
+                f.write('\nx-cached: false\n')
+            self.assertFalse(load_spec(path)['x-cached'])
+            self.assertEqual(len(os.listdir(cache)), 2)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_commands_can_skip_the_views(self):
+        """Test that an app created without blueprints has no API route."""
+        app = create_app('testing', blueprints=())
+        rules = [rule.rule for rule in app.url_map.iter_rules()]
+        self.assertNotIn('/api/organizations/', rules)
+        self.assertIn('/metrics', rules)
+
+
 if __name__ == '__main__':
     # make the tests conveniently executable
     unittest.main()